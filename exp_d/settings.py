@@ -12,6 +12,9 @@ https://docs.djangoproject.com/en/5.0/ref/settings/
 import os
 from pathlib import Path
 
+from celery.schedules import crontab
+from django.core.exceptions import ImproperlyConfigured
+
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -106,11 +109,76 @@ WSGI_APPLICATION = "exp_d.wsgi.application"
 
 DATABASE_DIR = BASE_DIR / "data"
 
-DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": DATABASE_DIR / "db.sqlite3",
+# DB_PROFILE selects the database: "sqlite" (default), a file in data/ tuned for concurrent
+# readers next to one writer, or "postgres" for running several containers against one database.
+DB_PROFILE = os.environ.get("DB_PROFILE", "sqlite")
+
+if DB_PROFILE == "postgres":
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.postgresql",
+            "NAME": os.environ.get("POSTGRES_DB", "expenses"),
+            "USER": os.environ.get("POSTGRES_USER", "expenses"),
+            "PASSWORD": os.environ.get("POSTGRES_PASSWORD", ""),
+            "HOST": os.environ.get("POSTGRES_HOST", "postgres"),
+            "PORT": os.environ.get("POSTGRES_PORT", "5432"),
+            # Persistent connections: every gunicorn and Celery worker reuses its connection across
+            # requests and tasks instead of connecting each time; broken ones are replaced.
+            "CONN_MAX_AGE": int(os.environ.get("CONN_MAX_AGE", 600)),
+            "CONN_HEALTH_CHECKS": True,
+        }
+    }
+elif DB_PROFILE == "sqlite":
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": DATABASE_DIR / "db.sqlite3",
+            # Parallel importers and workers wait for SQLite's write lock instead of failing at once.
+            "OPTIONS": {"timeout": 30},
+        }
+    }
+else:
+    raise ImproperlyConfigured(f"Unknown DB_PROFILE {DB_PROFILE}, expected sqlite or postgres")
+
+# Optional read-only "analytics" alias for dashboards, reports, exports and admin lists
+# (expenses_monitoring.routers): a streaming replica at POSTGRES_REPLICA_HOST, or with
+# SQLITE_READ_ONLY_ANALYTICS=1 a second, read-only connection to the WAL-mode SQLite file.
+if DB_PROFILE == "postgres" and os.environ.get("POSTGRES_REPLICA_HOST"):
+    DATABASES["analytics"] = {
+        **DATABASES["default"],
+        "HOST": os.environ["POSTGRES_REPLICA_HOST"],
+        "PORT": os.environ.get("POSTGRES_REPLICA_PORT", DATABASES["default"]["PORT"]),
+    }
+elif DB_PROFILE == "sqlite" and os.environ.get("SQLITE_READ_ONLY_ANALYTICS") == "1":
+    DATABASES["analytics"] = {
+        **DATABASES["default"],
+        "NAME": f"file:{DATABASE_DIR / 'db.sqlite3'}?mode=ro",
+        "OPTIONS": {**DATABASES["default"]["OPTIONS"], "uri": True},
     }
+if "analytics" in DATABASES:
+    # The test database is created once, for the primary; the analytics alias reads from it.
+    DATABASES["analytics"]["TEST"] = {"MIRROR": "default"}
+ANALYTICS_DATABASE = "analytics" if "analytics" in DATABASES else "default"
+DATABASE_ROUTERS = ["expenses_monitoring.routers.PrimaryReplicaRouter"]
+# Seconds after a write during which a user's analytics are read from the primary, covering replica lag.
+DATABASE_REPLICA_LAG = int(os.environ.get("DATABASE_REPLICA_LAG", 10))
+
+# Applied to every new SQLite connection (expenses_monitoring.db). WAL lets readers run alongside the
+# writer; NORMAL sync is durable in WAL mode except on power loss; cache_size is in KiB when negative.
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": 30000,
+    "cache_size": -64000,
+    "mmap_size": 256 * 1024 * 1024,
+    "temp_store": "MEMORY",
+}
+# Read-only SQLite connections (mode=ro in NAME, such as the analytics alias) cannot change the journal
+# mode or the file's sync setting and only get the read-side pragmas.
+SQLITE_READ_ONLY_PRAGMAS = {
+    "query_only": "ON",
+    "cache_size": SQLITE_PRAGMAS["cache_size"],
+    "mmap_size": SQLITE_PRAGMAS["mmap_size"],
 }
 
 
@@ -159,10 +227,122 @@ STATIC_ROOT = os.path.join(BASE_DIR, "/staticfiles/")
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 AUTH_USER_MODEL = "expenses_monitoring.CustomUser"
-# CELERY_BROKER_URL = 'redis://redis:6379/0'  # Указывает на локальный сервер Redis
-# CELERY_RESULT_BACKEND = 'redis://redis:6379/0'  # Место хранения результатов задач
-# CELERY_ACCEPT_CONTENT = ['json']
-# CELERY_TASK_SERIALIZER = 'json'
+# Cache backend: "locmem" for development, "redis" or "file" when several processes must share it.
+CACHE_BACKEND = os.environ.get("CACHE_BACKEND", "locmem")
+CACHE_BACKENDS = {
+    "locmem": ("django.core.cache.backends.locmem.LocMemCache", "expenses"),
+    "redis": ("django.core.cache.backends.redis.RedisCache", "redis://redis:6379/1"),
+    "file": ("django.core.cache.backends.filebased.FileBasedCache", str(BASE_DIR / "data" / "cache")),
+}
+CACHES = {
+    "default": {
+        "BACKEND": CACHE_BACKENDS[CACHE_BACKEND][0],
+        "LOCATION": os.environ.get("CACHE_LOCATION", CACHE_BACKENDS[CACHE_BACKEND][1]),
+    }
+}
+ANALYTICS_CACHE_TIMEOUT = int(os.environ.get("ANALYTICS_CACHE_TIMEOUT", 60 * 60))
+# How long other requests wait for a value that one request is computing.
+ANALYTICS_CACHE_LOCK_TIMEOUT = 30
+# Rendered PDF reports are kept in REPORT_ROOT for REPORT_MAX_AGE seconds. Reports covering more than
+# REPORT_ASYNC_THRESHOLD expenses are rendered by a Celery worker instead of the web request.
+REPORT_ROOT = os.environ.get("REPORT_ROOT", str(DATABASE_DIR / "reports"))
+REPORT_MAX_AGE = 2 * 24 * 60 * 60
+REPORT_ASYNC_THRESHOLD = int(os.environ.get("REPORT_ASYNC_THRESHOLD", 2000))
+# Every user's report of the previous month is rendered on the 1st into MONTHLY_REPORT_ROOT,
+# MONTHLY_REPORT_CHUNK_SIZE reports per bulk task.
+MONTHLY_REPORT_ROOT = os.environ.get("MONTHLY_REPORT_ROOT", str(DATABASE_DIR / "monthly_reports"))
+MONTHLY_REPORT_CHUNK_SIZE = 100
+# `manage.py archive_expenses` moves expenses older than ARCHIVE_HORIZON_DAYS into per-user, per-year
+# column files in ARCHIVE_ROOT, which the analytics read through memory maps.
+ARCHIVE_ROOT = os.environ.get("ARCHIVE_ROOT", str(DATABASE_DIR / "archive"))
+ARCHIVE_HORIZON_DAYS = int(os.environ.get("ARCHIVE_HORIZON_DAYS", 2 * 365))
+CELERY_BROKER_URL = os.environ.get("CELERY_BROKER_URL", "redis://redis:6379/0")
+CELERY_RESULT_BACKEND = os.environ.get("CELERY_RESULT_BACKEND", "redis://redis:6379/0")
+CELERY_ACCEPT_CONTENT = ["json"]
+CELERY_TASK_SERIALIZER = "json"
+CELERY_RESULT_SERIALIZER = "json"
+CELERY_RESULT_EXPIRES = 60 * 60
+CELERY_TASK_DEFAULT_QUEUE = "interactive"
+CELERY_TASK_ACKS_LATE = True
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+# Public base URL MonoBank pushes statement items to; webhooks are not registered when it is empty.
+WEBHOOK_BASE_URL = os.environ.get("WEBHOOK_BASE_URL", "")
+# Webhook events are written in batches of WEBHOOK_BATCH_SIZE, at most WEBHOOK_BATCH_DELAY seconds after arrival.
+# Above WEBHOOK_MAX_PENDING queued events the receiver answers 503 so the bank retries later.
+WEBHOOK_BATCH_SIZE = 500
+WEBHOOK_BATCH_DELAY = 2
+WEBHOOK_MAX_PENDING = 10000
+CELERY_BEAT_SCHEDULE = {
+    "schedule-account-syncs": {
+        "task": "expenses_monitoring.tasks.schedule_account_syncs",
+        "schedule": 60,
+    },
+    "drain-webhook-queue": {
+        "task": "expenses_monitoring.tasks.drain_webhook_queue",
+        "schedule": 60,
+        "options": {"queue": "ingest"},
+    },
+    # Picks up batches whose flush could not be scheduled.
+    "flush-ingest-buffer": {
+        "task": "expenses_monitoring.tasks.flush_ingest_buffer",
+        "schedule": 60,
+        "options": {"queue": "ingest"},
+    },
+    "prune-report-store": {
+        "task": "expenses_monitoring.tasks.prune_report_store",
+        "schedule": 60 * 60,
+    },
+    "generate-monthly-reports": {
+        "task": "expenses_monitoring.tasks.generate_monthly_reports",
+        "schedule": crontab(minute=0, hour=3, day_of_month=1),
+    },
+}
+# Fleet-wide sync scheduler: accounts synced within SCHEDULER_MIN_STALENESS seconds are skipped,
+# accounts the webhook delivers events for are only reconciled every SCHEDULER_WEBHOOK_RECONCILE_INTERVAL seconds,
+# and accounts of users who logged in within SCHEDULER_ACTIVE_USER_DAYS count as this many times staler.
+SCHEDULER_MAX_FETCHES_PER_RUN = 100
+SCHEDULER_MIN_STALENESS = 60 * 60
+SCHEDULER_WEBHOOK_RECONCILE_INTERVAL = 24 * 60 * 60
+SCHEDULER_ACTIVE_USER_DAYS = 7
+SCHEDULER_ACTIVE_USER_WEIGHT = 4
+# Days of statement history loaded when a user connects their bank.
+BACKFILL_HISTORY_DAYS = int(os.environ.get("BACKFILL_HISTORY_DAYS", 365))
+# Seconds after which a queued or running sync no longer blocks a new one, e.g. when its worker died.
+SYNC_LOCK_TIMEOUT = int(os.environ.get("SYNC_LOCK_TIMEOUT", 15 * 60))
+
+# Monobank API: (requests, period in seconds) allowed per token for each endpoint.
+MONOBANK_RATE_LIMITS = {
+    "statement": (1, 60),
+    "client-info": (1, 60),
+    "webhook": (1, 60),
+}
+# Number of statement requests that may be in flight at once for a single sync.
+MONOBANK_FETCH_WORKERS = int(os.environ.get("MONOBANK_FETCH_WORKERS", 4))
+# HTTP client: keep-alive pool size, timeouts and retry backoff (seconds).
+MONOBANK_POOL_SIZE = 10
+MONOBANK_CONNECT_TIMEOUT = 5
+MONOBANK_READ_TIMEOUT = 30
+MONOBANK_MAX_RETRIES = 5
+MONOBANK_BACKOFF_BASE = 1
+MONOBANK_BACKOFF_MAX = 120
+# Consecutive failures after which calls with a token fail fast, and for how long.
+MONOBANK_CIRCUIT_FAILURE_THRESHOLD = 5
+MONOBANK_CIRCUIT_RESET_TIMEOUT = 120
+# Number of expenses written per upsert statement during ingest.
+EXPENSE_UPSERT_BATCH_SIZE = int(os.environ.get("EXPENSE_UPSERT_BATCH_SIZE", 500))
+# Single ingest writer: with INGEST_WRITER=1 syncs, backfills and imports buffer their batches in INGEST_BUFFER_URL
+# and one worker of the "ingest" queue writes them in transactions of about INGEST_BATCH_SIZE expenses,
+# at most INGEST_MAX_DELAY seconds after they arrive. Otherwise every producer writes its own batches.
+INGEST_WRITER = os.environ.get("INGEST_WRITER") == "1"
+INGEST_BUFFER_URL = os.environ.get("INGEST_BUFFER_URL", "redis://redis:6379/2")
+INGEST_BATCH_SIZE = int(os.environ.get("INGEST_BATCH_SIZE", 5000))
+INGEST_MAX_DELAY = int(os.environ.get("INGEST_MAX_DELAY", 2))
+# Producers wait while INGEST_MAX_PENDING batches are buffered, for at most INGEST_PUSH_TIMEOUT seconds.
+# A batch whose write failed INGEST_MAX_ATTEMPTS times is moved to the "ingest:dead" list.
+INGEST_MAX_PENDING = int(os.environ.get("INGEST_MAX_PENDING", 1000))
+INGEST_PUSH_TIMEOUT = 60
+INGEST_MAX_ATTEMPTS = 3
+
 CSRF_COOKIE_DOMAIN = ".daria-korchakovska.pp.ua"
 SESSION_COOKIE_DOMAIN = ".daria-korchakovska.pp.ua"
 CSRF_TRUSTED_ORIGINS = [
@@ -201,362 +381,3 @@ LOGGING = {
         },
     },
 }
-MMC = {
-    "0742": "Ветеринарні послуги",
-    "0743": "Виноробники",
-    "0744": "Виробники шампанського",
-    "0763": "Сільскогосподарські кооперативи",
-    "0780": "Садівництво. Ландшафтний дизайн",
-    "1520": "Будівництво. Підрядники",
-    "1711": "Кондиціонери. Встановлення",
-    "1731": "Електрики",
-    "1740": "Будівники. Облицювання",
-    "1750": "Столярні роботи",
-    "1761": "Будівники. Облицювання",
-    "1771": "Будівництво. Бетон",
-    "1799": "Спеціалізовані підрядники",
-    "2741": "Друкарська справа",
-    "2744": "Друкарська справа",
-    "2791": "Набір текстів та друк",
-    "2842": "Спеціалізоване прибирання",
-    "3838": "Готелі та курорти",
-    "3882": "Переведення в готівку",
-    "4011": "Залізниця",
-    "4111": "Пасажирські перевезення",
-    "4112": "Пасажирські залізничні перевезення",
-    "4119": "Швидка допомога",
-    "4121": "Таксі",
-    "4131": "Перевезення. Автобус",
-    "4214": "Транспортування. Доставка",
-    "4215": "Кур'єрська служба",
-    "4225": "Сховище",
-    "4304": "Різне",
-    "4411": "Круїзні лінії",
-    "4457": "Оренда суден",
-    "4468": "Яхтинговий сервіс",
-    "4511": "Авіалінії",
-    "4582": "Аеропорти",
-    "4722": "Туризм",
-    "4723": "Туроператори",
-    "4729": "Транспортні послуги",
-    "4761": "Телемаркетинг",
-    "4784": "Платні дороги",
-    "4785": "Різне",
-    "4789": "Залізниця",
-    "4812": "Телекомунікаційне обладнання",
-    "4813": "Торгові точки з телефонією",
-    "4814": "Мобільний зв'язок",
-    "4815": "Телефонні послуги",
-    "4816": "Інформаційні послуги",
-    "4821": "Телеграф",
-    "4829": "Переказ коштів",
-    "4899": "Телебачення",
-    "4900": "Комунальні послуги",
-    "5013": "Автозапчастини",
-    "5021": "Меблі",
-    "5039": "Будматеріали",
-    "5044": "Офісне приладдя",
-    "5045": "Комп'ютери та програмне забезпечення",
-    "5046": "Обладнання",
-    "5047": "Медичне обладнання",
-    "5051": "Обробка металу",
-    "5065": "Електроніка",
-    "5072": "Апаратура",
-    "5074": "Сантехніка",
-    "5085": "Промисловість",
-    "5094": "Дорогоцінності",
-    "5099": "Товари",
-    "5111": "Канцелярія",
-    "5122": "Ліки",
-    "5131": "Галантерея",
-    "5137": "Одяг",
-    "5139": "Взуття",
-    "5169": "Хімія",
-    "5172": "Бензин",
-    "5192": "Книги. Преса",
-    "5193": "Квіти",
-    "5198": "Фарби",
-    "5199": "Товари",
-    "5200": "Товари для дому",
-    "5211": "Будматеріали",
-    "5231": "Ремонт",
-    "5251": "Господарських товари",
-    "5261": "Садове приладдя",
-    "5262": "Маркетплейси",
-    "5271": "Будинки на колесах",
-    "5292": "Різне",
-    "5295": "Різне",
-    "5297": "Роздрібні магазини",
-    "5298": "Роздрібні магазини",
-    "5299": "Продаж газу",
-    "5300": "Оптовики",
-    "5309": "Duty Free",
-    "5310": "Дискаунтери",
-    "5311": "Універмаги",
-    "5331": "Універсальні магазини",
-    "5399": "Універсальні магазини",
-    "5411": "Продукти",
-    "5415": "Різне",
-    "5422": "М'ясо",
-    "5441": "Солодощі",
-    "5451": "Фермерські товари",
-    "5462": "Пекарні",
-    "5499": "Продукти",
-    "5511": "Автосалони",
-    "5521": "Автосалони",
-    "5531": "Автозапчастини",
-    "5532": "Шини",
-    "5533": "Автомагазини",
-    "5541": "СТО",
-    "5542": "АЗС",
-    "5551": "Човни",
-    "5552": "Зарядка електромобілів",
-    "5561": "Автосалони",
-    "5571": "Автосалони",
-    "5592": "Автосалони",
-    "5598": "Автосалони",
-    "5599": "Автосалони",
-    "5611": "Чоловічий одяг",
-    "5621": "Жіночий одяг",
-    "5631": "Жіночий одяг",
-    "5641": "Дитячий одяг",
-    "5651": "Одяг",
-    "5655": "Спортивний одяг",
-    "5661": "Взуття",
-    "5681": "Хутро",
-    "5691": "Одяг",
-    "5697": "Ательє",
-    "5698": "Перуки",
-    "5699": "Аксесуари",
-    "5712": "Фурнітура",
-    "5713": "Покриття для підлоги",
-    "5714": "Штори. Фіранки",
-    "5715": "Спиртні напої",
-    "5718": "Каміни",
-    "5719": "Фурнітура",
-    "5722": "Побутова техніка",
-    "5732": "Побутова техніка",
-    "5733": "Музичні інструменти",
-    "5734": "Комп'ютерне ПЗ",
-    "5735": "Магазини звукозапису",
-    "5811": "Доставка їжі",
-    "5812": "Кафе. Ресторани",
-    "5813": "Бари",
-    "5814": "Фаст-фуд",
-    "5815": "Цифрові товари",
-    "5816": "Ігри",
-    "5817": "Програмне забезпечення",
-    "5818": "Цифрові товари",
-    "5832": "Антикваріат",
-    "5912": "Аптеки",
-    "5921": "Спиртні напої",
-    "5931": "Секонд-хенд",
-    "5932": "Антикваріат",
-    "5933": "Ломбарди",
-    "5935": "Автозвалище",
-    "5937": "Магазини репродукцій",
-    "5940": "Велосипеди",
-    "5941": "Товари для спорту",
-    "5942": "Книгарні",
-    "5943": "Канцтовари",
-    "5944": "Годинники",
-    "5945": "Іграшки",
-    "5946": "Фототовари",
-    "5947": "Сувеніри",
-    "5948": "Шкіряні вироби",
-    "5949": "Товари для шиття",
-    "5950": "Кришталь / посуд",
-    "5960": "Страхування",
-    "5961": "Товари поштою",
-    "5962": "Подорожі",
-    "5963": "Комівояжери",
-    "5964": "Товари поштою",
-    "5965": "Товари поштою",
-    "5966": "Товари поштою",
-    "5967": "Інформаційні послуги",
-    "5968": "Підписки",
-    "5969": "Товари поштою",
-    "5970": "Художні товари",
-    "5971": "Галереї",
-    "5972": "Філателістика",
-    "5973": "Церковні лавки",
-    "5974": "Штампи",
-    "5975": "Слухові апарати",
-    "5976": "Протези",
-    "5977": "Косметика",
-    "5978": "Друкарські машини",
-    "5983": "Паливо",
-    "5992": "Флористика",
-    "5993": "Тютюнові вироби",
-    "5994": "Газети. Журнали",
-    "5995": "Зоотовари",
-    "5996": "Басейни",
-    "5997": "Бритви",
-    "5998": "Тенти",
-    "5999": "Різне",
-    "6010": "Каси",
-    "6011": "Каси",
-    "6012": "Фінансові послуги",
-    "6022": "Банки",
-    "6023": "Банки",
-    "6025": "Банки",
-    "6026": "Банки",
-    "6028": "Банки",
-    "6050": "Квазі-кеш",
-    "6051": "Квазі-кеш",
-    "6211": "Цінні папери",
-    "6236": "Цінні папери",
-    "6300": "Страхування",
-    "6381": "Страхування",
-    "6399": "Страхування",
-    "6513": "Оренда нерухомості",
-    "6529": "Поповнення картки",
-    "6530": "Поповнення картки",
-    "6531": "Переказ коштів",
-    "6532": "Переказ коштів",
-    "6533": "Переказ коштів",
-    "6534": "Переказ коштів",
-    "6535": "Переказ коштів",
-    "6536": "Переказ коштів",
-    "6537": "Переказ коштів",
-    "6538": "Переказ коштів",
-    "6539": "Переказ коштів",
-    "6540": "Переказ коштів",
-    "6611": "Переказ коштів",
-    "6760": "Облігації",
-    "7011": "Готелі та курорти",
-    "7012": "Тайм-шери",
-    "7032": "Рекреація",
-    "7033": "Кемпінг",
-    "7210": "Прання й прибирання",
-    "7211": "Прання",
-    "7216": "Хімчистка",
-    "7217": "Чистка",
-    "7221": "Фотостудія",
-    "7230": "Краса",
-    "7251": "Ремонт одягу",
-    "7261": "Ритуальні послуги",
-    "7272": "Ескорт",
-    "7273": "Знайомства. Ескорт",
-    "7276": "Податки",
-    "7277": "Консультація",
-    "7278": "Покупки",
-    "7280": "Лікарні",
-    "7295": "Няні",
-    "7296": "Прокат одягу",
-    "7297": "Масаж",
-    "7298": "Здоров'я й краса",
-    "7299": "Різне",
-    "7311": "Реклама",
-    "7321": "БКІ",
-    "7322": "Колектори",
-    "7332": "Копі-центри",
-    "7333": "Фотографія й мистецтво",
-    "7338": "Копі-центри",
-    "7339": "Стенографія",
-    "7342": "Дезінфекція",
-    "7349": "Чистка й обслуговування",
-    "7361": "Працевлаштування",
-    "7372": "Програмування",
-    "7375": "Інформаційні послуги",
-    "7379": "Ремонт комп'ютерів",
-    "7389": "Бізнес послуги",
-    "7392": "Консультації, PR",
-    "7393": "Детективні агентства",
-    "7394": "Оренда спорядження",
-    "7395": "Фотодрук",
-    "7399": "Бізнес послуги",
-    "7511": "Паркування",
-    "7512": "Оренда автомобілів",
-    "7513": "Оренда вантажівок",
-    "7519": "Оренда автомобілів",
-    "7523": "Паркування",
-    "7524": "Паркування",
-    "7531": "Ремонт авто",
-    "7534": "Шиномонтаж",
-    "7535": "Автомобільні фарби",
-    "7538": "СТО",
-    "7542": "Автомийки",
-    "7549": "Евакуатор",
-    "7622": "Ремонт техніки",
-    "7623": "Ремонт кліматичної техніки",
-    "7629": "Ремонт техніки",
-    "7631": "Ремонт годинників й ювелірних виробів",
-    "7641": "Ремонт меблів",
-    "7692": "Зравювальні роботи",
-    "7699": "Ремонт",
-    "7800": "Державна лотерея",
-    "7801": "Онлайн-казино",
-    "7802": "Скачки",
-    "7829": "Прокат відео",
-    "7832": "Кінотеатри",
-    "7833": "Кінотеатри",
-    "7841": "Прокат відео",
-    "7911": "Танцювальні студії. Школи танцю",
-    "7922": "Квитки",
-    "7929": "Музичні групи. Оркестри",
-    "7932": "Більярд",
-    "7933": "Боулінг-клуби",
-    "7941": "Спортклуби",
-    "7991": "Туризм",
-    "7992": "Гольф",
-    "7993": "Відеоігри",
-    "7994": "Відеоігри",
-    "7995": "Азартні ігри",
-    "7996": "Розваги",
-    "7997": "Розваги та спорт",
-    "7998": "Акваріуми. Дельфінарії",
-    "7999": "Розваги та спорт",
-    "8011": "Медецина",
-    "8021": "Стоматологія",
-    "8031": "Медецина",
-    "8041": "Хіропрактики",
-    "8042": "Оптика",
-    "8043": "Оптика",
-    "8044": "Оптика",
-    "8049": "Ортопеди",
-    "8050": "Доглядальниці",
-    "8062": "Лікарні",
-    "8071": "Медицина та стоматологія",
-    "8099": "Медичні послуги",
-    "8110": "Юристи. Адвокати",
-    "8111": "Юристи. Адвокати",
-    "8211": "Школа",
-    "8220": "Освіта. Університет",
-    "8241": "Дистанційна освіта",
-    "8244": "Освіта. Бізнес",
-    "8249": "Освіта",
-    "8299": "Освіта",
-    "8351": "Дитячий садок",
-    "8398": "Благодійність",
-    "8641": "Громадські організації",
-    "8651": "Політичні організації",
-    "8661": "Релігійні організації",
-    "8664": "Різне",
-    "8675": "Автоклуб",
-    "8699": "Членські організації",
-    "8734": "Випробувальні лабораторії",
-    "8743": "Випробувальні лабораторії",
-    "8911": "Архітектори",
-    "8931": "Бухгалтерія. Аудит",
-    "8999": "Професійні послуги",
-    "9034": "I-Purchasing Pilot",
-    "9211": "Суд",
-    "9222": "Штрафи",
-    "9223": "Виплати. Облігації",
-    "9311": "Податки",
-    "9399": "Державні послуги",
-    "9401": "I-Purchasing Pilot",
-    "9402": "Пошта",
-    "9405": "Урядові закупівлі",
-    "9406": "Державна лотерея",
-    "9411": "Державні послуги",
-    "9700": "Кешбек",
-    "9701": "VISA",
-    "9702": "Аварійні служби",
-    "9751": "Документообіг",
-    "9752": "Документообіг",
-    "9754": "Скачки",
-    "9950": "Купівлі всередині компанії",
-    "9999": "Різне",
-}
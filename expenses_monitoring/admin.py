@@ -1,4 +1,5 @@
 from django.contrib import admin
+from django.contrib.admin.views.main import ChangeList
 
 from .forms import BankConnectionForm
 from .models import (
@@ -7,9 +8,12 @@ from .models import (
     Goal,
     CustomUser,
     CashType,
+    Category,
     Expense,
     Account,
+    MerchantCategoryCode,
 )
+from .routers import analytics_db
 
 
 class BankConnectionAdmin(admin.ModelAdmin):
@@ -28,10 +32,31 @@ class GoalAdmin(admin.ModelAdmin):
     list_filter = ["user", "cash_type"]
 
 
+class AnalyticsChangeList(ChangeList):
+    """Change list that reads from the analytics database."""
+
+    def get_queryset(self, request, exclude_parameters=None):
+        queryset = super().get_queryset(request, exclude_parameters)
+        # Actions are POSTed and run on this queryset, so only plain listing reads from the replica.
+        return queryset.using(analytics_db()) if request.method == "GET" else queryset
+
+
+class ExpenseAdmin(admin.ModelAdmin):
+    list_display = ["user", "timestamp", "description", "category", "amount", "cash_type"]
+    list_select_related = ["user", "category", "cash_type"]
+    # Skip the COUNT(*) over all expenses on every changelist page.
+    show_full_result_count = False
+
+    def get_changelist(self, request, **kwargs):
+        return AnalyticsChangeList
+
+
 admin.site.register(BankConnection, BankConnectionAdmin)
 admin.site.register(Consultation, ConsultationAdmin)
 admin.site.register(Goal, GoalAdmin)
 admin.site.register(CustomUser)
 admin.site.register(CashType)
-admin.site.register(Expense)
+admin.site.register(Expense, ExpenseAdmin)
 admin.site.register(Account)
+admin.site.register(Category)
+admin.site.register(MerchantCategoryCode)
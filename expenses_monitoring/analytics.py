@@ -0,0 +1,245 @@
+"""
+Columnar analytics over a user's expense history.
+
+Expenses are streamed from the database once with `values_list` into typed NumPy columns
+(no model instances), merged with the memory-mapped columns of archived expenses, and every
+analysis is a vectorised operation on those columns.
+Amounts are integer minor units, so all sums stay exact in int64.
+"""
+
+from array import array
+from datetime import date, datetime
+
+import numpy as np
+from django.utils.timezone import get_default_timezone
+
+from expenses_monitoring.archive import read_archive
+from expenses_monitoring.models import Expense
+from expenses_monitoring.rollups import get_daily_totals
+from expenses_monitoring.routers import analytics_db
+
+EPOCH = date(1970, 1, 1)
+BUCKET_UNITS = ("day", "week", "month", "year")
+
+
+class ExpenseColumns:
+    """
+    A user's expenses as parallel NumPy columns ordered by time:
+    int64 `timestamp`, int64 `amount` (minor units), int16 `category` and int32 `merchant`.
+    Merchants are interned: `merchants[merchant[i]]` is the merchant name of expense i.
+    """
+
+    def __init__(self, timestamp, amount, category, merchant, merchants):
+        self.timestamp = timestamp
+        self.amount = amount
+        self.category = category
+        self.merchant = merchant
+        self.merchants = merchants
+
+    def __len__(self):
+        return len(self.timestamp)
+
+
+def load_expense_columns(user_id, from_time=None, to_time=None, chunk_size=5000):
+    """Stream the user's expenses with from_time <= timestamp < to_time into columns, archived ones included."""
+    expenses = Expense.objects.using(analytics_db(user_id)).filter(user_id=user_id).order_by("timestamp")
+    if from_time is not None:
+        expenses = expenses.filter(timestamp__gte=from_time)
+    if to_time is not None:
+        expenses = expenses.filter(timestamp__lt=to_time)
+
+    timestamps = array("q")
+    amounts = array("q")
+    categories = array("h")
+    merchants = array("i")
+    merchant_ids = {}
+    rows = expenses.values_list("timestamp", "amount", "category_id", "description").iterator(chunk_size=chunk_size)
+    for timestamp, amount, category_id, description in rows:
+        timestamps.append(timestamp)
+        amounts.append(amount)
+        categories.append(category_id)
+        merchants.append(merchant_ids.setdefault(description, len(merchant_ids)))
+
+    columns = [
+        np.array(timestamps, dtype=np.int64),
+        np.array(amounts, dtype=np.int64),
+        np.array(categories, dtype=np.int16),
+        np.array(merchants, dtype=np.int32),
+    ]
+    segments = read_archive(user_id, from_time, to_time)
+    if segments:
+        columns = _merge_archived_columns(columns, segments, merchant_ids)
+    return ExpenseColumns(*columns, list(merchant_ids))
+
+
+def _merge_archived_columns(columns, segments, merchant_ids):
+    parts = [columns]
+    for segment in segments:
+        # Re-code the segment's merchant dictionary into the one being built.
+        codes = np.array(
+            [merchant_ids.setdefault(name, len(merchant_ids)) for name in segment.strings["description"]],
+            dtype=np.int32,
+        )
+        parts.append([segment["timestamp"], segment["amount"], segment["category"], codes[segment["description"]]])
+    merged = [np.concatenate(column) for column in zip(*parts)]
+    order = np.argsort(merged[0], kind="stable")
+    return [column[order] for column in merged]
+
+
+def local_days(timestamps):
+    """
+    Convert unix timestamps to local day numbers (days since 1970-01-01 in the project's time zone).
+    UTC offsets are looked up once per distinct hour rather than once per timestamp.
+    """
+    hours, inverse = np.unique(timestamps // 3600, return_inverse=True)
+    tz = get_default_timezone()
+    offsets = np.array(
+        [datetime.fromtimestamp(int(hour) * 3600, tz).utcoffset().total_seconds() for hour in hours], dtype=np.int64
+    )
+    return (timestamps + offsets[inverse]) // 86400
+
+
+def bucket_days(days, unit):
+    """Map day numbers (days since 1970-01-01) to the first day of their day, week, month or year."""
+    if unit not in BUCKET_UNITS:
+        raise ValueError(f"Unknown bucket unit {unit}")
+    if unit == "week":
+        # 1970-01-01 was a Thursday.
+        days = days - (days + 3) % 7
+    buckets = days.astype("datetime64[D]")
+    if unit == "month":
+        buckets = buckets.astype("datetime64[M]").astype("datetime64[D]")
+    elif unit == "year":
+        buckets = buckets.astype("datetime64[Y]").astype("datetime64[D]")
+    return buckets
+
+
+def bucket_series(days, values, from_date, to_date, unit):
+    """
+    Sum per-day values into consecutive calendar buckets covering two dates, both inclusive;
+    buckets without values are included with a zero total.
+    Returns:
+        A tuple of a datetime64[D] array of the bucket starts and an int64 array of their totals.
+    """
+    start = (from_date - EPOCH).days
+    end = (to_date - EPOCH).days
+    buckets = np.unique(bucket_days(np.arange(start, end + 1), unit))
+    totals = np.zeros(len(buckets), dtype=np.int64)
+    days = np.asarray(days, dtype=np.int64)
+    in_range = (days >= start) & (days <= end)
+    indices = np.searchsorted(buckets, bucket_days(days[in_range], unit))
+    np.add.at(totals, indices, np.asarray(values, dtype=np.int64)[in_range])
+    return buckets, totals
+
+
+def daily_totals(columns, from_date, to_date):
+    """
+    Sum the expenses per local day between two dates, both inclusive; days without expenses are included.
+    Returns:
+        A tuple of a datetime64[D] array of the days and an int64 array of their totals.
+    """
+    return bucket_series(local_days(columns.timestamp), columns.amount, from_date, to_date, "day")
+
+
+def rolling_sum(values, window):
+    """Sum every `window` consecutive values; the first window - 1 sums cover the values seen so far."""
+    cumulative = np.concatenate(([0], np.cumsum(values, dtype=np.int64)))
+    ends = np.arange(1, len(values) + 1)
+    return cumulative[ends] - cumulative[np.maximum(ends - window, 0)]
+
+
+def lttb(y, threshold):
+    """
+    Downsample a series to `threshold` points with Largest-Triangle-Three-Buckets, which keeps
+    the peaks and troughs that give a chart its shape. Points are assumed to be evenly spaced.
+    Returns:
+        The sorted indices of the points to keep.
+    """
+    size = len(y)
+    if threshold >= size or threshold < 3:
+        return np.arange(size)
+    y = np.asarray(y, dtype=np.float64)
+    x = np.arange(size, dtype=np.float64)
+    # The first and last points are kept; the rest is split into threshold - 2 buckets.
+    edges = np.linspace(1, size - 1, threshold - 1).astype(np.int64)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = size - 1
+    previous = 0
+    for bucket_index in range(threshold - 2):
+        start, end = edges[bucket_index], edges[bucket_index + 1]
+        next_end = edges[bucket_index + 2] if bucket_index + 2 < len(edges) else size
+        next_x = x[end:next_end].mean()
+        next_y = y[end:next_end].mean()
+        areas = np.abs(
+            (x[previous] - next_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (next_y - y[previous])
+        )
+        previous = start + int(np.argmax(areas))
+        selected[bucket_index + 1] = previous
+    return selected
+
+
+def group_sum(keys, values):
+    """
+    Sum `values` per distinct key.
+    Returns:
+        A tuple of arrays: the sorted distinct keys, their int64 sums and their counts.
+    """
+    if not len(keys):
+        return keys[:0], np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+    starts = np.flatnonzero(np.concatenate(([True], sorted_keys[1:] != sorted_keys[:-1])))
+    sums = np.add.reduceat(values[order].astype(np.int64), starts)
+    counts = np.diff(np.append(starts, len(keys)))
+    return sorted_keys[starts], sums, counts
+
+
+def top_merchants(columns, limit=10):
+    """
+    Get the merchants the most was spent at.
+    Returns:
+        A list of (merchant, total, count) tuples, largest total first.
+    """
+    merchants, sums, counts = group_sum(columns.merchant, columns.amount)
+    top = np.argsort(-sums, kind="stable")[:limit]
+    return [(columns.merchants[merchants[i]], int(sums[i]), int(counts[i])) for i in top]
+
+
+def compare_periods(current, previous):
+    """
+    Compare spending per category between two periods.
+
+    `current` and `previous` are ExpenseColumns of the two periods.
+    Returns:
+        A list of (category id, current total, previous total) tuples, largest current total first.
+    """
+    comparison = {}
+    for index, columns in enumerate((current, previous)):
+        categories, sums, _ = group_sum(columns.category, columns.amount)
+        for category_id, total in zip(categories.tolist(), sums.tolist()):
+            comparison.setdefault(category_id, [0, 0])[index] = total
+    return sorted(
+        ((category_id, *totals) for category_id, totals in comparison.items()), key=lambda row: (-row[1], -row[2])
+    )
+
+
+def get_expense_timeseries(user, from_date, to_date, unit, category_ids=None, max_points=None):
+    """
+    Build a chart series of the user's spending between two dates, both inclusive.
+
+    Daily totals come from the rollup table, are summed into `unit` buckets and, if there are
+    more buckets than `max_points`, downsampled with LTTB.
+    Returns:
+        A tuple of a datetime64[D] array of bucket starts, an int64 array of totals and the number
+        of buckets before downsampling.
+    """
+    rows = get_daily_totals(user, from_date, to_date, category_ids)
+    days = np.array([(day - EPOCH).days for day, _ in rows], dtype=np.int64)
+    values = np.array([total for _, total in rows], dtype=np.int64)
+    buckets, totals = bucket_series(days, values, from_date, to_date, unit)
+    if max_points and len(buckets) > max_points:
+        keep = lttb(totals, max_points)
+        return buckets[keep], totals[keep], len(buckets)
+    return buckets, totals, len(buckets)
@@ -1,6 +1,12 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class ExpencesMonitoringConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "expenses_monitoring"
+
+    def ready(self):
+        from .db import configure_connection
+
+        connection_created.connect(configure_connection, dispatch_uid="expenses_monitoring.configure_connection")
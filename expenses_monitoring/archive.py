@@ -0,0 +1,313 @@
+"""
+Cold tier of the expense history.
+
+`archive_expenses` moves expenses older than ARCHIVE_HORIZON_DAYS out of the expenses table into
+ARCHIVE_ROOT/<user id>/<year>/, as segment directories of at most ARCHIVE_SEGMENT_SIZE expenses
+with a `.npy` file per column. Columns are narrow fixed-width types ordered by (timestamp, id) and
+the string columns are dictionary-encoded, so segments are small and are read through memory maps:
+a range read is a binary search on the timestamp column and only touches the pages it needs.
+Segments are never changed once written; re-running the archive adds new segments for whatever
+became old since.
+
+The daily rollups of archived days are kept, and `analytics.load_expense_columns`, the rollup
+rebuilds, the export and the ledger merge archived and hot expenses.
+"""
+
+import json
+import logging
+import os
+import shutil
+import tempfile
+from datetime import datetime
+from functools import lru_cache
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.utils.timezone import get_default_timezone
+
+from expenses_monitoring.models import Expense
+
+log = logging.getLogger(__name__)
+
+# Column dtypes; the Expense fields they hold are in ARCHIVE_FIELDS, in the same order.
+ARCHIVE_COLUMNS = {
+    "id": np.int64,
+    "timestamp": np.int64,
+    "amount": np.int64,
+    "category": np.int16,
+    "cash_type": np.int16,
+    # -1 for expenses without an MCC.
+    "mcc": np.int16,
+    "hold": np.bool_,
+    "description": np.int32,
+    "provider": np.int16,
+    # Fixed-width bytes, b"" for expenses without an external id.
+    "external_id": "S",
+}
+ARCHIVE_FIELDS = (
+    "id",
+    "timestamp",
+    "amount",
+    "category_id",
+    "cash_type_id",
+    "mcc",
+    "hold",
+    "description",
+    "provider",
+    "external_id",
+)
+STRING_COLUMNS = ("description", "provider")
+ARCHIVE_READ_CHUNK_SIZE = 5000
+ARCHIVE_SEGMENT_SIZE = 100_000
+ARCHIVE_DELETE_BATCH_SIZE = 500
+
+
+class Segment:
+    """
+    Archived expenses of one user and year as memory-mapped columns ordered by (timestamp, id),
+    with the dictionaries of the string columns.
+    """
+
+    def __init__(self, columns, strings):
+        self.columns = columns
+        self.strings = strings
+
+    def __len__(self):
+        return len(self.columns["timestamp"])
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def between(self, from_time=None, to_time=None):
+        """Return the expenses with from_time <= timestamp < to_time; either bound may be None."""
+        timestamps = self.columns["timestamp"]
+        start = 0 if from_time is None else np.searchsorted(timestamps, from_time)
+        end = len(timestamps) if to_time is None else np.searchsorted(timestamps, to_time)
+        return Segment({name: values[start:end] for name, values in self.columns.items()}, self.strings)
+
+    def take(self, positions):
+        """Return the expenses at the given row positions."""
+        return Segment({name: values[positions] for name, values in self.columns.items()}, self.strings)
+
+    def values(self, name, start=0, end=None):
+        """Return a column as Python values, with strings and missing values decoded."""
+        values = self.columns[name][start:end].tolist()
+        if name in STRING_COLUMNS:
+            return [self.strings[name][code] for code in values]
+        if name == "mcc":
+            return [None if mcc < 0 else mcc for mcc in values]
+        if name == "external_id":
+            return [external_id.decode() or None for external_id in values]
+        return values
+
+    def rows(self, *names):
+        """Yield tuples of the named columns' values, reading ARCHIVE_READ_CHUNK_SIZE rows at a time."""
+        for start in range(0, len(self), ARCHIVE_READ_CHUNK_SIZE):
+            end = start + ARCHIVE_READ_CHUNK_SIZE
+            yield from zip(*(self.values(name, start, end) for name in names))
+
+
+def get_local_year(timestamp):
+    """Return the year of a unix timestamp in the project's time zone."""
+    return datetime.fromtimestamp(timestamp, get_default_timezone()).year
+
+
+def get_archive_path(user_id, year=None):
+    """Return the archive directory of a user, or of one year of a user."""
+    path = os.path.join(settings.ARCHIVE_ROOT, str(user_id))
+    return path if year is None else os.path.join(path, str(year))
+
+
+def get_archived_years(user_id):
+    """Return the years with archived expenses of a user, oldest first."""
+    try:
+        names = os.listdir(get_archive_path(user_id))
+    except FileNotFoundError:
+        return []
+    return sorted(int(name) for name in names if name.isdigit())
+
+
+@lru_cache(maxsize=256)
+def open_segment(path):
+    """Memory-map a segment; segments never change, so open ones are kept."""
+    columns = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r") for name in ARCHIVE_COLUMNS}
+    with open(os.path.join(path, "strings.json"), encoding="utf-8") as f:
+        strings = json.load(f)
+    return Segment(columns, strings)
+
+
+def get_segment_paths(user_id, year):
+    """Return the segment directories of a user's year, oldest first."""
+    path = get_archive_path(user_id, year)
+    try:
+        # Segments being written are in hidden temporary directories.
+        names = sorted((name for name in os.listdir(path) if not name.startswith(".")), key=lambda name: int(name))
+    except FileNotFoundError:
+        return []
+    return [os.path.join(path, name) for name in names]
+
+
+def get_segments(user_id, year):
+    """Return the segments of a user's year, oldest first."""
+    return [open_segment(path) for path in get_segment_paths(user_id, year)]
+
+
+def read_archive(user_id, from_time=None, to_time=None):
+    """
+    Get a user's archived expenses with from_time <= timestamp < to_time.
+    Returns:
+        A list of non-empty segments sliced to the range.
+    """
+    segments = []
+    for year in get_archived_years(user_id):
+        if from_time is not None and year < get_local_year(from_time):
+            continue
+        if to_time is not None and year > get_local_year(to_time - 1):
+            continue
+        for segment in get_segments(user_id, year):
+            segment = segment.between(from_time, to_time)
+            if len(segment):
+                segments.append(segment)
+    return segments
+
+
+@lru_cache(maxsize=256)
+def get_segment_keys(path):
+    """Return the (id set, (provider, external id) set) of a segment; segments never change, so they are kept."""
+    segment = open_segment(path)
+    keys = frozenset(
+        (provider, external_id)
+        for provider, external_id in segment.rows("provider", "external_id")
+        if external_id is not None
+    )
+    return frozenset(segment["id"].tolist()), keys
+
+
+def get_archived_keys(user_id, year):
+    """Return the (id set, (provider, external id) set) of a user's archived expenses of a year."""
+    ids = set()
+    keys = set()
+    for path in get_segment_paths(user_id, year):
+        segment_ids, segment_keys = get_segment_keys(path)
+        ids.update(segment_ids)
+        keys.update(segment_keys)
+    return ids, keys
+
+
+def get_newest_archived_time(user_id):
+    """Return the newest timestamp in a user's archive, None if nothing is archived."""
+    for year in reversed(get_archived_years(user_id)):
+        segments = [segment for segment in get_segments(user_id, year) if len(segment)]
+        if segments:
+            return max(int(segment["timestamp"][-1]) for segment in segments)
+    return None
+
+
+def drop_archived(expenses):
+    """
+    Leave out unsaved expenses whose transaction is already archived, so re-fetching old
+    history does not bring it back into the expenses table. Expenses newer than everything
+    archived, which is every expense of a regular sync, are kept without a lookup.
+    Returns:
+        The remaining expenses.
+    """
+    newest = {}
+    keys = {}
+    remaining = []
+    for expense in expenses:
+        if expense.external_id and expense.user_id not in newest:
+            newest[expense.user_id] = get_newest_archived_time(expense.user_id)
+        if expense.external_id and expense.timestamp <= (newest[expense.user_id] or -1):
+            year_key = (expense.user_id, get_local_year(expense.timestamp))
+            if year_key not in keys:
+                keys[year_key] = [get_segment_keys(path)[1] for path in get_segment_paths(*year_key)]
+            if any((expense.provider, expense.external_id) in segment_keys for segment_keys in keys[year_key]):
+                continue
+        remaining.append(expense)
+    return remaining
+
+
+def write_segment(user_id, year, rows):
+    """
+    Write rows of ARCHIVE_FIELDS values, ordered by (timestamp, id), as a new segment of a user's year.
+    The segment only appears once all its files are written.
+    Returns:
+        The path of the segment.
+    """
+    strings = {name: {} for name in STRING_COLUMNS}
+    columns = {}
+    for index, name in enumerate(ARCHIVE_COLUMNS):
+        values = [row[index] for row in rows]
+        if name in STRING_COLUMNS:
+            values = [strings[name].setdefault(value, len(strings[name])) for value in values]
+        elif name == "mcc":
+            values = [-1 if mcc is None else mcc for mcc in values]
+        elif name == "external_id":
+            values = [(external_id or "").encode() for external_id in values]
+        columns[name] = np.array(values, dtype=ARCHIVE_COLUMNS[name])
+
+    year_path = get_archive_path(user_id, year)
+    os.makedirs(year_path, exist_ok=True)
+    tmp_path = tempfile.mkdtemp(dir=year_path, prefix=".tmp")
+    try:
+        for name, values in columns.items():
+            np.save(os.path.join(tmp_path, f"{name}.npy"), values)
+        with open(os.path.join(tmp_path, "strings.json"), "w", encoding="utf-8") as f:
+            json.dump({name: list(values) for name, values in strings.items()}, f, ensure_ascii=False)
+        # Ids of different segments never overlap, so the smallest one names the segment.
+        path = os.path.join(year_path, str(columns["id"].min()))
+        os.rename(tmp_path, path)
+    except BaseException:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+    # Paths are only reused when an archive is deleted and written again; drop what was kept of the old one.
+    open_segment.cache_clear()
+    get_segment_keys.cache_clear()
+    return path
+
+
+def archive_user_expenses(user_id, cutoff):
+    """
+    Move a user's expenses with timestamp < cutoff into the archive, ARCHIVE_SEGMENT_SIZE of the
+    oldest at a time, each chunk as new segments of the years it covers.
+
+    Memory holds one chunk and the ids and transaction keys archived for the year being filled,
+    which are needed to skip rows an earlier run already archived. Rows are deleted from the
+    expenses table only after their segment is written; rows that are already archived, by id
+    or by transaction, are just deleted.
+    Returns:
+        The number of expenses moved.
+    """
+    expenses = Expense.objects.filter(user_id=user_id, timestamp__lt=cutoff).order_by("timestamp", "id")
+    archived = {}
+    moved = 0
+    while rows := list(expenses.values_list(*ARCHIVE_FIELDS, named=True)[:ARCHIVE_SEGMENT_SIZE]):
+        rows_by_year = {}
+        for row in rows:
+            rows_by_year.setdefault(get_local_year(row.timestamp), []).append(row)
+
+        for year, year_rows in rows_by_year.items():
+            if year not in archived:
+                archived[year] = get_archived_keys(user_id, year)
+            ids, keys = archived[year]
+            new_rows = [
+                row
+                for row in year_rows
+                if row.id not in ids and (row.external_id is None or (row.provider, row.external_id) not in keys)
+            ]
+            if new_rows:
+                path = write_segment(user_id, year, new_rows)
+                log.info(f"Archived {len(new_rows)} expenses of user {user_id} into {path}")
+                ids.update(row.id for row in new_rows)
+                keys.update((row.provider, row.external_id) for row in new_rows if row.external_id is not None)
+            moved += len(new_rows)
+
+        with transaction.atomic():
+            for start in range(0, len(rows), ARCHIVE_DELETE_BATCH_SIZE):
+                batch = rows[start : start + ARCHIVE_DELETE_BATCH_SIZE]
+                Expense.objects.filter(id__in=[row.id for row in batch]).delete()
+        # Chunks go forward in time, so the years before the last row's are complete.
+        last_year = get_local_year(rows[-1].timestamp)
+        archived = {year: keys for year, keys in archived.items() if year >= last_year}
+    return moved
@@ -0,0 +1,93 @@
+"""
+Per-user analytics cache.
+
+Cached values are keyed by the user's data version, which every ingest bumps, so a sync makes
+the old entries unreachable instead of deleting them one by one; they simply expire.
+A miss is computed by one caller at a time while concurrent callers wait for its result.
+"""
+
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+log = logging.getLogger(__name__)
+
+
+def _version_key(user_id):
+    return f"expenses:data-version:{user_id}"
+
+
+def _written_key(user_id):
+    return f"expenses:recent-write:{user_id}"
+
+
+def get_data_version(user_id):
+    """Return the version of the user's expense data."""
+    key = _version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, 1, timeout=None)
+        version = cache.get(key, 1)
+    return version
+
+
+def bump_data_version(user_id):
+    """Bump the user's data version so values cached for older data are not served again."""
+    key = _version_key(user_id)
+    if not cache.add(key, 2, timeout=None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 2, timeout=None)
+    # A replica may not have the new data yet; see routers.analytics_db.
+    cache.set(_written_key(user_id), True, timeout=settings.DATABASE_REPLICA_LAG)
+
+
+def has_recent_write(user_id):
+    """Return whether the user's data changed within the last DATABASE_REPLICA_LAG seconds."""
+    return cache.get(_written_key(user_id)) is not None
+
+
+def user_cache_key(user_id, name, *parts):
+    """Build a cache key for a value derived from the user's expense data."""
+    suffix = ":".join(str(part) for part in parts)
+    return f"expenses:{user_id}:v{get_data_version(user_id)}:{name}:{suffix}"
+
+
+def get_or_compute(key, compute, timeout=None):
+    """
+    Get a cached value, computing and storing it on a miss.
+
+    Only the caller that takes the key's lock computes the value; the others poll for it
+    for up to ANALYTICS_CACHE_LOCK_TIMEOUT seconds and then compute it themselves.
+    `compute` must not return None.
+    """
+    value = cache.get(key)
+    if value is not None:
+        return value
+
+    timeout = timeout or settings.ANALYTICS_CACHE_TIMEOUT
+    lock_timeout = settings.ANALYTICS_CACHE_LOCK_TIMEOUT
+    lock_key = f"{key}:lock"
+    if cache.add(lock_key, 1, timeout=lock_timeout):
+        try:
+            value = compute()
+            cache.set(key, value, timeout=timeout)
+        finally:
+            cache.delete(lock_key)
+        return value
+
+    deadline = time.monotonic() + lock_timeout
+    delay = 0.05
+    while time.monotonic() < deadline:
+        time.sleep(delay)
+        value = cache.get(key)
+        if value is not None:
+            return value
+        delay = min(delay * 2, 0.5)
+    log.warning(f"Timed out waiting for {key} to be computed, computing it again")
+    value = compute()
+    cache.set(key, value, timeout=timeout)
+    return value
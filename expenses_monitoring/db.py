@@ -0,0 +1,23 @@
+"""
+Per-connection database tuning.
+
+SQLite keeps most settings per connection, so the pragmas in SQLITE_PRAGMAS are applied whenever
+Django opens a connection, or SQLITE_READ_ONLY_PRAGMAS on a read-only one; PostgreSQL needs nothing here.
+"""
+
+from django.conf import settings
+
+
+def is_read_only(connection):
+    """Return whether a SQLite connection opens its file with mode=ro."""
+    return "mode=ro" in str(connection.settings_dict["NAME"])
+
+
+def configure_connection(sender, connection, **kwargs):
+    """`connection_created` receiver applying the SQLite pragmas to new SQLite connections."""
+    if connection.vendor != "sqlite":
+        return
+    pragmas = settings.SQLITE_READ_ONLY_PRAGMAS if is_read_only(connection) else settings.SQLITE_PRAGMAS
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
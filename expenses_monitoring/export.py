@@ -0,0 +1,126 @@
+"""
+Streaming export of a user's expenses.
+
+Rows are read with `QuerySet.iterator`, merged in time order with the archived expenses, and
+encoded one at a time into output chunks of about EXPORT_CHUNK_SIZE bytes, optionally
+gzip-compressed on the fly, so memory use does not grow with the size of the history and the
+first bytes are sent right away.
+"""
+
+import csv
+import heapq
+import json
+import zlib
+from datetime import datetime, timezone
+
+from django.utils.timezone import localtime
+
+from expenses_monitoring.archive import read_archive
+from expenses_monitoring.models import CashType, Category, Expense
+from expenses_monitoring.money import Money
+from expenses_monitoring.routers import analytics_db
+
+EXPORT_FORMATS = ("csv", "ndjson")
+EXPORT_FIELDS = ["id", "timestamp", "date", "description", "category", "mcc", "amount", "currency", "hold"]
+EXPORT_CHUNK_SIZE = 64 * 1024
+EXPORT_QUERY_CHUNK_SIZE = 2000
+
+
+class _Echo:
+    """File-like object whose `write` returns the written value, so csv.writer encodes a single row."""
+
+    def write(self, value):
+        return value
+
+
+def iter_export_rows(user, from_time=None, to_time=None):
+    """Yield the user's expenses with from_time <= timestamp < to_time as dictionaries, oldest first."""
+    using = analytics_db(user.id)
+    expenses = Expense.objects.using(using).filter(user=user)
+    if from_time is not None:
+        expenses = expenses.filter(timestamp__gte=from_time)
+    if to_time is not None:
+        expenses = expenses.filter(timestamp__lt=to_time)
+    columns = ["id", "timestamp", "description", "category__name", "mcc", "amount", "cash_type__name", "hold"]
+    rows = expenses.order_by("timestamp", "id").values_list(*columns).iterator(chunk_size=EXPORT_QUERY_CHUNK_SIZE)
+    segments = read_archive(user.id, from_time, to_time)
+    if segments:
+        rows = heapq.merge(_iter_archived_rows(segments, using), rows, key=lambda row: (row[1], row[0]))
+    for expense_id, timestamp, description, category, mcc, amount, currency, hold in rows:
+        yield {
+            "id": expense_id,
+            "timestamp": timestamp,
+            # In TIME_ZONE, like the day bounds of the range and the ledger.
+            "date": localtime(datetime.fromtimestamp(timestamp, timezone.utc)).strftime("%Y-%m-%d %H:%M:%S"),
+            "description": description,
+            "category": category,
+            "mcc": mcc,
+            # Exact decimal string in major units, e.g. "123.45".
+            "amount": Money(amount, currency).format(),
+            "currency": currency,
+            "hold": hold,
+        }
+
+
+def _iter_archived_rows(segments, using):
+    """Yield archived expenses as rows of the export query, ordered by (timestamp, id)."""
+    categories = dict(Category.objects.using(using).values_list("id", "name"))
+    currencies = dict(CashType.objects.using(using).values_list("id", "name"))
+    columns = ["id", "timestamp", "description", "category", "mcc", "amount", "cash_type", "hold"]
+    rows = heapq.merge(*(segment.rows(*columns) for segment in segments), key=lambda row: (row[1], row[0]))
+    for expense_id, timestamp, description, category_id, mcc, amount, cash_type_id, hold in rows:
+        yield expense_id, timestamp, description, categories[category_id], mcc, amount, currencies[cash_type_id], hold
+
+
+def encode_csv(rows):
+    """Encode rows as CSV lines, starting with a header."""
+    writer = csv.DictWriter(_Echo(), fieldnames=EXPORT_FIELDS)
+    yield writer.writeheader()
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def encode_ndjson(rows):
+    """Encode rows as newline-delimited JSON."""
+    for row in rows:
+        yield json.dumps(row, ensure_ascii=False) + "\n"
+
+
+def buffer_chunks(lines, size=EXPORT_CHUNK_SIZE):
+    """Join encoded lines into UTF-8 chunks of about `size` bytes."""
+    buffer = []
+    buffered = 0
+    for line in lines:
+        data = line.encode("utf-8")
+        buffer.append(data)
+        buffered += len(data)
+        if buffered >= size:
+            yield b"".join(buffer)
+            buffer = []
+            buffered = 0
+    if buffer:
+        yield b"".join(buffer)
+
+
+def gzip_chunks(chunks):
+    """Compress a stream of byte chunks into one gzip stream."""
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_expenses(user, export_format, from_time=None, to_time=None, compress=False):
+    """
+    Stream the user's expenses as CSV or NDJSON.
+    Returns:
+        An iterator of byte chunks.
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format {export_format}")
+    rows = iter_export_rows(user, from_time, to_time)
+    lines = encode_csv(rows) if export_format == "csv" else encode_ndjson(rows)
+    chunks = buffer_chunks(lines)
+    return gzip_chunks(chunks) if compress else chunks
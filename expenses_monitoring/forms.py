@@ -12,6 +12,7 @@ from django.core.validators import (
 )
 
 from .models import BankConnection, Consultation, Goal
+from .money import to_minor
 
 
 class RegisterForm(UserCreationForm):
@@ -93,22 +94,33 @@ class ConsultationForm(forms.ModelForm):
 
 
 class GoalForm(forms.ModelForm):
+    # Entered in major units; stored in minor units of the selected currency.
+    amount = forms.DecimalField(
+        max_digits=15,
+        decimal_places=2,
+        label="Введіть бажану суму для досягнення цілі",
+        widget=forms.NumberInput(attrs={"placeholder": "Введіть суму"}),
+    )
+
     class Meta:
         model = Goal
         fields = ["description", "amount", "cash_type", "date"]
         widgets = {
             "date": forms.DateInput(attrs={"type": "date"}),
-            "amount": forms.NumberInput(attrs={"placeholder": "Введіть суму"}),
             "description": forms.TextInput(attrs={"placeholder": "Введіть ціль"}),
             "cash_type": forms.Select(),
         }
         labels = {
             "description": "Введіть ціль",
-            "amount": "Введіть бажану суму для досягнення цілі",
             "cash_type": "Виберіть тип коштів",
             "date": "Виберіть дату",
         }
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.instance.pk:
+            self.initial["amount"] = self.instance.money.major
+
     def clean_date(self):
         selected_date = self.cleaned_data["date"]
         if selected_date < date.today():
@@ -121,6 +133,14 @@ class GoalForm(forms.ModelForm):
             raise ValidationError("Сума не може бути від'ємною.")
         return amount
 
+    def clean(self):
+        cleaned_data = super().clean()
+        amount = cleaned_data.get("amount")
+        cash_type = cleaned_data.get("cash_type")
+        if amount is not None and cash_type is not None:
+            cleaned_data["amount"] = to_minor(amount, cash_type.name)
+        return cleaned_data
+
 
 class BankConnectionForm(forms.ModelForm):
     api_key = forms.CharField(
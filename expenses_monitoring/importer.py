@@ -0,0 +1,155 @@
+import gzip
+import json
+import logging
+import os
+import random
+import time
+
+from django.db import OperationalError
+from django.utils import timezone
+
+from exp_d import settings
+from expenses_monitoring.lib import expense_from_transaction, submit_ingest_batch
+from expenses_monitoring.models import CashType, CustomUser, StatementImport
+
+log = logging.getLogger(__name__)
+
+STATEMENT_SUFFIXES = (".json", ".json.gz", ".ndjson", ".ndjson.gz")
+WRITE_RETRIES = 10
+
+
+def open_statement_file(path):
+    """Open a statement file as text, transparently decompressing gzip'd files."""
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    return open(path, "r", encoding="utf-8")
+
+
+def iter_json_items(f, chunk_size=64 * 1024):
+    """
+    Stream the items of a JSON array, or of newline-delimited JSON, without loading the whole file.
+    Only one chunk and the item being decoded are held in memory.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    position = 0
+    in_array = None
+    eof = False
+
+    while True:
+        # Skip whitespace and array punctuation between items.
+        while True:
+            while position < len(buffer) and buffer[position] in " \t\r\n,":
+                position += 1
+            if position < len(buffer) or eof:
+                break
+            buffer, position = f.read(chunk_size), 0
+            eof = not buffer
+        if position >= len(buffer):
+            return
+        if in_array is None:
+            in_array = buffer[position] == "["
+            if in_array:
+                position += 1
+                continue
+        if in_array and buffer[position] == "]":
+            return
+
+        try:
+            item, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            chunk = f.read(chunk_size)
+            eof = not chunk
+            buffer, position = buffer[position:] + chunk, 0
+            continue
+        yield item
+        position = end
+
+
+def find_statement_files(root):
+    """
+    Find statement files under `root`, laid out as <root>/<username>/**/<file>.
+    Returns:
+        A sorted list of (username, path) tuples.
+    """
+    found = []
+    if not os.path.isdir(root):
+        return found
+    for username in sorted(os.listdir(root)):
+        user_directory = os.path.join(root, username)
+        if not os.path.isdir(user_directory):
+            continue
+        for directory, _, files in os.walk(user_directory):
+            for file in files:
+                if file.endswith(STATEMENT_SUFFIXES):
+                    found.append((username, os.path.join(directory, file)))
+    return sorted(found)
+
+
+def import_statement_file(username, path, batch_size=None):
+    """
+    Import one statement file for a user in fixed-size transactional batches.
+
+    Progress is checkpointed in the same transaction as every batch, so an interrupted
+    import resumes after the last committed batch. A file that changed since its last
+    import is imported again from the start.
+    Returns:
+        A tuple of the path and the number of statement items read in this run.
+    """
+    batch_size = batch_size or settings.EXPENSE_UPSERT_BATCH_SIZE
+    user = CustomUser.objects.get(username=username)
+    cash_type = CashType.objects.get(name="UAH")
+    stat = os.stat(path)
+    checkpoint, _ = StatementImport.objects.get_or_create(path=path, defaults={"user": user})
+    if checkpoint.size != stat.st_size or checkpoint.modified != int(stat.st_mtime):
+        checkpoint.user = user
+        checkpoint.size = stat.st_size
+        checkpoint.modified = int(stat.st_mtime)
+        checkpoint.items_done = 0
+        checkpoint.completed = False
+        checkpoint.save()
+    if checkpoint.completed:
+        return path, 0
+
+    read = 0
+    batch = []
+    with open_statement_file(path) as f:
+        items = iter_json_items(f)
+        for index, txn in enumerate(items):
+            if index < checkpoint.items_done:
+                continue
+            batch.append(txn)
+            if len(batch) >= batch_size:
+                _write_batch(checkpoint, user, cash_type, batch)
+                read += len(batch)
+                batch = []
+    _write_batch(checkpoint, user, cash_type, batch, completed=True)
+    read += len(batch)
+    log.info(f"Imported {read} statement items from {path}")
+    return path, read
+
+
+def _write_batch(checkpoint, user, cash_type, batch, completed=False):
+    """
+    Upsert one batch and advance the file's checkpoint in a single transaction, through the ingest writer.
+    When batches are written inline, SQLite lets one writer in at a time, so a batch that loses
+    the write lock to another worker is rolled back and retried.
+    """
+    expenses = [expense for expense in (expense_from_transaction(user, txn, cash_type) for txn in batch) if expense]
+    for attempt in range(WRITE_RETRIES):
+        try:
+            fields = {
+                "items_done": checkpoint.items_done + len(batch),
+                "completed": completed,
+                "updated_at": timezone.now(),
+            }
+            submit_ingest_batch(expenses, [("expenses_monitoring.StatementImport", {"id": checkpoint.id}, fields)])
+            break
+        except OperationalError as e:
+            if "locked" not in str(e) or attempt == WRITE_RETRIES - 1:
+                raise
+            time.sleep(random.uniform(0, 0.1 * 2**attempt))
+    checkpoint.items_done += len(batch)
+    checkpoint.completed = completed
@@ -0,0 +1,158 @@
+"""
+Buffer of expense batches waiting for the ingest writer.
+
+SQLite lets one connection write at a time, so with INGEST_WRITER on, syncs, backfills and
+imports do not write expenses themselves: they push normalized batches onto a Redis list and a
+single writer (`tasks.flush_ingest_buffer`, run on the ingest queue by a worker with concurrency 1)
+coalesces them into transactions of about INGEST_BATCH_SIZE expenses, at most INGEST_MAX_DELAY
+seconds after they arrive. Batches move to a processing list while they are written and are only
+dropped once their transaction committed, so a writer that dies mid-flush leaves them to the next one.
+
+The next flush retries such batches one at a time and moves a batch that failed INGEST_MAX_ATTEMPTS
+times to a dead-letter list, so one bad batch cannot block the buffer. Producers wait while
+INGEST_MAX_PENDING batches are pending, so a slow writer slows the syncs down instead of filling Redis.
+"""
+
+import hashlib
+import json
+import logging
+import time
+from functools import lru_cache
+
+import redis
+from celery import current_app
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+
+from expenses_monitoring.models import Expense
+
+log = logging.getLogger(__name__)
+
+INGEST_QUEUE = "ingest"
+PENDING_KEY = "ingest:pending"
+PROCESSING_KEY = "ingest:processing"
+DEAD_KEY = "ingest:dead"
+ATTEMPTS_KEY = "ingest:attempts"
+EXPENSE_FIELDS = (
+    "user_id",
+    "amount",
+    "cash_type_id",
+    "timestamp",
+    "description",
+    "mcc",
+    "category_id",
+    "provider",
+    "external_id",
+    "hold",
+)
+
+
+class IngestBufferFull(Exception):
+    """The buffer stayed at INGEST_MAX_PENDING batches for INGEST_PUSH_TIMEOUT seconds."""
+
+
+@lru_cache(maxsize=None)
+def get_buffer():
+    """Return the Redis client of the ingest buffer (INGEST_BUFFER_URL)."""
+    return redis.Redis.from_url(settings.INGEST_BUFFER_URL)
+
+
+def encode_batch(expenses, updates=()):
+    """Encode unsaved expenses and (model label, lookup, fields) row updates as JSON."""
+    return json.dumps(
+        {
+            "expenses": [{field: getattr(expense, field) for field in EXPENSE_FIELDS} for expense in expenses],
+            "updates": list(updates),
+        },
+        cls=DjangoJSONEncoder,
+    )
+
+
+def decode_batch(data):
+    """
+    Decode a batch encoded by `encode_batch`.
+    Returns:
+        A tuple of a list of unsaved expenses and a list of row updates; dates in the updates are ISO strings.
+    """
+    batch = json.loads(data)
+    return [Expense(**row) for row in batch["expenses"]], [tuple(update) for update in batch["updates"]]
+
+
+def push_batch(expenses, updates=()):
+    """
+    Append a batch to the buffer and make sure a flush is due.
+    While INGEST_MAX_PENDING batches are pending the producer waits for the writer to catch up.
+    Raises:
+        IngestBufferFull if it is still full after INGEST_PUSH_TIMEOUT seconds.
+    """
+    buffer = get_buffer()
+    deadline = time.monotonic() + settings.INGEST_PUSH_TIMEOUT
+    delay = 0.05
+    while buffer.llen(PENDING_KEY) >= settings.INGEST_MAX_PENDING:
+        schedule_flush()
+        if time.monotonic() >= deadline:
+            raise IngestBufferFull(f"{settings.INGEST_MAX_PENDING} ingest batches are pending")
+        time.sleep(delay)
+        delay = min(delay * 2, 1)
+    buffer.rpush(PENDING_KEY, encode_batch(expenses, updates))
+    schedule_flush()
+
+
+def schedule_flush():
+    """Queue a flush of the buffer unless one is already due within INGEST_MAX_DELAY."""
+    if not cache.add("ingest-flush-scheduled", True, timeout=settings.INGEST_MAX_DELAY):
+        return
+    try:
+        # Sent by name: the task module imports lib, which pushes batches through this one.
+        current_app.send_task(
+            "expenses_monitoring.tasks.flush_ingest_buffer", countdown=settings.INGEST_MAX_DELAY, queue=INGEST_QUEUE
+        )
+    except Exception as e:
+        # Batches stay buffered and are picked up by the next flush.
+        log.error(f"Failed to schedule ingest flush: {e}")
+
+
+def _digest(data):
+    return hashlib.sha1(data).hexdigest()
+
+
+def claim_batches(max_expenses):
+    """
+    Move batches from the pending to the processing list until they hold at least `max_expenses`
+    expenses or none are left.
+
+    Batches left in processing by a failed flush are claimed first and alone, counting their failures;
+    one that failed INGEST_MAX_ATTEMPTS times is moved to the dead-letter list instead.
+    Returns:
+        A list of (encoded, decoded) batches, oldest first, to pass to `release_batches` once written.
+    """
+    buffer = get_buffer()
+    while True:
+        leftover = buffer.lrange(PROCESSING_KEY, 0, 0)
+        if not leftover:
+            break
+        # Every batch found here has failed once more.
+        failures = buffer.hincrby(ATTEMPTS_KEY, _digest(leftover[0]), 1)
+        if failures < settings.INGEST_MAX_ATTEMPTS:
+            return [(leftover[0], decode_batch(leftover[0]))]
+        buffer.lmove(PROCESSING_KEY, DEAD_KEY, "LEFT", "RIGHT")
+        buffer.hdel(ATTEMPTS_KEY, _digest(leftover[0]))
+        log.error(f"Moved an ingest batch to {DEAD_KEY} after {failures} failed attempts")
+
+    batches = []
+    size = 0
+    while size < max_expenses:
+        data = buffer.lmove(PENDING_KEY, PROCESSING_KEY, "LEFT", "RIGHT")
+        if data is None:
+            break
+        batches.append((data, decode_batch(data)))
+        size += len(batches[-1][1][0])
+    return batches
+
+
+def release_batches(batches):
+    """Drop claimed batches once they are committed; they are the head of the processing list."""
+    buffer = get_buffer()
+    buffer.ltrim(PROCESSING_KEY, len(batches), -1)
+    buffer.hdel(ATTEMPTS_KEY, *(_digest(data) for data, _ in batches))
@@ -0,0 +1,158 @@
+"""
+Transaction ledger with keyset pagination.
+
+Pages are ordered newest first by (timestamp, id) and a page continues strictly after the
+(timestamp, id) of the previous page's last row, so every page is one range scan of the
+(user, timestamp, id) index no matter how deep the user has scrolled; there is no OFFSET or COUNT.
+Archived expenses are merged in: every archive segment is read backwards from the cursor, a chunk
+at a time, until it has a page of matching rows.
+"""
+
+import base64
+import binascii
+from collections import namedtuple
+
+import numpy as np
+from django.db.models import Q
+
+from expenses_monitoring.archive import ARCHIVE_COLUMNS, ARCHIVE_FIELDS, ARCHIVE_READ_CHUNK_SIZE, read_archive
+from expenses_monitoring.models import CashType, Category, Expense
+from expenses_monitoring.money import get_exponent
+from expenses_monitoring.routers import analytics_db
+
+LEDGER_PAGE_SIZE = 50
+LEDGER_MAX_PAGE_SIZE = 200
+
+# The expenses queryset and the archive segments matching the ledger filters; the segments'
+# rows still have to be checked against `category_ids`, `min_amount` and `max_amount`.
+Ledger = namedtuple("Ledger", ["user_id", "expenses", "segments", "category_ids", "min_amount", "max_amount"])
+
+
+def encode_cursor(timestamp, expense_id):
+    """Encode the position after an expense as an opaque cursor."""
+    return base64.urlsafe_b64encode(f"{timestamp}:{expense_id}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """
+    Decode a cursor made by `encode_cursor`.
+    Raises:
+        ValueError if the cursor is malformed.
+    """
+    try:
+        decoded = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        timestamp, expense_id = decoded.split(":")
+        return int(timestamp), int(expense_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError(f"Invalid cursor {cursor!r}")
+
+
+def filter_ledger(user, category_ids=None, min_amount=None, max_amount=None, from_time=None, to_time=None):
+    """
+    Get the user's expenses matching the ledger filters, newest first.
+    Amounts are in minor units and both amount bounds are inclusive; from_time <= timestamp < to_time.
+    Returns:
+        A Ledger to page with `get_ledger_page`.
+    """
+    expenses = Expense.objects.using(analytics_db(user.id)).filter(user=user)
+    if category_ids:
+        expenses = expenses.filter(category_id__in=category_ids)
+    if min_amount is not None:
+        expenses = expenses.filter(amount__gte=min_amount)
+    if max_amount is not None:
+        expenses = expenses.filter(amount__lte=max_amount)
+    if from_time is not None:
+        expenses = expenses.filter(timestamp__gte=from_time)
+    if to_time is not None:
+        expenses = expenses.filter(timestamp__lt=to_time)
+    expenses = expenses.select_related("cash_type", "category").order_by("-timestamp", "-id")
+    segments = read_archive(user.id, from_time, to_time)
+    return Ledger(user.id, expenses, segments, category_ids, min_amount, max_amount)
+
+
+def get_ledger_page(ledger, cursor=None, limit=LEDGER_PAGE_SIZE):
+    """
+    Get one page of a ledger from `filter_ledger`.
+    Returns:
+        A tuple of the page's expenses and the cursor of the next page, None on the last page.
+    """
+    expenses = ledger.expenses
+    position = decode_cursor(cursor) if cursor else None
+    if position:
+        timestamp, expense_id = position
+        # The redundant timestamp bound gives the planner a single index range to scan.
+        expenses = expenses.filter(Q(timestamp__lt=timestamp) | Q(id__lt=expense_id), timestamp__lte=timestamp)
+    page = list(expenses[: limit + 1])
+    if ledger.segments:
+        ids = {expense.id for expense in page}
+        archived = [
+            expense for expense in _get_archived_page(ledger, position, limit + 1, expenses.db) if expense.id not in ids
+        ]
+        page = sorted(page + archived, key=lambda expense: (expense.timestamp, expense.id), reverse=True)
+    if len(page) <= limit:
+        return page, None
+    page = page[:limit]
+    return page, encode_cursor(page[-1].timestamp, page[-1].id)
+
+
+def _match_archived(ledger, segment, start, end):
+    mask = np.ones(end - start, dtype=bool)
+    if ledger.category_ids:
+        mask &= np.isin(segment["category"][start:end], ledger.category_ids)
+    if ledger.min_amount is not None:
+        mask &= segment["amount"][start:end] >= ledger.min_amount
+    if ledger.max_amount is not None:
+        mask &= segment["amount"][start:end] <= ledger.max_amount
+    return mask
+
+
+def _get_archived_page(ledger, position, size, using):
+    """
+    Get the newest `size` archived expenses of a ledger before a (timestamp, id) position.
+    Returns:
+        Unsaved Expense instances, newest first.
+    """
+    found = []
+    for segment in ledger.segments:
+        end = len(segment)
+        if position:
+            # Rows are ordered by (timestamp, id), so the rows before the position are a prefix.
+            timestamp, expense_id = position
+            ties = np.searchsorted(segment["timestamp"], [timestamp, timestamp + 1])
+            end = int(ties[0] + np.searchsorted(segment["id"][ties[0] : ties[1]], expense_id))
+        rows = []
+        while end > 0 and len(rows) < size:
+            start = max(end - ARCHIVE_READ_CHUNK_SIZE, 0)
+            rows.extend(start + np.flatnonzero(_match_archived(ledger, segment, start, end))[::-1])
+            end = start
+        found.extend((int(segment["timestamp"][row]), int(segment["id"][row]), segment, row) for row in rows[:size])
+    found = sorted(found, key=lambda item: item[:2], reverse=True)[:size]
+    if not found:
+        return []
+
+    categories = Category.objects.using(using).in_bulk()
+    cash_types = CashType.objects.using(using).in_bulk()
+    expenses = []
+    for _, _, segment, row in found:
+        values = dict(zip(ARCHIVE_FIELDS, next(segment.take([row]).rows(*ARCHIVE_COLUMNS))))
+        expense = Expense(user_id=ledger.user_id, **values)
+        expense.category = categories[expense.category_id]
+        expense.cash_type = cash_types[expense.cash_type_id]
+        expenses.append(expense)
+    return expenses
+
+
+def serialize_expense(expense):
+    """Represent an expense for the ledger API; the amount is in minor units."""
+    return {
+        "id": expense.id,
+        "timestamp": expense.timestamp,
+        "date": expense.readable_date,
+        "description": expense.description,
+        "category": expense.category.name,
+        "mcc": expense.mcc,
+        "amount": expense.amount,
+        "currency": expense.cash_type.name,
+        "minor_units": get_exponent(expense.cash_type.name),
+        "hold": expense.hold,
+    }
@@ -1,95 +1,593 @@
-import json
+import heapq
 import logging
 import os
-import time
+import secrets
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import partial
+from itertools import islice
 from datetime import datetime, timedelta, timezone
 
 import requests
+from django.apps import apps
 from django.db import transaction
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-from reportlab.pdfgen import canvas
+from django.db.models import F, Q
+from django.urls import reverse
 
 from exp_d import settings
-from exp_d.settings import MMC
-from expenses_monitoring.models import CashType, Expense, Account
+from expenses_monitoring.models import (
+    Account,
+    BackfillWindow,
+    BankConnection,
+    CashType,
+    Category,
+    Expense,
+    MerchantCategoryCode,
+    UserSync,
+    WebhookEvent,
+)
+from expenses_monitoring import ingest, monobank
+from expenses_monitoring.archive import drop_archived
+from expenses_monitoring.cache import bump_data_version
+from expenses_monitoring.money import Money
+from expenses_monitoring.rollups import get_local_date, refresh_daily_rollups
 
 log = logging.getLogger(__name__)
 
 
-def fetch_and_update_expenses(user, from_time, to_time):
-    """Fetch and update expenses from the MonoBank API."""
+STATEMENT_PAGE_SIZE = 500
+# Monobank serves statements for at most 31 days + 1 hour per request.
+STATEMENT_MAX_WINDOW = 31 * 24 * 60 * 60 + 60 * 60
 
-    accounts = user.accounts
-    base_url = "https://api.monobank.ua/personal/statement"
-    max_retries = 5
-    retry_delay = 61
+StatementRequest = namedtuple("StatementRequest", ["account", "from_time", "to_time", "page"])
 
-    expenses_to_create = []
-    for account in accounts:
-        log.info(f"Fetching transactions for account {account}")
-        current_to_time = to_time
 
-        while True:
-            for attempt in range(max_retries):
+def split_time_window(from_time, to_time, max_window=STATEMENT_MAX_WINDOW):
+    """
+    Split a time range into consecutive windows accepted by the statement endpoint.
+    Returns:
+        A list of (from_time, to_time) tuples, newest window first.
+    """
+    windows = []
+    window_end = to_time
+    while window_end > from_time:
+        window_start = max(from_time, window_end - max_window)
+        windows.append((window_start, window_end))
+        window_end = window_start
+    return windows
+
+
+def plan_statement_requests(account_windows):
+    """
+    Plan the first page request for every (account, from_time, to_time) range.
+    Follow-up pages are only known once the previous page arrives, so they are scheduled by the fetcher.
+    """
+    plan = []
+    for account, from_time, to_time in account_windows:
+        for window_start, window_end in split_time_window(from_time, to_time):
+            plan.append(StatementRequest(account, window_start, window_end, 0))
+    return plan
+
+
+def fetch_statements(api_key, plan, max_workers=None):
+    """
+    Run planned statement requests concurrently through the MonoBank client.
+
+    Yields (request, transactions) for every page as soon as it arrives,
+    and (request, None) for a request that failed for good.
+    """
+    max_workers = max_workers or settings.MONOBANK_FETCH_WORKERS
+
+    def submit(request):
+        future = executor.submit(monobank.get_statement, api_key, request.account, request.from_time, request.to_time)
+        pending[future] = request
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = {}
+        for request in plan:
+            submit(request)
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                request = pending.pop(future)
                 try:
-                    time.sleep(retry_delay)
-                    url = f"{base_url}/{account}/{from_time}/{current_to_time}"
-                    response = requests.get(url, headers={"X-Token": user.api_key})
-                    log.info(f"Response: {response}")
-                    response.raise_for_status()
-                    break
-                except requests.exceptions.HTTPError as e:
-                    if response.status_code == 429:
-                        log.warning(f"Received 429 Too Many Requests. Retrying in {retry_delay} seconds...")
-                        time.sleep(retry_delay)
-                        retry_delay *= 2
-                    else:
-                        log.error(f"HTTP error occurred: {e}")
-                        continue
-                except requests.exceptions.RequestException as e:
-                    log.error(f"Error occurred: {e}")
+                    transactions = future.result()
+                except requests.RequestException as e:
+                    log.error(f"Failed to fetch {request}: {e}")
+                    yield request, None
                     continue
 
-            transactions = response.json()
-            log.info(f"Transactions: {transactions}")
+                yield request, transactions
 
-            if not transactions:
-                break
+                if len(transactions) >= STATEMENT_PAGE_SIZE:
+                    # Always move backwards, even if the whole page shares one timestamp; items at the
+                    # boundary that come again are deduplicated by the upsert.
+                    to_time = min(transactions[-1]["time"], request.to_time - 1)
+                    submit(StatementRequest(request.account, request.from_time, to_time, request.page + 1))
 
-            for txn in transactions:
-                if txn["amount"] < 0:
-                    expenses_to_create.append(
-                        Expense(
-                            user=user,
-                            amount=abs(txn["amount"] / 100.0),
-                            cash_type=CashType.objects.get(name="UAH"),
-                            timestamp=txn["time"],
-                            description=txn["description"],
-                            expense_type=MMC.get(str(txn["mcc"])),
-                        )
-                    )
 
-            if len(transactions) < 500:
-                break
+def get_account_bounds(account, to_time=None):
+    """
+    Get the time bounds of the next incremental sync for an account.
+    Returns:
+        A tuple of two integers: the account's sync cursor (or the start of the current month
+        for an account that was never synced) and the end of the window.
+    """
+    to_time = to_time or int(datetime.now().timestamp())
+    if account.last_synced_time is None:
+        from_time, _ = get_current_month_time_bounds()
+    else:
+        from_time = account.last_synced_time
+    return from_time, to_time
 
-            current_to_time = transactions[-1]["time"]
 
-        log.info(f"Expenses to create: {expenses_to_create}")
+def get_account_windows(accounts, from_time=None, to_time=None):
+    """
+    Get the (account_id, from_time, to_time) range to fetch for every account.
+    Without explicit bounds every account is synced incrementally from its own cursor.
+    """
+    if from_time is None:
+        return [(account.account_id, *get_account_bounds(account, to_time)) for account in accounts]
+    return [(account.account_id, from_time, to_time) for account in accounts]
 
-    if expenses_to_create:
-        Expense.objects.bulk_create(expenses_to_create)
-        log.info(f"Expenses updated for user {user.username}")
+
+def fetch_account_transactions(api_key, account_windows):
+    """
+    Fetch the statement items of every account range.
+    Returns:
+        A dict mapping account id to {"transactions": [...], "failed": bool}.
+    """
+    plan = plan_statement_requests(account_windows)
+    log.info(f"Planned {len(plan)} statement requests")
+    results = {account_id: {"transactions": [], "failed": False} for account_id, _, _ in account_windows}
+    for request, transactions in fetch_statements(api_key, plan):
+        if transactions is None:
+            results[request.account]["failed"] = True
+            continue
+        log.info(f"Fetched {len(transactions)} transactions for account {request.account}, page {request.page}")
+        results[request.account]["transactions"].extend(transactions)
+    return results
+
+
+def store_account_transactions(user, results, sync_status=None):
+    """
+    Upsert fetched statement items as expenses and move every account's sync cursor
+    to its newest statement item. Accounts with a failed request keep their cursor
+    so the gap is fetched again next time. With `sync_status`, the user's sync is
+    finished with that status once the expenses are written.
+    """
+    cash_type = CashType.objects.get(name="UAH")
+    now = datetime.now(timezone.utc)
+    accounts = list(Account.objects.filter(user=user, account_id__in=results))
+    expenses = []
+    for account in accounts:
+        result = results[account.account_id]
+        if result["failed"]:
+            account.sync_status = Account.SyncStatus.FAILED
+            continue
+        cursor = (account.last_synced_id, account.last_synced_time)
+        for txn in result["transactions"]:
+            if (txn.get("id"), txn["time"]) == cursor:
+                continue
+            if txn["time"] > (account.last_synced_time or 0):
+                account.last_synced_time, account.last_synced_id = txn["time"], txn.get("id", "")
+            expense = expense_from_transaction(user, txn, cash_type)
+            if expense is not None:
+                expenses.append(expense)
+        account.sync_status = Account.SyncStatus.OK
+        account.last_synced_at = now
+
+    updates = [
+        (
+            "expenses_monitoring.Account",
+            {"id": account.id},
+            {
+                "last_synced_time": account.last_synced_time,
+                "last_synced_id": account.last_synced_id,
+                "sync_status": account.sync_status,
+                "last_synced_at": account.last_synced_at,
+            },
+        )
+        for account in accounts
+    ]
+    if sync_status is not None:
+        updates.append(("expenses_monitoring.UserSync", {"user_id": user.id}, get_sync_status_fields(sync_status)))
+    submit_ingest_batch(expenses, updates)
+    log.info(f"Submitted {len(expenses)} expenses for user {user.username}")
+
+
+def fetch_and_update_expenses(user, from_time=None, to_time=None):
+    """
+    Fetch and update expenses from the MonoBank API.
+
+    Without explicit bounds every account is synced incrementally from its own cursor.
+    """
+    accounts = Account.objects.filter(user=user)
+    account_windows = get_account_windows(accounts, from_time, to_time)
+    accounts.update(sync_status=Account.SyncStatus.RUNNING)
+    results = fetch_account_transactions(user.api_key, account_windows)
+    store_account_transactions(user, results)
+
+
+def sync_account(account):
+    """
+    Fetch and store the delta since a single account's cursor. The caller holds the user's sync,
+    which finishes once the expenses are stored.
+    """
+    user = account.user
+    results = fetch_account_transactions(user.api_key, get_account_windows([account]))
+    failed = any(result["failed"] for result in results.values())
+    store_account_transactions(user, results, UserSync.Status.FAILED if failed else UserSync.Status.DONE)
+
+
+def plan_backfill(account, from_time, to_time):
+    """
+    Split an account's history range into statement windows and persist them.
+    Planning is idempotent: windows that already exist keep their status and checkpoint.
+    Returns:
+        The windows of the range that are not done yet, newest first.
+    """
+    windows = [
+        BackfillWindow(account=account, from_time=window_start, to_time=window_end, checkpoint_time=window_end)
+        for window_start, window_end in split_time_window(from_time, to_time)
+    ]
+    BackfillWindow.objects.bulk_create(windows, ignore_conflicts=True)
+    return list(
+        BackfillWindow.objects.filter(account=account, from_time__gte=from_time, to_time__lte=to_time)
+        .exclude(status=BackfillWindow.Status.DONE)
+        .order_by("-to_time")
+    )
+
+
+def run_backfill_window(window):
+    """
+    Fetch a backfill window page by page from its checkpoint.
+    Every page is handed to the ingest writer together with the moved checkpoint as soon as it arrives.
+    Returns:
+        False if the window is already done or another worker is running it.
+    """
+    now = datetime.now(timezone.utc)
+    claimed = (
+        BackfillWindow.objects.filter(id=window.id)
+        .exclude(status=BackfillWindow.Status.DONE)
+        .exclude(
+            status=BackfillWindow.Status.RUNNING,
+            updated_at__gt=now - timedelta(seconds=settings.SYNC_LOCK_TIMEOUT),
+        )
+        .update(status=BackfillWindow.Status.RUNNING, attempts=F("attempts") + 1, updated_at=now)
+    )
+    if not claimed:
+        log.info(f"Skipping {window}: done or running elsewhere")
+        return False
+    window.refresh_from_db()
+    user = window.account.user
+    cash_type = CashType.objects.get(name="UAH")
+
+    while window.status != BackfillWindow.Status.DONE:
+        transactions = monobank.get_statement(
+            user.api_key, window.account.account_id, window.from_time, window.checkpoint_time
+        )
+        expenses = [expense_from_transaction(user, txn, cash_type) for txn in transactions]
+        window.pages += 1
+        window.items += len(transactions)
+        fields = {"updated_at": datetime.now(timezone.utc)}
+        if len(transactions) < STATEMENT_PAGE_SIZE:
+            window.status = BackfillWindow.Status.DONE
+            # A failed attempt's status is only overwritten once the window is done, so it can be retried.
+            fields.update(status=window.status, error="")
+        else:
+            # Always move backwards, even if the whole page shares one timestamp.
+            window.checkpoint_time = min(transactions[-1]["time"], window.checkpoint_time - 1)
+        fields.update(pages=window.pages, items=window.items, checkpoint_time=window.checkpoint_time)
+        submit_ingest_batch(
+            [expense for expense in expenses if expense is not None],
+            [("expenses_monitoring.BackfillWindow", {"id": window.id}, fields)],
+        )
+        log.info(f"Backfilled page {window.pages} of {window} with {len(transactions)} transactions")
+    return True
+
+
+def get_backfill_bounds(days=None):
+    """
+    Get the time bounds of a historical backfill.
+    Returns:
+        A tuple of two integers: `days` (BACKFILL_HISTORY_DAYS by default) ago and now.
+    """
+    days = days or settings.BACKFILL_HISTORY_DAYS
+    now = datetime.now(timezone.utc)
+    return int((now - timedelta(days=days)).timestamp()), int(now.timestamp())
+
+
+def plan_scheduled_syncs(now=None, limit=None):
+    """
+    Pick the accounts the fleet-wide scheduler should sync next.
+
+    Accounts are prioritised by staleness, weighted up for recently active users. Each token
+    gets at most one statement fetch per rate limit period; accounts that received a webhook event
+    since their connection's webhook was registered are only polled every
+    SCHEDULER_WEBHOOK_RECONCILE_INTERVAL, and users with a sync in flight are left alone.
+    Returns:
+        A list of (account, bank connection) pairs, most urgent first.
+    """
+    now = now or datetime.now(timezone.utc)
+    limit = limit or settings.SCHEDULER_MAX_FETCHES_PER_RUN
+    stale_before = now - timedelta(seconds=settings.SCHEDULER_MIN_STALENESS)
+    webhook_stale_before = now - timedelta(seconds=settings.SCHEDULER_WEBHOOK_RECONCILE_INTERVAL)
+    active_since = now - timedelta(days=settings.SCHEDULER_ACTIVE_USER_DAYS)
+
+    connections = {}
+    for connection in BankConnection.objects.filter(Q(next_fetch_at__isnull=True) | Q(next_fetch_at__lte=now)):
+        connections.setdefault(connection.user_id, connection)
+    busy_users = set(
+        UserSync.objects.filter(
+            status__in=[UserSync.Status.QUEUED, UserSync.Status.RUNNING], lock_expires_at__gt=now
+        ).values_list("user_id", flat=True)
+    )
+    accounts = Account.objects.select_related("user").filter(
+        Q(last_synced_at__isnull=True) | Q(last_synced_at__lt=stale_before), user_id__in=list(connections)
+    )
+
+    queue = []
+    for account in accounts:
+        connection = connections[account.user_id]
+        if account.user_id in busy_users:
+            continue
+        # A registered webhook only counts once the bank has actually delivered events for the account.
+        if (
+            connection.webhook_registered_at
+            and account.last_webhook_at
+            and account.last_webhook_at >= connection.webhook_registered_at
+            and account.last_synced_at
+            and account.last_synced_at > webhook_stale_before
+        ):
+            continue
+        staleness = (now - (account.last_synced_at or account.user.date_joined)).total_seconds()
+        if account.user.last_login and account.user.last_login > active_since:
+            staleness *= settings.SCHEDULER_ACTIVE_USER_WEIGHT
+        heapq.heappush(queue, (-staleness, account.id, account))
+
+    planned = []
+    used_connections = set()
+    while queue and len(planned) < limit:
+        _, _, account = heapq.heappop(queue)
+        connection = connections[account.user_id]
+        if connection.id in used_connections:
+            continue
+        used_connections.add(connection.id)
+        planned.append((account, connection))
+    return planned
+
+
+_category_ids = None
+
+
+def get_category_id(mcc):
+    """
+    Get the id of the category a merchant category code belongs to, or of the "Unknown" category.
+    The MCC table is small and static, so it is read once per process.
+    """
+    global _category_ids
+    if _category_ids is None:
+        category_ids = dict(MerchantCategoryCode.objects.values_list("code", "category_id"))
+        category_ids[None] = Category.objects.get_or_create(name=Category.UNKNOWN)[0].id
+        _category_ids = category_ids
+    return _category_ids.get(mcc, _category_ids[None])
+
+
+def expense_from_transaction(user, txn, cash_type):
+    """
+    Build an unsaved Expense from a Monobank statement item.
+    Returns:
+        The expense, or None for incoming transactions.
+    """
+    if txn["amount"] >= 0:
+        return None
+    return Expense(
+        user=user,
+        amount=-txn["amount"],
+        cash_type=cash_type,
+        timestamp=txn["time"],
+        description=txn["description"],
+        mcc=txn["mcc"],
+        category_id=get_category_id(txn["mcc"]),
+        external_id=txn.get("id"),
+        hold=txn.get("hold", False),
+    )
+
+
+def _batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def upsert_expenses(expenses, batch_size=None):
+    """
+    Write expenses idempotently, keyed on (user, provider, external_id).
+
+    Statement items that are already stored are ignored, except that a settled item
+    replaces a stored hold of the same transaction. Expenses without an external id
+    are always inserted. The daily rollups of the touched days are refreshed in the
+    same transaction as each batch, and the users' cached analytics are invalidated
+    once it commits.
+    Returns:
+        The number of expenses written or checked against existing rows.
+    """
+    batch_size = batch_size or settings.EXPENSE_UPSERT_BATCH_SIZE
+    written = 0
+    for batch in _batched(expenses, batch_size):
+        written += _upsert_expense_batch(batch)
+    return written
+
+
+def _upsert_expense_batch(batch):
+    # Re-fetched history that is already archived stays in the archive.
+    batch = drop_archived(batch)
+    unique = {}
+    anonymous = []
+    for expense in batch:
+        if not expense.external_id:
+            anonymous.append(expense)
+            continue
+        key = (expense.user_id, expense.provider, expense.external_id)
+        seen = unique.get(key)
+        # Keep one row per transaction, preferring the settled version over a hold.
+        if seen is None or (seen.hold and not expense.hold):
+            unique[key] = expense
+
+    # Days whose rollups change: every day written to, plus the days of the holds being replaced.
+    touched_days = {}
+    for expense in [*unique.values(), *anonymous]:
+        touched_days.setdefault(expense.user_id, set()).add(get_local_date(expense.timestamp))
+
+    settling = set()
+    settled_by_owner = {}
+    for (user_id, provider, external_id), expense in unique.items():
+        if not expense.hold:
+            settled_by_owner.setdefault((user_id, provider), []).append(external_id)
+    for (user_id, provider), external_ids in settled_by_owner.items():
+        held = Expense.objects.filter(user_id=user_id, provider=provider, external_id__in=external_ids, hold=True)
+        for external_id, timestamp in held.values_list("external_id", "timestamp"):
+            settling.add((user_id, provider, external_id))
+            touched_days[user_id].add(get_local_date(timestamp))
+
+    updates = [expense for key, expense in unique.items() if key in settling]
+    inserts = [expense for key, expense in unique.items() if key not in settling]
+    with transaction.atomic():
+        if updates:
+            Expense.objects.bulk_create(
+                updates,
+                update_conflicts=True,
+                unique_fields=["user", "provider", "external_id"],
+                update_fields=["amount", "timestamp", "description", "mcc", "category", "hold"],
+            )
+        if inserts:
+            Expense.objects.bulk_create(inserts, ignore_conflicts=True)
+        if anonymous:
+            Expense.objects.bulk_create(anonymous)
+        refresh_daily_rollups(touched_days)
+        for user_id in touched_days:
+            transaction.on_commit(partial(bump_data_version, user_id))
+    return len(unique) + len(anonymous)
+
+
+def submit_ingest_batch(expenses, updates=()):
+    """
+    Hand a batch of unsaved expenses to the ingest writer, with row updates to commit together with them.
+
+    `updates` is a list of (model label, lookup, fields) tuples, such as an account's sync cursor,
+    applied in order after the expenses. With INGEST_WRITER off the batch is written right away.
+    """
+    expenses = list(expenses)
+    if settings.INGEST_WRITER:
+        ingest.push_batch(expenses, updates)
+    else:
+        write_ingest_batches([(expenses, updates)])
+
+
+def write_ingest_batches(batches):
+    """
+    Write (expenses, updates) batches in one transaction: the expenses of all batches,
+    with their rollups and data versions, then every batch's row updates in order.
+    Returns:
+        The number of expenses written or checked against existing rows.
+    """
+    with transaction.atomic():
+        written = upsert_expenses(expense for expenses, _ in batches for expense in expenses)
+        for _, updates in batches:
+            for label, lookup, fields in updates:
+                apps.get_model(label).objects.filter(**lookup).update(**fields)
+    return written
+
+
+def drain_ingest_buffer(max_expenses=None):
+    """
+    Write the batches buffered for the ingest writer in transactions of about
+    `max_expenses` (INGEST_BATCH_SIZE by default) expenses until the buffer is empty.
+    A failed transaction leaves its batches claimed and schedules another flush to retry them.
+    Returns:
+        A tuple of the number of batches and of expenses written.
+    """
+    max_expenses = max_expenses or settings.INGEST_BATCH_SIZE
+    flushed = written = 0
+    while batches := ingest.claim_batches(max_expenses):
+        try:
+            written += write_ingest_batches([batch for _, batch in batches])
+        except Exception:
+            ingest.schedule_flush()
+            raise
+        ingest.release_batches(batches)
+        flushed += len(batches)
+    return flushed, written
+
+
+def claim_user_sync(user_id):
+    """
+    Mark a sync of the user's accounts as queued unless one is already in flight.
+    Returns:
+        True if the caller should start the sync, False if it joins the sync in flight.
+    """
+    now = datetime.now(timezone.utc)
+    UserSync.objects.get_or_create(user_id=user_id)
+    in_flight = Q(status__in=[UserSync.Status.QUEUED, UserSync.Status.RUNNING], lock_expires_at__gt=now)
+    claimed = (
+        UserSync.objects.filter(user_id=user_id)
+        .exclude(in_flight)
+        .update(
+            status=UserSync.Status.QUEUED,
+            queued_at=now,
+            started_at=None,
+            finished_at=None,
+            lock_expires_at=now + timedelta(seconds=settings.SYNC_LOCK_TIMEOUT),
+        )
+    )
+    return claimed == 1
+
+
+def get_sync_status_fields(status):
+    """Return the UserSync fields of a sync state transition; finishing a sync releases the user's sync lock."""
+    now = datetime.now(timezone.utc)
+    fields = {"status": status}
+    if status == UserSync.Status.RUNNING:
+        fields["started_at"] = now
+    elif status in (UserSync.Status.DONE, UserSync.Status.FAILED):
+        fields["finished_at"] = now
+        fields["lock_expires_at"] = None
+    if status == UserSync.Status.DONE:
+        fields["last_success_at"] = now
+    return fields
+
+
+def set_user_sync_status(user_id, status):
+    """Record a sync state transition."""
+    UserSync.objects.filter(user_id=user_id).update(**get_sync_status_fields(status))
+
+
+def get_sync_status(user):
+    """Get the state of the user's sync and the progress of every account."""
+    sync = UserSync.objects.filter(user=user).first()
+    accounts = Account.objects.filter(user=user).order_by("id")
+    return {
+        "status": sync.status if sync else UserSync.Status.IDLE,
+        "queued_at": sync.queued_at if sync else None,
+        "started_at": sync.started_at if sync else None,
+        "finished_at": sync.finished_at if sync else None,
+        "last_success_at": sync.last_success_at if sync else None,
+        "accounts": [
+            {
+                "account": account.maskedPan,
+                "status": account.sync_status,
+                "synced_until": account.last_synced_time,
+                "last_synced_at": account.last_synced_at,
+            }
+            for account in accounts
+        ],
+    }
 
 
 def fetch_client_info(api_key):
     """Fetch the client information from the MonoBank API."""
-    url = "https://api.monobank.ua/personal/client-info"
-    headers = {"X-Token": api_key}
-    response = requests.get(url, headers=headers)
-    response.raise_for_status()  # Raises an HTTPError for bad requests
-    return response.json()
+    return monobank.get_client_info(api_key)
 
 
 def update_or_create_accounts(user, data):
@@ -123,14 +621,79 @@ def sync_user_accounts(user):
         log.error(f"An error occurred while updating accounts: {str(e)}")
 
 
-def get_latest_expense_timestamp():
+def register_webhook(connection):
+    """
+    Register the webhook URL of a bank connection with MonoBank, creating its secret on first use.
+    Returns:
+        True if the webhook was registered, False if WEBHOOK_BASE_URL is not configured.
+    """
+    if not settings.WEBHOOK_BASE_URL:
+        return False
+    if not connection.webhook_secret:
+        connection.webhook_secret = secrets.token_urlsafe(32)
+        connection.save(update_fields=["webhook_secret"])
+    url = settings.WEBHOOK_BASE_URL.rstrip("/") + reverse("monobank_webhook", args=[connection.webhook_secret])
+    monobank.set_webhook(connection.api_key, url)
+    connection.webhook_registered_at = datetime.now(timezone.utc)
+    connection.save(update_fields=["webhook_registered_at"])
+    log.info(f"Registered webhook for user {connection.user_id}")
+    return True
+
+
+def parse_webhook_event(payload):
     """
-    Get the timestamp of the latest expense in the database.
+    Validate a MonoBank webhook payload.
     Returns:
-        The timestamp of the latest expense as a datetime object, or None if there are no expenses.
+        A tuple of the account id and the statement item, or None if the payload is not a statement item.
     """
-    latest_expense = Expense.objects.order_by("-timestamp").first()
-    return latest_expense.timestamp if latest_expense else None
+    if not isinstance(payload, dict) or payload.get("type") != "StatementItem":
+        return None
+    data = payload.get("data")
+    if not isinstance(data, dict):
+        return None
+    account_id, item = data.get("account"), data.get("statementItem")
+    if not isinstance(account_id, str) or not isinstance(item, dict):
+        return None
+    if not isinstance(item.get("id"), str) or not isinstance(item.get("description", ""), str):
+        return None
+    if not all(isinstance(item.get(field), int) for field in ("time", "amount", "mcc")):
+        return None
+    return account_id, item
+
+
+def drain_webhook_events(batch_size=None):
+    """
+    Write queued webhook events as expenses, oldest first, in one transaction per batch.
+    Returns:
+        The number of events processed.
+    """
+    batch_size = batch_size or settings.WEBHOOK_BATCH_SIZE
+    cash_type = CashType.objects.get(name="UAH")
+    processed = 0
+    while True:
+        events = list(WebhookEvent.objects.select_related("connection__user").order_by("id")[:batch_size])
+        if not events:
+            break
+        expenses = []
+        accounts_by_user = {}
+        for event in events:
+            user = event.connection.user
+            accounts_by_user.setdefault(user.id, set()).add(event.account_id)
+            expense = expense_from_transaction(user, event.statement_item, cash_type)
+            if expense is not None:
+                expenses.append(expense)
+
+        now = datetime.now(timezone.utc)
+        with transaction.atomic():
+            upsert_expenses(expenses)
+            for user_id, account_ids in accounts_by_user.items():
+                Account.objects.filter(user_id=user_id, account_id__in=account_ids).update(last_webhook_at=now)
+            WebhookEvent.objects.filter(id__in=[event.id for event in events]).delete()
+
+        processed += len(events)
+        if len(events) < batch_size:
+            break
+    return processed
 
 
 def get_previous_month_time_bounds():
@@ -163,87 +726,3 @@ def get_current_month_time_bounds():
     current_time = int(now.replace(tzinfo=timezone.utc).timestamp())
 
     return start_of_current_month, current_time
-
-
-def get_latest_bounds():
-    """
-    Get the time bounds for the latest expense in the database.
-    Returns:
-        A tuple of two integers representing the start and end of the latest expense.
-    """
-    latest_timestamp = get_latest_expense_timestamp()
-    current_time = int(datetime.now().timestamp())
-    if latest_timestamp is None:
-        return get_current_month_time_bounds()
-
-    # Assuming latest_timestamp can be a datetime object or an integer timestamp
-    if isinstance(latest_timestamp, datetime):
-        latest_timestamp = int(latest_timestamp.replace(tzinfo=timezone.utc).timestamp())
-
-    return latest_timestamp, current_time
-
-
-def load_expenses_from_files(user):
-    """
-    Load expenses from JSON files and save them to the database for the given user.
-    """
-    data_directory = str(os.path.join(settings.BASE_DIR, "data", "statements", user.username))
-    cash_type = CashType.objects.get(name="UAH")
-    expenses_to_create = []
-
-    for root, dirs, files in os.walk(data_directory):
-        for file in files:
-            if file.endswith(".json"):
-                file_path = os.path.join(root, file)
-                with open(file_path, "r", encoding="utf-8") as f:
-                    transactions = json.load(f)
-                    for transaction in transactions:
-                        amount = transaction["amount"] / 100.0
-                        if amount < 0:  # Exclude positive transactions
-                            expenses_to_create.append(
-                                Expense(
-                                    user=user,
-                                    amount=abs(amount),  # Take the absolute value of negative amounts
-                                    cash_type=cash_type,
-                                    timestamp=transaction["time"],
-                                    description=transaction["description"],
-                                    expense_type=settings.MMC.get(str(transaction["mcc"]), "Unknown"),
-                                )
-                            )
-
-    if expenses_to_create:
-        Expense.objects.bulk_create(expenses_to_create)
-
-
-def generate_pdf_report(user, expenses, expense_summary, period):
-    filename = f"{user.username}_expense_report_{period}.pdf"
-    c = canvas.Canvas(filename, pagesize=letter)
-    width, height = letter
-
-    # Register the DejaVu Sans font
-    pdfmetrics.registerFont(TTFont("roboto", "data/roboto.ttf"))
-    c.setFont("roboto", 16)
-    c.drawString(100, height - 50, f"Expense Report for {user.username}")
-
-    c.setFont("roboto", 12)
-    c.drawString(100, height - 80, f"Period: {period.capitalize()}")
-
-    c.drawString(100, height - 110, "Expenses by Category:")
-
-    table_data = [["Category", "Amount"]]
-    for category, amount in expense_summary.items():
-        table_data.append([category, f"{amount:.2f}"])
-
-    c.setFont("roboto", 10)
-    x_offset = 140
-    y_offset = height - 140
-    line_height = 17
-
-    for row in table_data:
-        c.drawString(x_offset, y_offset, row[0])
-        c.drawRightString(x_offset + 250, y_offset, row[1])
-        y_offset -= line_height
-        c.line(x_offset, y_offset, x_offset + 250, y_offset)
-
-    c.save()
-    return filename
@@ -0,0 +1,40 @@
+import time
+from datetime import datetime, timedelta, timezone
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from expenses_monitoring.archive import archive_user_expenses
+from expenses_monitoring.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = (
+        "Move expenses older than ARCHIVE_HORIZON_DAYS out of the expenses table into per-user, per-year "
+        "column files in ARCHIVE_ROOT."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, help="Archive expenses older than this many days.")
+        parser.add_argument(
+            "--user", action="append", help="Only archive the expenses of this username; may be repeated."
+        )
+
+    def handle(self, *args, **options):
+        days = options["days"] or settings.ARCHIVE_HORIZON_DAYS
+        cutoff = int((datetime.now(timezone.utc) - timedelta(days=days)).timestamp())
+        users = CustomUser.objects.order_by("id")
+        if options["user"]:
+            users = users.filter(username__in=options["user"])
+            if not users.exists():
+                raise CommandError(f"No users named {', '.join(options['user'])}")
+
+        started = time.monotonic()
+        total = 0
+        for user in users.iterator():
+            moved = archive_user_expenses(user.id, cutoff)
+            if moved:
+                self.stdout.write(f"Archived {moved} expenses of {user.username}")
+            total += moved
+        elapsed = time.monotonic() - started
+        self.stdout.write(f"Archived {total} expenses older than {days} days in {elapsed:.1f}s")
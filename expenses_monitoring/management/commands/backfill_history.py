@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from expenses_monitoring.lib import get_backfill_bounds
+from expenses_monitoring.models import CustomUser
+from expenses_monitoring.tasks import BULK_QUEUE, backfill_user_history
+
+
+class Command(BaseCommand):
+    help = (
+        "Queue a historical statement backfill for users with a bank connection. "
+        "Running it again resumes unfinished windows from their checkpoints."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", help="Username to backfill; all connected users by default.")
+        parser.add_argument("--days", type=int, help="Days of history to load (BACKFILL_HISTORY_DAYS by default).")
+
+    def handle(self, *args, **options):
+        users = CustomUser.objects.filter(bankconnection__isnull=False).distinct()
+        if options["user"]:
+            users = users.filter(username=options["user"])
+            if not users.exists():
+                raise CommandError(f"User {options['user']} has no bank connection")
+
+        from_time, to_time = get_backfill_bounds(options["days"])
+        for user in users:
+            backfill_user_history.apply_async(args=(user.id, from_time, to_time), queue=BULK_QUEUE)
+            self.stdout.write(f"Queued backfill for {user.username}")
@@ -0,0 +1,63 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from expenses_monitoring.models import CustomUser
+from expenses_monitoring.reports import get_previous_month, plan_monthly_reports, render_monthly_report
+
+
+class Command(BaseCommand):
+    help = (
+        "Render every user's PDF report of a month (the previous one by default) into MONTHLY_REPORT_ROOT, "
+        "in parallel worker processes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--month", help="Month to report on, as YYYY-MM.")
+        parser.add_argument("--user", action="append", help="Only report on this username; may be repeated.")
+        parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Number of worker processes.")
+
+    def handle(self, *args, **options):
+        if options["month"]:
+            try:
+                month = date.fromisoformat(f"{options['month']}-01")
+            except ValueError:
+                raise CommandError(f"Invalid month {options['month']}, expected YYYY-MM")
+        else:
+            month = get_previous_month(date.today())
+        user_ids = None
+        if options["user"]:
+            user_ids = list(CustomUser.objects.filter(username__in=options["user"]).values_list("id", flat=True))
+
+        started = time.monotonic()
+        jobs = plan_monthly_reports(month, user_ids)
+        planned = time.monotonic() - started
+        self.stdout.write(f"Planned {len(jobs)} reports for {month:%Y-%m} in {planned:.1f}s")
+        if not jobs:
+            return
+
+        # Worker processes must open their own database connections.
+        connections.close_all()
+        workers = max(1, min(options["workers"], len(jobs)))
+        # Several jobs per round trip keep the pool busy rendering rather than exchanging messages.
+        chunksize = max(1, len(jobs) // (workers * 4))
+        rendered = 0
+        size = 0
+        with ProcessPoolExecutor(max_workers=workers, initializer=django.setup) as executor:
+            sizes = executor.map(render_monthly_report, jobs, chunksize=chunksize)
+            for rendered, report_size in enumerate(sizes, start=1):
+                size += report_size
+                if rendered % 500 == 0:
+                    elapsed = time.monotonic() - started - planned
+                    self.stdout.write(f"[{rendered}/{len(jobs)}] {rendered / elapsed:.0f} reports/s")
+
+        elapsed = time.monotonic() - started - planned
+        self.stdout.write(
+            f"Rendered {rendered} reports ({size / 1e6:.1f} MB) with {workers} workers in {elapsed:.1f}s "
+            f"({rendered / elapsed:.0f} reports/s)"
+        )
@@ -0,0 +1,71 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from exp_d import settings
+from expenses_monitoring.importer import find_statement_files, import_statement_file
+from expenses_monitoring.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = (
+        "Import statement files from <path>/<username>/ (JSON arrays or NDJSON, optionally gzip'd) "
+        "in parallel worker processes. Interrupted imports resume from their last committed batch."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--path",
+            default=os.path.join(settings.BASE_DIR, "data", "statements"),
+            help="Directory with one sub-directory of statement files per username.",
+        )
+        parser.add_argument("--user", help="Only import the files of this username.")
+        parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Number of worker processes.")
+        parser.add_argument(
+            "--batch-size", type=int, help="Items per transaction (EXPENSE_UPSERT_BATCH_SIZE by default)."
+        )
+
+    def handle(self, *args, **options):
+        files = find_statement_files(options["path"])
+        if options["user"]:
+            files = [(username, path) for username, path in files if username == options["user"]]
+        if not files:
+            raise CommandError(f"No statement files found in {options['path']}")
+
+        usernames = {username for username, _ in files}
+        missing = usernames - set(CustomUser.objects.filter(username__in=usernames).values_list("username", flat=True))
+        if missing:
+            raise CommandError(f"Unknown users: {', '.join(sorted(missing))}")
+
+        # Worker processes must open their own database connections.
+        connections.close_all()
+        started = time.monotonic()
+        imported = 0
+        failed = 0
+        with ProcessPoolExecutor(max_workers=options["workers"], initializer=django.setup) as executor:
+            futures = {
+                executor.submit(import_statement_file, username, path, options["batch_size"]): path
+                for username, path in files
+            }
+            for done, future in enumerate(as_completed(futures), start=1):
+                try:
+                    _, read = future.result()
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write(f"[{done}/{len(files)}] {futures[future]} failed: {e}")
+                    continue
+                imported += read
+                elapsed = time.monotonic() - started
+                self.stdout.write(
+                    f"[{done}/{len(files)}] {futures[future]}: {read} items ({imported / elapsed:.0f} items/s)"
+                )
+
+        self.stdout.write(
+            f"Imported {imported} items from {len(files) - failed} files in {time.monotonic() - started:.1f}s"
+        )
+        if failed:
+            raise CommandError(f"{failed} files failed; run the command again to resume them")
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from expenses_monitoring.cache import bump_data_version
+from expenses_monitoring.models import CustomUser
+from expenses_monitoring.rollups import rebuild_user_rollups
+
+
+class Command(BaseCommand):
+    help = "Regenerate the daily expense rollups from the expenses table and the archive."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", help="Username to rebuild; all users by default.")
+
+    def handle(self, *args, **options):
+        users = CustomUser.objects.all()
+        if options["user"]:
+            users = users.filter(username=options["user"])
+            if not users.exists():
+                raise CommandError(f"User {options['user']} does not exist")
+
+        for user in users.iterator():
+            rows = rebuild_user_rollups(user.id)
+            bump_data_version(user.id)
+            self.stdout.write(f"Rebuilt {rows} daily rollups for {user.username}")
@@ -0,0 +1,36 @@
+# Generated by Django 5.0.6 on 2026-10-18 02:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("expenses_monitoring", "0007_seed_expenses"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="account",
+            name="last_synced_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="account",
+            name="last_synced_id",
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name="account",
+            name="last_synced_time",
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="account",
+            name="sync_status",
+            field=models.CharField(
+                choices=[("never", "Never"), ("running", "Running"), ("ok", "Ok"), ("failed", "Failed")],
+                default="never",
+                max_length=10,
+            ),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.0.6 on 2026-10-18 03:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("expenses_monitoring", "0008_account_sync_cursor"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="expense",
+            name="external_id",
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name="expense",
+            name="hold",
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name="expense",
+            name="provider",
+            field=models.CharField(default="monobank", max_length=20),
+        ),
+        migrations.AddConstraint(
+            model_name="expense",
+            constraint=models.UniqueConstraint(
+                fields=("user", "provider", "external_id"),
+                name="unique_expense_external_id",
+            ),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.0.6 on 2026-10-18 03:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("expenses_monitoring", "0011_webhook_events"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="bankconnection",
+            name="next_fetch_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
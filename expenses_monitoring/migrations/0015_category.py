@@ -0,0 +1,49 @@
+# Generated by Django 5.0.6 on 2026-10-18 03:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("expenses_monitoring", "0014_statement_import"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Category",
+            fields=[
+                ("id", models.SmallAutoField(primary_key=True, serialize=False)),
+                ("name", models.CharField(max_length=100, unique=True)),
+            ],
+            options={
+                "verbose_name_plural": "categories",
+            },
+        ),
+        migrations.CreateModel(
+            name="MerchantCategoryCode",
+            fields=[
+                ("code", models.PositiveSmallIntegerField(primary_key=True, serialize=False)),
+                (
+                    "category",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.PROTECT,
+                        related_name="codes",
+                        to="expenses_monitoring.category",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name="expense",
+            name="mcc",
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="expense",
+            name="category",
+            field=models.ForeignKey(
+                null=True, on_delete=django.db.models.deletion.PROTECT, to="expenses_monitoring.category"
+            ),
+        ),
+    ]
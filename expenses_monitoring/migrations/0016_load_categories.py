@@ -0,0 +1,55 @@
+# Generated by Django 5.0.6 on 2026-10-18 03:20
+
+import json
+import os
+
+from django.conf import settings
+from django.db import migrations
+
+UNKNOWN = "Unknown"
+
+
+def load_categories(apps, schema_editor):
+    """Load the MCC table from data/mmc.json and point existing expenses at their category."""
+    Category = apps.get_model("expenses_monitoring", "Category")
+    MerchantCategoryCode = apps.get_model("expenses_monitoring", "MerchantCategoryCode")
+    Expense = apps.get_model("expenses_monitoring", "Expense")
+
+    with open(os.path.join(settings.BASE_DIR, "data", "mmc.json"), encoding="utf-8") as f:
+        names_by_code = json.load(f)
+
+    names = sorted(set(names_by_code.values()) | {UNKNOWN})
+    Category.objects.bulk_create([Category(name=name) for name in names], ignore_conflicts=True)
+    category_ids = dict(Category.objects.values_list("name", "id"))
+    MerchantCategoryCode.objects.bulk_create(
+        [MerchantCategoryCode(code=int(code), category_id=category_ids[name]) for code, name in names_by_code.items()],
+        ignore_conflicts=True,
+    )
+
+    # Expenses stored the category label; rows from older seeds may hold the raw MCC instead.
+    for expense_type in Expense.objects.values_list("expense_type", flat=True).distinct():
+        if expense_type in category_ids:
+            Expense.objects.filter(expense_type=expense_type).update(category_id=category_ids[expense_type])
+        elif expense_type.isdigit() and expense_type.zfill(4) in names_by_code:
+            Expense.objects.filter(expense_type=expense_type).update(
+                mcc=int(expense_type), category_id=category_ids[names_by_code[expense_type.zfill(4)]]
+            )
+        else:
+            Expense.objects.filter(expense_type=expense_type).update(category_id=category_ids[UNKNOWN])
+
+
+def unload_categories(apps, schema_editor):
+    Category = apps.get_model("expenses_monitoring", "Category")
+    Expense = apps.get_model("expenses_monitoring", "Expense")
+    for category_id, name in Category.objects.values_list("id", "name"):
+        Expense.objects.filter(category_id=category_id).update(expense_type=name)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("expenses_monitoring", "0015_category"),
+    ]
+
+    operations = [
+        migrations.RunPython(load_categories, unload_categories),
+    ]
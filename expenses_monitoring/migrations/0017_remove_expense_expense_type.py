@@ -0,0 +1,32 @@
+# Generated by Django 5.0.6 on 2026-10-18 03:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("expenses_monitoring", "0016_load_categories"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="expense",
+            name="expenses_mo_expense_128aa3_idx",
+        ),
+        # A default lets the column be restored when the migration is reversed.
+        migrations.AlterField(
+            model_name="expense",
+            name="expense_type",
+            field=models.CharField(default="Unknown", max_length=100),
+        ),
+        migrations.RemoveField(
+            model_name="expense",
+            name="expense_type",
+        ),
+        migrations.AlterField(
+            model_name="expense",
+            name="category",
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to="expenses_monitoring.category"),
+        ),
+    ]
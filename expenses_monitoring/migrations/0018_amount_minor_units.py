@@ -0,0 +1,40 @@
+# Generated by Django 5.0.6 on 2026-10-18 03:40
+
+from django.db import migrations, models
+from django.db.models import F
+from django.db.models.functions import Round
+
+
+def to_minor_units(apps, schema_editor):
+    # Every stored amount is in a currency with two minor digits (UAH).
+    for model_name in ("Expense", "Goal"):
+        model = apps.get_model("expenses_monitoring", model_name)
+        model.objects.update(amount=Round(F("amount") * 100))
+
+
+def to_major_units(apps, schema_editor):
+    for model_name in ("Expense", "Goal"):
+        model = apps.get_model("expenses_monitoring", model_name)
+        model.objects.update(amount=F("amount") / 100.0)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("expenses_monitoring", "0017_remove_expense_expense_type"),
+    ]
+
+    operations = [
+        # Both directions convert while the columns are still floats: forwards before they become
+        # integers, and backwards after they are floats again, so no fraction is truncated.
+        migrations.RunPython(to_minor_units, to_major_units),
+        migrations.AlterField(
+            model_name="expense",
+            name="amount",
+            field=models.BigIntegerField(),
+        ),
+        migrations.AlterField(
+            model_name="goal",
+            name="amount",
+            field=models.BigIntegerField(),
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.0.6 on 2026-10-18 03:14
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("expenses_monitoring", "0018_amount_minor_units"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DailyExpenseRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField()),
+                ("total", models.BigIntegerField(default=0)),
+                ("count", models.PositiveIntegerField(default=0)),
+                (
+                    "cash_type",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="expenses_monitoring.cashtype",
+                    ),
+                ),
+                (
+                    "category",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.PROTECT,
+                        to="expenses_monitoring.category",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="dailyexpenserollup",
+            constraint=models.UniqueConstraint(
+                fields=("user", "date", "category", "cash_type"),
+                name="unique_daily_expense_rollup",
+            ),
+        ),
+    ]
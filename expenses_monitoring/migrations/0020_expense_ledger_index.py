@@ -0,0 +1,19 @@
+# Generated by Django 5.0.6 on 2026-10-18 03:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("expenses_monitoring", "0019_daily_expense_rollup"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="expense",
+            index=models.Index(
+                fields=["user", "timestamp", "id"],
+                name="expenses_mo_user_id_b93172_idx",
+            ),
+        ),
+    ]
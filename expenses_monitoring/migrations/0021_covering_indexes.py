@@ -0,0 +1,27 @@
+# Generated by Django 5.0.6 on 2026-10-18 03:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("expenses_monitoring", "0020_expense_ledger_index"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="expense",
+            name="expenses_mo_user_id_eb3133_idx",
+        ),
+        migrations.AddIndex(
+            model_name="dailyexpenserollup",
+            index=models.Index(fields=["date"], name="expenses_mo_date_cbe287_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="expense",
+            index=models.Index(
+                fields=["user", "timestamp", "category", "cash_type", "amount"],
+                name="expenses_mo_user_id_9dd016_idx",
+            ),
+        ),
+    ]
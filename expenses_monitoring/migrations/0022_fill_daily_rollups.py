@@ -0,0 +1,57 @@
+# Generated by Django 5.0.6 on 2026-10-18 03:56
+
+from datetime import datetime
+
+from django.db import migrations
+from django.utils.timezone import get_default_timezone
+
+
+def fill_daily_rollups(apps, schema_editor):
+    """
+    Sum the expenses stored before the rollup table existed into it. Days that already have rollup
+    rows were rewritten in full by the ingest since, so only the missing days of every user are added.
+    """
+    DailyExpenseRollup = apps.get_model("expenses_monitoring", "DailyExpenseRollup")
+    Expense = apps.get_model("expenses_monitoring", "Expense")
+    tz = get_default_timezone()
+
+    for user_id in Expense.objects.order_by().values_list("user_id", flat=True).distinct():
+        rolled_up = set(DailyExpenseRollup.objects.filter(user_id=user_id).values_list("date", flat=True))
+        sums = {}
+        rows = (
+            Expense.objects.filter(user_id=user_id)
+            .order_by()
+            .values_list("timestamp", "category_id", "cash_type_id", "amount")
+            .iterator(chunk_size=2000)
+        )
+        for timestamp, category_id, cash_type_id, amount in rows:
+            day = datetime.fromtimestamp(timestamp, tz).date()
+            if day in rolled_up:
+                continue
+            key = (day, category_id, cash_type_id)
+            total, count = sums.get(key, (0, 0))
+            sums[key] = (total + amount, count + 1)
+        DailyExpenseRollup.objects.bulk_create(
+            [
+                DailyExpenseRollup(
+                    user_id=user_id,
+                    date=day,
+                    category_id=category_id,
+                    cash_type_id=cash_type_id,
+                    total=total,
+                    count=count,
+                )
+                for (day, category_id, cash_type_id), (total, count) in sums.items()
+            ],
+            batch_size=2000,
+        )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("expenses_monitoring", "0021_covering_indexes"),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_daily_rollups, migrations.RunPython.noop),
+    ]
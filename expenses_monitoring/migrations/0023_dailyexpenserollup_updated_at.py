@@ -0,0 +1,19 @@
+# Generated by Django 5.0.6 on 2026-10-18 04:02
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("expenses_monitoring", "0022_fill_daily_rollups"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="dailyexpenserollup",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
@@ -1,7 +1,10 @@
-from datetime import datetime
+from datetime import datetime, timezone
 
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.utils.timezone import localtime
+
+from expenses_monitoring.money import Money
 
 
 class CustomUser(AbstractUser):
@@ -34,10 +37,36 @@ class CashType(models.Model):
         ]
 
 
+class Category(models.Model):
+    """Spending category that merchant category codes are grouped into."""
+
+    UNKNOWN = "Unknown"
+
+    id = models.SmallAutoField(primary_key=True)
+    name = models.CharField(max_length=100, unique=True)
+
+    class Meta:
+        verbose_name_plural = "categories"
+
+    def __str__(self):
+        return self.name
+
+
+class MerchantCategoryCode(models.Model):
+    """ISO 18245 merchant category code (MCC) sent by the bank with every statement item."""
+
+    code = models.PositiveSmallIntegerField(primary_key=True)
+    category = models.ForeignKey(Category, on_delete=models.PROTECT, related_name="codes")
+
+    def __str__(self):
+        return f"{self.code:04d}: {self.category}"
+
+
 class Goal(models.Model):
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
     description = models.TextField()
-    amount = models.FloatField()
+    # In minor units of the currency.
+    amount = models.BigIntegerField()
     cash_type = models.ForeignKey(CashType, on_delete=models.CASCADE)
     date = models.DateField()
 
@@ -46,19 +75,40 @@ class Goal(models.Model):
             models.Index(fields=["user"]),  # Single index on user if filtering by user alone is common
         ]
 
+    @property
+    def money(self):
+        return Money(self.amount, self.cash_type.name)
+
 
 class BankConnection(models.Model):
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name="bankconnection")
     api_key = models.CharField(max_length=100)
+    # Secret part of the webhook URL registered with the bank for this token.
+    webhook_secret = models.CharField(max_length=64, null=True, blank=True, unique=True)
+    webhook_registered_at = models.DateTimeField(null=True, blank=True)
+    # Earliest time the sync scheduler may spend this token's statement rate budget again.
+    next_fetch_at = models.DateTimeField(null=True, blank=True)
 
     class Meta:
         unique_together = ["user", "api_key"]
 
 
 class Account(models.Model):
+    class SyncStatus(models.TextChoices):
+        NEVER = "never"
+        RUNNING = "running"
+        OK = "ok"
+        FAILED = "failed"
+
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
     account_id = models.CharField(max_length=25)
     maskedPan = models.CharField(max_length=25)
+    # Incremental sync cursor: the newest statement item already stored for this account.
+    last_synced_time = models.BigIntegerField(null=True, blank=True)
+    last_synced_id = models.CharField(max_length=64, blank=True)
+    sync_status = models.CharField(max_length=10, choices=SyncStatus.choices, default=SyncStatus.NEVER)
+    last_synced_at = models.DateTimeField(null=True, blank=True)
+    last_webhook_at = models.DateTimeField(null=True, blank=True)
 
     class Meta:
         indexes = [
@@ -69,33 +119,160 @@ class Account(models.Model):
         return f"Account: {self.maskedPan} - {self.user}"
 
 
+class UserSync(models.Model):
+    """
+    State of the user's bank sync. Only one sync per user may be queued or running
+    until `lock_expires_at`; later triggers join it instead of starting another one.
+    """
+
+    class Status(models.TextChoices):
+        IDLE = "idle"
+        QUEUED = "queued"
+        RUNNING = "running"
+        DONE = "done"
+        FAILED = "failed"
+
+    user = models.OneToOneField(CustomUser, on_delete=models.CASCADE, related_name="sync")
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.IDLE)
+    lock_expires_at = models.DateTimeField(null=True, blank=True)
+    queued_at = models.DateTimeField(null=True, blank=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    last_success_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Sync: {self.user} - {self.status}"
+
+
+class BackfillWindow(models.Model):
+    """
+    One statement window of a historical backfill. Pages are fetched backwards from
+    `checkpoint_time`, which moves with every written page so a retried window resumes.
+    """
+
+    class Status(models.TextChoices):
+        PENDING = "pending"
+        RUNNING = "running"
+        DONE = "done"
+        FAILED = "failed"
+
+    account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name="backfill_windows")
+    from_time = models.BigIntegerField()
+    to_time = models.BigIntegerField()
+    checkpoint_time = models.BigIntegerField()
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING)
+    pages = models.PositiveIntegerField(default=0)
+    items = models.PositiveIntegerField(default=0)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["account", "from_time", "to_time"], name="unique_backfill_window"),
+        ]
+
+    def __str__(self):
+        return f"Backfill window: {self.account} - {self.from_time}-{self.to_time} - {self.status}"
+
+
+class StatementImport(models.Model):
+    """Checkpoint of a statement file import: how many items of the file are already written."""
+
+    path = models.CharField(max_length=500, unique=True)
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
+    size = models.BigIntegerField(default=0)
+    modified = models.BigIntegerField(default=0)
+    items_done = models.BigIntegerField(default=0)
+    completed = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Statement import: {self.path} - {self.items_done}"
+
+
+class WebhookEvent(models.Model):
+    """A statement item pushed by the bank, waiting to be written as an expense."""
+
+    connection = models.ForeignKey(BankConnection, on_delete=models.CASCADE)
+    account_id = models.CharField(max_length=25)
+    statement_item = models.JSONField()
+    received_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Webhook event: {self.account_id} - {self.received_at}"
+
+
 class Expense(models.Model):
     user = models.ForeignKey(
         "CustomUser", on_delete=models.CASCADE
     )  # Assuming 'CustomUser' is correctly defined elsewhere
-    amount = models.FloatField()
+    # In minor units of the currency (kopecks for UAH), as MonoBank reports it.
+    amount = models.BigIntegerField()
     cash_type = models.ForeignKey("CashType", on_delete=models.CASCADE)
     timestamp = models.BigIntegerField(default=int(datetime.now().timestamp()))
     description = models.TextField()
-    expense_type = models.CharField(max_length=100)
+    mcc = models.PositiveSmallIntegerField(null=True, blank=True)
+    category = models.ForeignKey(Category, on_delete=models.PROTECT)
+    # Transaction id assigned by the bank; re-ingesting the same statement item updates this row.
+    provider = models.CharField(max_length=20, default="monobank")
+    external_id = models.CharField(max_length=64, null=True, blank=True)
+    hold = models.BooleanField(default=False)
 
     class Meta:
+        # Every per-user query is `user = ? AND timestamp BETWEEN ? AND ?`; tests.QueryPlanTests checks
+        # that none of them falls back to a table scan.
         indexes = [
+            # Time ranges across all users, e.g. the monthly reports. The foreign key indexes `user` on its own.
             models.Index(fields=["timestamp"]),  # Corrected from 'date' to 'timestamp'
-            models.Index(fields=["user"]),
-            models.Index(fields=["expense_type"]),
+            # Keyset pagination of the ledger and exports: a user's expenses by (timestamp, id).
+            models.Index(fields=["user", "timestamp", "id"]),
+            # Covers the rollup and category aggregations, which read nothing else from the table.
+            models.Index(fields=["user", "timestamp", "category", "cash_type", "amount"]),
         ]
+        constraints = [
+            models.UniqueConstraint(fields=["user", "provider", "external_id"], name="unique_expense_external_id"),
+        ]
+
+    @property
+    def money(self):
+        return Money(self.amount, self.cash_type.name)
 
     @property
     def readable_date(self):
-        """Return a formatted datetime string from the timestamp."""
-        return datetime.utcfromtimestamp(self.timestamp).strftime("%Y-%m-%d %H:%M:%S")
+        """Return a formatted datetime string from the timestamp, in TIME_ZONE."""
+        return localtime(datetime.fromtimestamp(self.timestamp, timezone.utc)).strftime("%Y-%m-%d %H:%M:%S")
+
+    def __str__(self):
+        return f"Expense: {self.money} - {self.readable_date} - {self.category} - {self.description} - {self.user}"
+
+
+class DailyExpenseRollup(models.Model):
+    """
+    Expenses of a user summed per local day, category and currency. Rewritten for the touched days
+    in the same transaction as every ingest batch; `manage.py rebuild_rollups` regenerates it.
+    """
+
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
+    date = models.DateField()
+    category = models.ForeignKey(Category, on_delete=models.PROTECT)
+    cash_type = models.ForeignKey(CashType, on_delete=models.CASCADE)
+    # In minor units of the currency.
+    total = models.BigIntegerField(default=0)
+    count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "date", "category", "cash_type"], name="unique_daily_expense_rollup"
+            ),
+        ]
+        # Per-user ranges use the unique constraint's index; this one serves date ranges across all users.
+        indexes = [models.Index(fields=["date"])]
 
     def __str__(self):
-        return (
-            f"Expense: {self.amount} {self.cash_type} - {self.readable_date} "
-            f"- {self.expense_type} - {self.description} - {self.user}"
-        )
+        return f"Daily rollup: {self.user} - {self.date} - {self.category} - {self.total}"
 
 
 class Consultation(models.Model):
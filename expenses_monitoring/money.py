@@ -0,0 +1,79 @@
+import xml.etree.ElementTree as ElementTree
+from decimal import ROUND_HALF_UP, Decimal
+from functools import lru_cache
+
+from django.conf import settings
+
+# Amounts are stored as integers in the currency's minor unit (kopecks for UAH),
+# the same way MonoBank reports them.
+DEFAULT_CURRENCY = "UAH"
+
+
+@lru_cache(maxsize=None)
+def get_minor_units():
+    """
+    Read the number of minor unit digits of every currency from the ISO 4217 table in data/.
+    Returns:
+        A dictionary of alphabetic currency code to exponent, e.g. {"UAH": 2, "JPY": 0}.
+    """
+    tree = ElementTree.parse(settings.BASE_DIR / "data" / "iso-4217.xml")
+    minor_units = {}
+    for entry in tree.iter("CcyNtry"):
+        code = entry.findtext("Ccy")
+        exponent = entry.findtext("CcyMnrUnts")
+        if code and exponent and exponent.isdigit():
+            minor_units[code] = int(exponent)
+    return minor_units
+
+
+def get_exponent(currency):
+    """Return the number of minor unit digits of a currency, 2 if it is unknown."""
+    return get_minor_units().get(currency, 2)
+
+
+def to_minor(value, currency=DEFAULT_CURRENCY):
+    """Convert an amount in major units (a number or string) to integer minor units."""
+    exponent = get_exponent(currency)
+    return int((Decimal(str(value)) * 10**exponent).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+class Money:
+    """An exact amount of money: integer minor units and an ISO 4217 currency code."""
+
+    __slots__ = ("minor", "currency")
+
+    def __init__(self, minor, currency=DEFAULT_CURRENCY):
+        self.minor = int(minor or 0)
+        self.currency = currency
+
+    @classmethod
+    def from_major(cls, value, currency=DEFAULT_CURRENCY):
+        return cls(to_minor(value, currency), currency)
+
+    @property
+    def major(self):
+        """The amount in major units as an exact Decimal."""
+        return Decimal(self.minor).scaleb(-get_exponent(self.currency))
+
+    def __add__(self, other):
+        if not isinstance(other, Money):
+            return NotImplemented
+        if other.currency != self.currency:
+            raise ValueError(f"Cannot add {other.currency} to {self.currency}")
+        return Money(self.minor + other.minor, self.currency)
+
+    def __eq__(self, other):
+        return isinstance(other, Money) and (self.minor, self.currency) == (other.minor, other.currency)
+
+    def __hash__(self):
+        return hash((self.minor, self.currency))
+
+    def __repr__(self):
+        return f"Money({self.minor}, {self.currency!r})"
+
+    def format(self):
+        """Format the amount with the currency's minor digits, e.g. "1234.50"."""
+        return f"{self.major:.{get_exponent(self.currency)}f}"
+
+    def __str__(self):
+        return f"{self.format()} {self.currency}"
@@ -0,0 +1,199 @@
+"""
+Shared HTTP client for the MonoBank personal API.
+
+Every bank call goes through `request`, which combines:
+- one pooled keep-alive session per process,
+- connect/read timeouts,
+- the per-token rate limiter,
+- jittered exponential backoff that follows `Retry-After`,
+- a per-token circuit breaker that fails fast while MonoBank is degraded.
+"""
+
+import hashlib
+import logging
+import random
+import threading
+import time
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from expenses_monitoring.ratelimit import get_bucket
+
+log = logging.getLogger(__name__)
+
+BASE_URL = "https://api.monobank.ua"
+
+
+class MonobankError(requests.RequestException):
+    """A MonoBank request failed for good."""
+
+
+class MonobankUnavailable(MonobankError):
+    """The circuit breaker for the token is open, so the request was not sent."""
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker.
+
+    Opens after `failure_threshold` failures in a row, rejects calls for `reset_timeout`
+    seconds and then lets a single trial call through; its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, failure_threshold, reset_timeout, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self.lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def allow(self):
+        """Return True if a call may be made now."""
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if self.trial_in_flight or self.clock() - self.opened_at < self.reset_timeout:
+                return False
+            self.trial_in_flight = True
+            return True
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.trial_in_flight or self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    log.warning(f"MonoBank circuit opened after {self.failures} failures")
+                self.opened_at = self.clock()
+            self.trial_in_flight = False
+
+
+_session = None
+_session_lock = threading.Lock()
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_session():
+    """Get the process-wide keep-alive session used for all MonoBank calls."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=settings.MONOBANK_POOL_SIZE, max_retries=0)
+            _session = requests.Session()
+            _session.mount("https://", adapter)
+        return _session
+
+
+def get_breaker(api_key):
+    """Get the circuit breaker for an API token."""
+    key = hashlib.sha256(api_key.encode()).hexdigest()
+    with _breakers_lock:
+        breaker = _breakers.get(key)
+        if breaker is None:
+            breaker = CircuitBreaker(
+                settings.MONOBANK_CIRCUIT_FAILURE_THRESHOLD, settings.MONOBANK_CIRCUIT_RESET_TIMEOUT
+            )
+            _breakers[key] = breaker
+        return breaker
+
+
+def get_retry_after(response):
+    """Return the `Retry-After` header in seconds, or None if it is missing or not a number."""
+    try:
+        return float(response.headers["Retry-After"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt, retry_after=None):
+    """
+    Get the delay before retry number `attempt` (starting at 0).
+    Follows `Retry-After` when the server sent one, otherwise backs off exponentially with full jitter.
+    """
+    if retry_after is not None:
+        return retry_after + random.uniform(0, settings.MONOBANK_BACKOFF_BASE)
+    return random.uniform(0, min(settings.MONOBANK_BACKOFF_MAX, settings.MONOBANK_BACKOFF_BASE * 2**attempt))
+
+
+def request(api_key, endpoint, path, payload=None, max_retries=None):
+    """
+    Make a rate-limited request to the MonoBank API: a POST of `payload` if given, otherwise a GET.
+
+    `endpoint` names the rate limit bucket ("statement", "client-info", "webhook").
+    Returns:
+        The decoded JSON body, or None for an empty body.
+    Raises:
+        MonobankUnavailable if the token's circuit is open, requests.HTTPError for client errors
+        and MonobankError once all retries are used up.
+    """
+    max_retries = max_retries or settings.MONOBANK_MAX_RETRIES
+    bucket = get_bucket(api_key, endpoint)
+    breaker = get_breaker(api_key)
+    session = get_session()
+    timeout = (settings.MONOBANK_CONNECT_TIMEOUT, settings.MONOBANK_READ_TIMEOUT)
+    url = f"{BASE_URL}{path}"
+    method = "GET" if payload is None else "POST"
+
+    for attempt in range(max_retries):
+        if not breaker.allow():
+            raise MonobankUnavailable(f"MonoBank is unavailable, not requesting {endpoint}")
+        bucket.acquire()
+        try:
+            response = session.request(method, url, headers={"X-Token": api_key}, json=payload, timeout=timeout)
+        except requests.RequestException as e:
+            breaker.record_failure()
+            delay = backoff_delay(attempt)
+            log.warning(f"MonoBank {endpoint} request failed: {e}. Retrying in {delay:.1f} seconds...")
+            if not breaker.is_open:
+                time.sleep(delay)
+            continue
+
+        if response.status_code == 429:
+            # Rate limited, not degraded: block the token's bucket instead of sleeping here.
+            breaker.record_success()
+            delay = backoff_delay(attempt, get_retry_after(response) or bucket.refill_interval)
+            log.warning(f"Received 429 Too Many Requests. Retrying in {delay:.1f} seconds...")
+            bucket.penalize(delay)
+            continue
+        if response.status_code >= 500:
+            breaker.record_failure()
+            delay = backoff_delay(attempt, get_retry_after(response))
+            log.warning(f"MonoBank {endpoint} returned {response.status_code}. Retrying in {delay:.1f} seconds...")
+            if not breaker.is_open:
+                time.sleep(delay)
+            continue
+
+        breaker.record_success()
+        response.raise_for_status()
+        return response.json() if response.content else None
+
+    raise MonobankError(f"MonoBank {endpoint} request failed after {max_retries} attempts")
+
+
+def get_client_info(api_key):
+    """Fetch the client information with the list of accounts."""
+    return request(api_key, "client-info", "/personal/client-info")
+
+
+def get_statement(api_key, account, from_time, to_time):
+    """Fetch one page of an account statement, newest items first."""
+    return request(api_key, "statement", f"/personal/statement/{account}/{from_time}/{to_time}")
+
+
+def set_webhook(api_key, url):
+    """Register the URL MonoBank pushes new statement items of all the token's accounts to."""
+    return request(api_key, "webhook", "/personal/webhook", payload={"webHookUrl": url})
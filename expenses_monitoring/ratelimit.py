@@ -0,0 +1,191 @@
+"""
+Per-token rate limiting of MonoBank calls.
+
+Every process keeps a token bucket per (token, endpoint) so its threads queue locally, and on top of
+that reserves one time slot per request in the shared cache, so the limit holds across all web and
+Celery worker processes. With the default locmem cache the slots are per process too; Docker Compose
+uses the Redis cache, which makes them fleet-wide.
+"""
+
+import hashlib
+import logging
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+log = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket.
+
+    Holds up to `capacity` tokens and refills one token every `period / capacity` seconds.
+    A full bucket lets the first request through immediately; callers only wait for as long
+    as it takes the next token to arrive.
+    """
+
+    def __init__(self, capacity, period, clock=time.monotonic):
+        self.capacity = capacity
+        self.period = period
+        self.clock = clock
+        self.tokens = float(capacity)
+        self.updated_at = clock()
+        self.blocked_until = 0.0
+        self.condition = threading.Condition()
+
+    @property
+    def refill_interval(self):
+        return self.period / self.capacity
+
+    def _refill(self, now):
+        elapsed = now - self.updated_at
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed / self.refill_interval)
+            self.updated_at = now
+
+    def wait_time(self):
+        """Return the number of seconds until a token is available."""
+        with self.condition:
+            now = self.clock()
+            self._refill(now)
+            return self._wait_time(now)
+
+    def _wait_time(self, now):
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) * self.refill_interval
+
+    def try_acquire(self):
+        """Take a token if one is available right now."""
+        with self.condition:
+            now = self.clock()
+            self._refill(now)
+            if self._wait_time(now) > 0:
+                return False
+            self.tokens -= 1
+            return True
+
+    def acquire(self, timeout=None):
+        """
+        Block until a token is available and take it.
+        Returns:
+            True if a token was taken, False if `timeout` seconds passed first.
+        """
+        deadline = None if timeout is None else self.clock() + timeout
+        with self.condition:
+            while True:
+                now = self.clock()
+                self._refill(now)
+                delay = self._wait_time(now)
+                if delay <= 0:
+                    self.tokens -= 1
+                    return True
+                if deadline is not None:
+                    if now >= deadline:
+                        return False
+                    delay = min(delay, deadline - now)
+                self.condition.wait(delay)
+
+    def penalize(self, retry_after):
+        """Stop handing out tokens for `retry_after` seconds, e.g. after a 429 response."""
+        with self.condition:
+            now = self.clock()
+            self._refill(now)
+            self.tokens = 0.0
+            self.blocked_until = max(self.blocked_until, now + retry_after)
+            self.condition.notify_all()
+
+
+class SharedRateLimiter:
+    """
+    Rate limit shared by every process using the same cache.
+
+    Time is divided into slots of `period / capacity` seconds and a request owns a slot once it
+    wins `cache.add` on the slot's key, so two processes never get the same slot. The slot stores
+    when its request is sent, at least `period / capacity` seconds after the previous slot's, which
+    keeps requests spaced even when one is sent late in its slot. A local TokenBucket makes the
+    threads of one process take turns before they reserve a slot. 429 responses still penalize
+    all processes, in case clocks or a cache eviction let a request through early.
+    """
+
+    def __init__(self, key, capacity, period, clock=time.time):
+        self.key = key
+        self.local = TokenBucket(capacity, period)
+        self.clock = clock
+
+    @property
+    def refill_interval(self):
+        return self.local.refill_interval
+
+    def _blocked_key(self):
+        return f"ratelimit:{self.key}:blocked-until"
+
+    def _slot_key(self, slot):
+        return f"ratelimit:{self.key}:{slot}"
+
+    def reserve(self):
+        """
+        Reserve the earliest free slot.
+        Returns:
+            The number of seconds to wait before sending the request.
+        """
+        interval = self.refill_interval
+        now = self.clock()
+        start = max(now, cache.get(self._blocked_key(), 0))
+        slot = int(start // interval)
+        previous = cache.get(self._slot_key(slot - 1))
+        while True:
+            send_at = max(start, slot * interval)
+            if previous is not None:
+                send_at = max(send_at, previous + interval)
+            if cache.add(self._slot_key(slot), send_at, timeout=math.ceil(send_at - now + interval) + 1):
+                return send_at - now
+            previous = cache.get(self._slot_key(slot))
+            slot += 1
+
+    def acquire(self):
+        """Block until the calling process and then the shared slot schedule allow a request."""
+        self.local.acquire()
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+        return True
+
+    def penalize(self, retry_after):
+        """Stop every process from sending requests for `retry_after` seconds, e.g. after a 429 response."""
+        self.local.penalize(retry_after)
+        until = self.clock() + retry_after
+        if until > cache.get(self._blocked_key(), 0):
+            cache.set(self._blocked_key(), until, timeout=math.ceil(retry_after) + 1)
+
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def get_rate_limits():
+    """Return the configured (requests, period) limit for every Monobank endpoint."""
+    return settings.MONOBANK_RATE_LIMITS
+
+
+def get_bucket(api_key, endpoint):
+    """
+    Get the rate limiter for an API token and endpoint.
+    Tokens are hashed so raw API keys are never kept as dictionary or cache keys.
+    """
+    token_hash = hashlib.sha256(api_key.encode()).hexdigest()
+    key = (token_hash, endpoint)
+    with _buckets_lock:
+        bucket = _buckets.get(key)
+        if bucket is None:
+            capacity, period = get_rate_limits()[endpoint]
+            bucket = SharedRateLimiter(f"{token_hash}:{endpoint}", capacity, period)
+            _buckets[key] = bucket
+            log.debug(f"Created rate limit bucket for {endpoint}: {capacity} per {period}s")
+        return bucket
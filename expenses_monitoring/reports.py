@@ -0,0 +1,298 @@
+"""
+PDF expense reports.
+
+Reports are rendered in memory and kept in a report store on disk (REPORT_ROOT), one file per
+(user, period, day, version of the period's rollups), so a repeated download is served straight
+from the file and a sync makes the old reports unreachable. Reports of periods with many expenses are rendered by
+a Celery worker rather than in the request.
+
+Monthly reports of all users are planned with a few bulk queries and rendered in parallel
+into MONTHLY_REPORT_ROOT, which is not pruned.
+"""
+
+import hashlib
+import heapq
+import logging
+import os
+import tempfile
+import time
+from datetime import date, timedelta
+from functools import lru_cache
+from io import BytesIO
+
+from django.conf import settings
+from django.db.models import Count, Max, Q, Sum
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+from expenses_monitoring.analytics import compare_periods, load_expense_columns, top_merchants
+from expenses_monitoring.models import Category, CustomUser, DailyExpenseRollup, Expense
+from expenses_monitoring.money import Money
+from expenses_monitoring.rollups import get_day_bounds, summarize_by_category, summarize_users_by_category
+from expenses_monitoring.routers import analytics_db
+
+log = logging.getLogger(__name__)
+
+REPORT_PERIODS = ("week", "month", "year")
+REPORT_FONT = "roboto"
+REPORT_TOP_MERCHANTS = 5
+
+
+@lru_cache(maxsize=None)
+def register_fonts():
+    """Register the report font with reportlab; parsing the TTF is done once per process."""
+    pdfmetrics.registerFont(TTFont(REPORT_FONT, settings.BASE_DIR / "data" / "roboto.ttf"))
+
+
+def get_report_start(period, today):
+    """Return the first day covered by a report of the week, month or year ending today."""
+    if period == "week":
+        return today - timedelta(days=today.weekday())
+    if period == "month":
+        return today.replace(day=1)
+    if period == "year":
+        return today.replace(month=1, day=1)
+    raise ValueError(f"Unknown report period {period}")
+
+
+def get_day_last_year(day):
+    """Return the same date a year earlier; February 29 becomes February 28."""
+    try:
+        return day.replace(year=day.year - 1)
+    except ValueError:
+        return day.replace(year=day.year - 1, day=28)
+
+
+def get_report_ranges(period, today):
+    """
+    Get the days a report of the period ending today compares.
+    Returns:
+        A tuple of the period's (first day, last day) and the same days a year earlier.
+    """
+    start = get_report_start(period, today)
+    return (start, today), (get_day_last_year(start), get_day_last_year(today))
+
+
+def render_pdf_report(username, expense_summary, period, merchants=(), comparison=()):
+    """
+    Render an expense report.
+
+    `expense_summary` maps category names to totals, `merchants` is a list of
+    (merchant, total, count) tuples and `comparison` a list of (category, total,
+    last year's total) tuples; amounts are in minor units.
+    Returns:
+        The PDF as bytes.
+    """
+    register_fonts()
+    buffer = BytesIO()
+    # An invariant document has no creation date or random id, so the same data gives the same bytes.
+    c = canvas.Canvas(buffer, pagesize=letter, invariant=True)
+    width, height = letter
+
+    c.setFont(REPORT_FONT, 16)
+    c.drawString(100, height - 50, f"Expense Report for {username}")
+
+    c.setFont(REPORT_FONT, 12)
+    c.drawString(100, height - 80, f"Period: {period.capitalize()}")
+
+    c.drawString(100, height - 110, "Expenses by Category:")
+
+    table_data = [["Category", "Amount"]]
+    for category, amount in expense_summary.items():
+        table_data.append([category, Money(amount).format()])
+
+    c.setFont(REPORT_FONT, 10)
+    x_offset = 140
+    y_offset = height - 140
+    line_height = 17
+
+    for row in table_data:
+        c.drawString(x_offset, y_offset, row[0])
+        c.drawRightString(x_offset + 250, y_offset, row[1])
+        y_offset -= line_height
+        c.line(x_offset, y_offset, x_offset + 250, y_offset)
+
+    if merchants:
+        y_offset -= 2 * line_height
+        c.setFont(REPORT_FONT, 12)
+        c.drawString(100, y_offset, "Top Merchants:")
+        y_offset -= 30
+        c.setFont(REPORT_FONT, 10)
+        for merchant, amount, count in merchants:
+            c.drawString(x_offset, y_offset, f"{merchant[:40]} ({count})")
+            c.drawRightString(x_offset + 250, y_offset, Money(amount).format())
+            y_offset -= line_height
+            c.line(x_offset, y_offset, x_offset + 250, y_offset)
+
+    if comparison:
+        y_offset -= 2 * line_height
+        c.setFont(REPORT_FONT, 12)
+        c.drawString(100, y_offset, "Compared with Last Year:")
+        y_offset -= 30
+        c.setFont(REPORT_FONT, 10)
+        for category, amount, amount_last_year in comparison:
+            c.drawString(x_offset, y_offset, category)
+            c.drawRightString(x_offset + 250, y_offset, Money(amount).format())
+            c.drawRightString(x_offset + 350, y_offset, Money(amount_last_year).format())
+            y_offset -= line_height
+            c.line(x_offset, y_offset, x_offset + 350, y_offset)
+
+    c.save()
+    return buffer.getvalue()
+
+
+def get_report_version(user_id, period, today):
+    """
+    Fingerprint the rollup rows of a report's days and of the same days last year. Every ingest
+    rewrites the rows of the days it touched, so the version changes with the report's data; unlike
+    the cache's data version it is read from the database and survives a cache flush.
+    Returns:
+        A short hex string.
+    """
+    current, last_year = get_report_ranges(period, today)
+    rollups = DailyExpenseRollup.objects.using(analytics_db(user_id)).filter(
+        Q(date__range=current) | Q(date__range=last_year), user_id=user_id
+    )
+    state = rollups.aggregate(rows=Count("id"), count=Sum("count"), total=Sum("total"), updated=Max("updated_at"))
+    return hashlib.sha1(repr(sorted(state.items())).encode()).hexdigest()[:12]
+
+
+def get_report_name(user_id, period, today):
+    """Name a report in the store; the name changes whenever the report's data does."""
+    return f"{user_id}/{period}-{today.isoformat()}-v{get_report_version(user_id, period, today)}.pdf"
+
+
+def get_report_path(name, root=None):
+    """Return the path of a report in the store (REPORT_ROOT by default)."""
+    return os.path.join(root or settings.REPORT_ROOT, name)
+
+
+def store_report(name, pdf, root=None):
+    """Write a report to the store atomically, so readers never see a partial file."""
+    path = get_report_path(name, root)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(pdf)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return path
+
+
+def count_report_expenses(user, period, today):
+    """Count the expenses a report of the period covers, from the daily rollups."""
+    rollups = DailyExpenseRollup.objects.using(analytics_db(user.id)).filter(
+        user=user, date__range=(get_report_start(period, today), today)
+    )
+    return rollups.aggregate(count=Sum("count"))["count"] or 0
+
+
+def build_report(user, period, today):
+    """
+    Render the user's report of the period ending today into the store.
+    Returns:
+        The report's name in the store.
+    """
+    # Named before reading the data, so a sync during rendering cannot label older data as newer.
+    name = get_report_name(user.id, period, today)
+    current, last_year = get_report_ranges(period, today)
+    columns, columns_last_year = [
+        load_expense_columns(user.id, get_day_bounds(first_day)[0], get_day_bounds(last_day)[1])
+        for first_day, last_day in (current, last_year)
+    ]
+    merchants = top_merchants(columns, REPORT_TOP_MERCHANTS)
+    names = dict(Category.objects.using(analytics_db(user.id)).values_list("id", "name"))
+    comparison = [
+        (names[category_id], total, total_last_year)
+        for category_id, total, total_last_year in compare_periods(columns, columns_last_year)
+    ]
+    summary = summarize_by_category(user, *current)
+    store_report(name, render_pdf_report(user.username, summary, period, merchants, comparison))
+    log.info(f"Rendered {period} report {name} for user {user.username}")
+    return name
+
+
+def prune_reports(max_age=None):
+    """
+    Delete stored reports older than `max_age` seconds (REPORT_MAX_AGE by default).
+    Returns:
+        The number of deleted files.
+    """
+    cutoff = time.time() - (max_age or settings.REPORT_MAX_AGE)
+    deleted = 0
+    for dirpath, _, filenames in os.walk(settings.REPORT_ROOT):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.unlink(path)
+                    deleted += 1
+            except FileNotFoundError:
+                pass
+    return deleted
+
+
+def get_previous_month(today):
+    """Return the first day of the month before today's."""
+    return (today.replace(day=1) - timedelta(days=1)).replace(day=1)
+
+
+def get_monthly_report_name(user_id, month):
+    """Name a user's report of a month in the monthly report store."""
+    return f"{user_id}/{month:%Y-%m}.pdf"
+
+
+def plan_monthly_reports(month, user_ids=None):
+    """
+    Gather the data of every user's report of a month in three queries: category totals from the
+    rollups, merchant totals grouped in the database and the usernames.
+
+    Only users with expenses in the month get a report.
+    Returns:
+        A list of (user id, username, month, summary, merchants) jobs for `render_monthly_report`,
+        with the month as an ISO date so they can be sent to a Celery task as JSON.
+    """
+    last_day = (month + timedelta(days=31)).replace(day=1) - timedelta(days=1)
+    summaries = summarize_users_by_category(month, last_day, user_ids)
+
+    from_time, _ = get_day_bounds(month)
+    _, to_time = get_day_bounds(last_day)
+    expenses = Expense.objects.using(analytics_db()).filter(timestamp__gte=from_time, timestamp__lt=to_time)
+    users = CustomUser.objects.using(analytics_db())
+    if user_ids is not None:
+        expenses = expenses.filter(user_id__in=user_ids)
+        users = users.filter(id__in=user_ids)
+    merchants = {}
+    rows = expenses.values("user_id", "description").annotate(total=Sum("amount"), count=Count("id")).order_by()
+    for row in rows.iterator():
+        merchants.setdefault(row["user_id"], []).append((row["description"], row["total"], row["count"]))
+
+    usernames = dict(users.values_list("id", "username"))
+    return [
+        (
+            user_id,
+            usernames[user_id],
+            month.isoformat(),
+            summary,
+            heapq.nlargest(REPORT_TOP_MERCHANTS, merchants.get(user_id, []), key=lambda merchant: merchant[1]),
+        )
+        for user_id, summary in summaries.items()
+    ]
+
+
+def render_monthly_report(job):
+    """
+    Render one job from `plan_monthly_reports` into MONTHLY_REPORT_ROOT. Runs in worker processes.
+    Returns:
+        The size of the report in bytes.
+    """
+    user_id, username, month, summary, merchants = job
+    month = date.fromisoformat(month)
+    pdf = render_pdf_report(username, summary, f"{month:%B %Y}", merchants)
+    store_report(get_monthly_report_name(user_id, month), pdf, settings.MONTHLY_REPORT_ROOT)
+    return len(pdf)
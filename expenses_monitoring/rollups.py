@@ -0,0 +1,155 @@
+import logging
+from datetime import datetime, time, timedelta
+from itertools import chain
+
+from django.db import transaction
+from django.db.models import Q, Sum
+from django.utils.timezone import get_default_timezone
+
+from expenses_monitoring.archive import read_archive
+from expenses_monitoring.models import Category, DailyExpenseRollup, Expense
+from expenses_monitoring.money import DEFAULT_CURRENCY
+from expenses_monitoring.routers import analytics_db
+
+log = logging.getLogger(__name__)
+
+
+def get_local_date(timestamp):
+    """Return the date of a unix timestamp in the project's time zone."""
+    return datetime.fromtimestamp(timestamp, get_default_timezone()).date()
+
+
+def get_day_bounds(day):
+    """
+    Get the unix time bounds of a local day.
+    Returns:
+        A tuple of the first second of the day and the first second of the next day.
+    """
+    tz = get_default_timezone()
+    start = datetime.combine(day, time.min, tzinfo=tz)
+    end = datetime.combine(day + timedelta(days=1), time.min, tzinfo=tz)
+    return int(start.timestamp()), int(end.timestamp())
+
+
+def aggregate_daily_rollups(user_id, rows):
+    """
+    Sum expense rows per local day, category and currency.
+
+    `rows` is an iterable of (timestamp, category_id, cash_type_id, amount) tuples.
+    Returns:
+        A list of unsaved DailyExpenseRollup objects.
+    """
+    sums = {}
+    for timestamp, category_id, cash_type_id, amount in rows:
+        key = (get_local_date(timestamp), category_id, cash_type_id)
+        total, count = sums.get(key, (0, 0))
+        sums[key] = (total + amount, count + 1)
+    return [
+        DailyExpenseRollup(
+            user_id=user_id, date=day, category_id=category_id, cash_type_id=cash_type_id, total=total, count=count
+        )
+        for (day, category_id, cash_type_id), (total, count) in sums.items()
+    ]
+
+
+def _expense_rows(expenses):
+    return expenses.values_list("timestamp", "category_id", "cash_type_id", "amount")
+
+
+def _archived_rows(user_id, from_time=None, to_time=None):
+    for segment in read_archive(user_id, from_time, to_time):
+        yield from segment.rows("timestamp", "category", "cash_type", "amount")
+
+
+def refresh_daily_rollups(days_by_user):
+    """
+    Recompute the rollup rows of the given local days from the expenses table and the archive.
+    Meant to run inside the transaction that changed those days' expenses.
+
+    `days_by_user` maps a user id to a set of dates.
+    """
+    with transaction.atomic():
+        for user_id, days in days_by_user.items():
+            if not days:
+                continue
+            in_days = Q()
+            archived = []
+            for day in days:
+                start, end = get_day_bounds(day)
+                in_days |= Q(timestamp__gte=start, timestamp__lt=end)
+                archived.append(_archived_rows(user_id, start, end))
+            rows = chain(_expense_rows(Expense.objects.filter(in_days, user_id=user_id)), *archived)
+            rollups = aggregate_daily_rollups(user_id, rows)
+            DailyExpenseRollup.objects.filter(user_id=user_id, date__in=days).delete()
+            DailyExpenseRollup.objects.bulk_create(rollups)
+
+
+def rebuild_user_rollups(user_id, chunk_size=2000):
+    """
+    Regenerate all rollup rows of a user from the expenses table and the archive.
+    Returns:
+        The number of rollup rows written.
+    """
+    expenses = Expense.objects.filter(user_id=user_id).order_by()
+    with transaction.atomic():
+        rows = chain(_expense_rows(expenses).iterator(chunk_size=chunk_size), _archived_rows(user_id))
+        rollups = aggregate_daily_rollups(user_id, rows)
+        DailyExpenseRollup.objects.filter(user_id=user_id).delete()
+        DailyExpenseRollup.objects.bulk_create(rollups, batch_size=chunk_size)
+    log.info(f"Rebuilt {len(rollups)} daily rollups for user {user_id}")
+    return len(rollups)
+
+
+def summarize_by_category(user, from_date, to_date, currency=DEFAULT_CURRENCY):
+    """
+    Sum the user's expenses per category between two local dates, both inclusive.
+    Returns:
+        A dictionary of category name to total in minor units, largest first.
+    """
+    using = analytics_db(user.id)
+    totals = (
+        DailyExpenseRollup.objects.using(using)
+        .filter(user=user, date__gte=from_date, date__lte=to_date, cash_type__name=currency)
+        .values("category_id")
+        .annotate(total_sum=Sum("total"))
+        .order_by("-total_sum")
+    )
+    names = dict(Category.objects.using(using).values_list("id", "name"))
+    return {names[row["category_id"]]: row["total_sum"] for row in totals}
+
+
+def summarize_users_by_category(from_date, to_date, user_ids=None, currency=DEFAULT_CURRENCY):
+    """
+    Sum every user's expenses per category between two local dates, both inclusive, in one query.
+    Returns:
+        A dictionary of user id to a dictionary of category name to total in minor units, largest first;
+        users without expenses in the range are left out.
+    """
+    using = analytics_db()
+    rollups = DailyExpenseRollup.objects.using(using).filter(
+        date__gte=from_date, date__lte=to_date, cash_type__name=currency
+    )
+    if user_ids is not None:
+        rollups = rollups.filter(user_id__in=user_ids)
+    totals = rollups.values("user_id", "category_id").annotate(total_sum=Sum("total")).order_by("user_id", "-total_sum")
+    names = dict(Category.objects.using(using).values_list("id", "name"))
+    summaries = {}
+    for row in totals.iterator():
+        summaries.setdefault(row["user_id"], {})[names[row["category_id"]]] = row["total_sum"]
+    return summaries
+
+
+def get_daily_totals(user, from_date, to_date, category_ids=None, currency=DEFAULT_CURRENCY):
+    """
+    Sum the user's expenses per local day between two dates, both inclusive, optionally only in some categories.
+    Returns:
+        A list of (date, total) tuples ordered by date; days without expenses are left out.
+    """
+    rollups = DailyExpenseRollup.objects.using(analytics_db(user.id)).filter(
+        user=user, date__gte=from_date, date__lte=to_date, cash_type__name=currency
+    )
+    if category_ids:
+        rollups = rollups.filter(category_id__in=category_ids)
+    return list(
+        rollups.values("date").annotate(total_sum=Sum("total")).order_by("date").values_list("date", "total_sum")
+    )
@@ -0,0 +1,40 @@
+"""
+Database routing for the optional read-only analytics alias.
+
+Heavy analytic reads (dashboards, reports, exports, admin lists) ask `analytics_db` for the alias to
+read from: ANALYTICS_DATABASE, which is the "analytics" alias (a PostgreSQL replica or a read-only
+SQLite connection) when one is configured and the primary otherwise. Everything else, including every
+write and every read that must see a write just made, stays on the primary.
+"""
+
+from django.conf import settings
+
+from expenses_monitoring.cache import has_recent_write
+
+
+def analytics_db(user_id=None):
+    """
+    Return the database alias for an analytic read, of one user's data if `user_id` is given.
+    A user whose data changed within DATABASE_REPLICA_LAG seconds is read from the primary,
+    so a dashboard never shows less than the sync it just waited for.
+    """
+    if user_id is not None and has_recent_write(user_id):
+        return "default"
+    return settings.ANALYTICS_DATABASE
+
+
+class PrimaryReplicaRouter:
+    """Send writes and migrations to the primary; reads go to the analytics alias only when asked with `using`."""
+
+    def db_for_read(self, model, **hints):
+        return None
+
+    def db_for_write(self, model, **hints):
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == "default"
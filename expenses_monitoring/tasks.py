@@ -1,95 +1,272 @@
 import logging
-from django.core.cache import cache
-from datetime import datetime, timedelta
-import requests
 import time
-from .models import Expense, CustomUser, CashType
 
-from celery import shared_task
-from .lib import bulk_create_expenses
+from datetime import date, datetime, timedelta, timezone
+from itertools import zip_longest
+
+import requests
+from celery import chord, shared_task
+from django.conf import settings
+from django.core.cache import cache
+
+from .ingest import INGEST_QUEUE
+from .lib import (
+    claim_user_sync,
+    drain_ingest_buffer,
+    drain_webhook_events,
+    fetch_account_transactions,
+    get_account_windows,
+    plan_backfill,
+    plan_scheduled_syncs,
+    register_webhook,
+    run_backfill_window,
+    set_user_sync_status,
+    store_account_transactions,
+    sync_account,
+    sync_user_accounts,
+)
+from .models import Account, BackfillWindow, BankConnection, CustomUser, UserSync
+from .monobank import MonobankUnavailable
+from .ratelimit import get_rate_limits
+from .reports import build_report, get_previous_month, plan_monthly_reports, prune_reports, render_monthly_report
 
 log = logging.getLogger(__name__)
 
+# Syncs triggered by a user waiting on a page go to the interactive queue;
+# backfills of older history go to the bulk queue so they never delay them.
+# Expense writes are serialized on the ingest queue, see ingest.py.
+INTERACTIVE_QUEUE = "interactive"
+BULK_QUEUE = "bulk"
+
+
+def refresh_user_accounts(user):
+    """Refresh the user's account list and (re-)register the bank webhook."""
+    connection = user.bankconnection.first()
+    if connection is None:
+        log.info(f"User {user.username} has no bank connection to refresh")
+        return
+    sync_user_accounts(user)
+    try:
+        register_webhook(connection)
+    except Exception as e:
+        log.error(f"Failed to register webhook for user {user.username}: {e}")
+
+
+def request_user_sync(user_id, from_time=None, to_time=None, refresh_accounts=False, queue=INTERACTIVE_QUEUE):
+    """
+    Start a sync of the user's accounts unless one is already queued or running.
+    Returns:
+        True if a new sync was queued, False if the request joined the sync in flight
+        or the sync could not be queued.
+    """
+    if not claim_user_sync(user_id):
+        log.info(f"Sync for user {user_id} is already in flight")
+        return False
+    try:
+        sync_user_expenses.apply_async(
+            args=(user_id, from_time, to_time),
+            kwargs={"refresh_accounts": refresh_accounts, "queue": queue},
+            queue=queue,
+        )
+    except Exception as e:
+        # Release the claim, so the next trigger or the scheduler can try again.
+        log.error(f"Failed to queue sync for user {user_id}: {e}")
+        set_user_sync_status(user_id, UserSync.Status.FAILED)
+        return False
+    return True
+
+
+@shared_task
+def sync_user_expenses(user_id, from_time=None, to_time=None, refresh_accounts=False, queue=INTERACTIVE_QUEUE):
+    """
+    Orchestrate a sync of all the user's accounts.
+
+    Fans out one fetch task per account and fans in to `finish_user_sync`, which writes the results.
+    """
+    set_user_sync_status(user_id, UserSync.Status.RUNNING)
+    try:
+        user = CustomUser.objects.get(id=user_id)
+        if refresh_accounts:
+            refresh_user_accounts(user)
 
-def fetch_and_update_expenses(user_id, from_time, to_time):
+        accounts = Account.objects.filter(user=user)
+        account_windows = get_account_windows(accounts, from_time, to_time)
+        if not account_windows:
+            log.info(f"User {user.username} has no accounts to sync")
+            set_user_sync_status(user_id, UserSync.Status.DONE)
+            return
+        accounts.update(sync_status=Account.SyncStatus.RUNNING)
+
+        # All accounts share the user's token, so stagger the fetches by the statement rate limit.
+        _, period = get_rate_limits()["statement"]
+        fetches = [
+            fetch_account_statement.si(user_id, *window).set(queue=queue, countdown=index * period)
+            for index, window in enumerate(account_windows)
+        ]
+        finish = finish_user_sync.s(user_id).set(queue=queue).on_error(user_sync_failed.s(user_id))
+        chord(fetches)(finish)
+    except Exception:
+        set_user_sync_status(user_id, UserSync.Status.FAILED)
+        raise
+    log.info(f"Queued {len(fetches)} account fetches for user {user.username} on {queue}")
+
+
+@shared_task
+def fetch_account_statement(user_id, account_id, from_time, to_time):
+    """Fetch the statement items of one account."""
     user = CustomUser.objects.get(id=user_id)
-    accounts = user.accounts
-    base_url = "https://api.monobank.ua/personal/statement"
-
-    expenses_to_create = []
-    for account in accounts:
-        log.info(f"Fetching transactions for account {account}")
-        time.sleep(61)
-        url = f"{base_url}/{account}/{from_time}/{to_time}"
-        response = requests.get(url, headers={"X-Token": user.api_key})
-        response.raise_for_status()  # Ensure that the request was successful
-
-        transactions = response.json()
-        log.info(f"Transactions: {transactions}")
-        for transaction in transactions:
-            # if transaction['currencyCode'] != '980':
-            #     continue
-            # if not transaction['hold']:
-            # if transaction['currencyCode'] != '980' or transaction['hold']:
-            #     log.debug(f"Skipping transaction {transaction['id']} due to filters")
-            expenses_to_create.append(
-                Expense(
-                    user=user,
-                    amount=transaction["amount"] / 100.0,
-                    cash_type=CashType.objects.get(name="UAH"),
-                    timestamp=transaction["time"],
-                    description=transaction["description"],
-                    expense_type="card_transaction",
-                )
-            )
-            log.info(f"Transaction {transaction['id']} added to the list of expenses")
-    log.info(f"Expenses to create: {expenses_to_create}")
-    Expense.objects.bulk_create(expenses_to_create)
-    log.info(f"Expenses updated for user {user.username}")
-
-
-def convert_request_to_expense(expenses, user, uah):
-    log.info(f"Expenses: {expenses}")
-    result = []
-    for expanse in expenses:
-        log.info(f"Expanse: {expanse}")
-        if int(expanse["currencyCode"]) != 980:
-            continue
-        if expanse["amount"] > 0:
-            result.append(
-                {
-                    "user": user,
-                    "amount": expanse["amount"],
-                    "cash_type": uah,
-                    "timestamp": expanse["time"],
-                    "description": expanse["description"],
-                    "expense_type": expanse["mcc"],
-                }
-            )
-    return result
-
-
-def renew_expenses(user, uah):
-    expenses = bank.get_new_statements()
-    data = convert_request_to_expense(expenses, user, uah)
-    if data:
-        bulk_create_expenses(data)
+    results = fetch_account_transactions(user.api_key, [(account_id, from_time, to_time)])
+    return {"account_id": account_id, **results[account_id]}
+
+
+@shared_task
+def finish_user_sync(results, user_id):
+    """Write the fetched statement items of all the user's accounts; the sync finishes once they are stored."""
+    user = CustomUser.objects.get(id=user_id)
+    failed = any(result["failed"] for result in results)
+    status = UserSync.Status.FAILED if failed else UserSync.Status.DONE
+    try:
+        store_account_transactions(user, {result.pop("account_id"): result for result in results}, status)
+    except Exception:
+        set_user_sync_status(user_id, UserSync.Status.FAILED)
+        raise
+
+
+@shared_task
+def user_sync_failed(request, exc, traceback, user_id):
+    """Release the user's sync lock when an account fetch of the sync fails."""
+    log.error(f"Sync for user {user_id} failed: {exc}")
+    set_user_sync_status(user_id, UserSync.Status.FAILED)
+
+
+def schedule_webhook_drain():
+    """Queue a drain of the webhook queue unless one is already due within WEBHOOK_BATCH_DELAY."""
+    if not cache.add("webhook-drain-scheduled", True, timeout=settings.WEBHOOK_BATCH_DELAY):
+        return
+    try:
+        drain_webhook_queue.apply_async(countdown=settings.WEBHOOK_BATCH_DELAY, queue=INGEST_QUEUE)
+    except Exception as e:
+        # Events stay queued and are picked up by the next drain.
+        log.error(f"Failed to schedule webhook drain: {e}")
+
+
+@shared_task
+def drain_webhook_queue():
+    """Write queued webhook events as expenses in batches."""
+    processed = drain_webhook_events()
+    log.info(f"Processed {processed} webhook events")
+
+
+@shared_task
+def flush_ingest_buffer():
+    """Write the expense batches buffered for the ingest writer; the ingest queue runs one task at a time."""
+    batches, written = drain_ingest_buffer()
+    log.info(f"Wrote {written} expenses from {batches} ingest batches")
+
+
+@shared_task
+def schedule_account_syncs():
+    """
+    Spread bank syncs across the fleet: run by Celery beat, it queues the stalest accounts
+    within every token's statement rate budget.
+    """
+    now = datetime.now(timezone.utc)
+    _, period = get_rate_limits()["statement"]
+    planned = plan_scheduled_syncs(now)
+    for account, connection in planned:
+        sync_account_statement.apply_async(args=(account.id,), queue=BULK_QUEUE)
+    BankConnection.objects.filter(id__in=[connection.id for _, connection in planned]).update(
+        next_fetch_at=now + timedelta(seconds=period)
+    )
+    log.info(f"Scheduled {len(planned)} account syncs")
+
+
+@shared_task
+def sync_account_statement(account_id):
+    """
+    Sync one account from its cursor. The sync claims the user's sync lock like a user-triggered one,
+    so a scheduled poll never runs alongside it on the same token.
+    """
+    account = Account.objects.select_related("user").get(id=account_id)
+    if not claim_user_sync(account.user_id):
+        log.info(f"Skipping scheduled sync of account {account.account_id}: a sync of its user is in flight")
+        return
+    set_user_sync_status(account.user_id, UserSync.Status.RUNNING)
+    try:
+        sync_account(account)
+    except Exception:
+        set_user_sync_status(account.user_id, UserSync.Status.FAILED)
+        raise
+
+
+@shared_task
+def backfill_user_history(user_id, from_time, to_time, refresh_accounts=False):
+    """
+    Plan a historical backfill of all the user's accounts and queue its windows on the bulk queue.
+
+    Windows of different accounts are interleaved so the accounts progress in parallel,
+    and spaced by the statement rate limit because they all share the user's token.
+    """
+    user = CustomUser.objects.get(id=user_id)
+    if refresh_accounts:
+        refresh_user_accounts(user)
+    plans = [plan_backfill(account, from_time, to_time) for account in Account.objects.filter(user=user)]
+    windows = [window for windows in zip_longest(*plans) for window in windows if window is not None]
+    _, period = get_rate_limits()["statement"]
+    for index, window in enumerate(windows):
+        run_backfill.apply_async(args=(window.id,), queue=BULK_QUEUE, countdown=index * period)
+    log.info(f"Queued {len(windows)} backfill windows for user {user.username}")
+
+
+@shared_task(bind=True, max_retries=5)
+def run_backfill(self, window_id):
+    """Run one backfill window. A retry resumes from the window's checkpoint."""
+    window = BackfillWindow.objects.select_related("account__user").get(id=window_id)
+    try:
+        run_backfill_window(window)
+    except requests.RequestException as e:
+        window.status = BackfillWindow.Status.FAILED
+        window.error = str(e)
+        window.save(update_fields=["status", "error", "updated_at"])
+        if isinstance(e, MonobankUnavailable):
+            countdown = settings.MONOBANK_CIRCUIT_RESET_TIMEOUT
+        else:
+            countdown = 60 * 2**self.request.retries
+        raise self.retry(exc=e, countdown=countdown)
+
+
+@shared_task
+def render_report(user_id, period, today):
+    """Render a PDF report into the report store; `today` is the ISO date the report's period ends on."""
+    user = CustomUser.objects.get(id=user_id)
+    build_report(user, period, date.fromisoformat(today))
+
+
+@shared_task
+def prune_report_store():
+    """Delete expired PDF reports."""
+    deleted = prune_reports()
+    log.info(f"Deleted {deleted} expired reports")
 
 
 @shared_task
-def get_previous_month_expenses(bank, user, uah):
-    expenses = bank.get_all_statements_for_previous_month()
-    data = convert_request_to_expense(expenses, user, uah)
-    if expenses:
-        bulk_create_expenses(data)
+def generate_monthly_reports(month=None):
+    """
+    Render every user's report of a month (the previous one by default, as an ISO date of its first day).
+    Run by Celery beat on the 1st, it plans the reports in bulk and spreads their rendering over the bulk queue.
+    """
+    month = date.fromisoformat(month) if month else get_previous_month(date.today())
+    jobs = plan_monthly_reports(month)
+    chunk_size = settings.MONTHLY_REPORT_CHUNK_SIZE
+    for start in range(0, len(jobs), chunk_size):
+        render_monthly_reports.apply_async(args=(jobs[start : start + chunk_size],), queue=BULK_QUEUE)
+    log.info(f"Queued {len(jobs)} monthly reports for {month:%Y-%m}")
 
 
 @shared_task
-def call_external_api():
-    last_call_time = call_external_api.last_call_time
-    if last_call_time and (datetime.now() - last_call_time).total_seconds() < 60:
-        time_to_wait = 60 - (datetime.now() - last_call_time).total_seconds()
-        time.sleep(time_to_wait)
-        log.info("Calling the external API")
-
-        call_external_api.last_call_time = datetime.now()
+def render_monthly_reports(jobs):
+    """Render a chunk of monthly reports planned by `generate_monthly_reports`."""
+    started = time.monotonic()
+    size = sum(render_monthly_report(job) for job in jobs)
+    elapsed = time.monotonic() - started
+    log.info(f"Rendered {len(jobs)} monthly reports ({size} bytes) in {elapsed:.1f}s")
@@ -1,3 +1,1803 @@
-from django.test import TestCase
+import csv
+import gzip
+import io
+import json
+import os
+import re
+import sqlite3
+from collections import deque
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+from importlib import import_module
+from tempfile import TemporaryDirectory
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import numpy as np
+import requests
+from django.apps import apps
+from django.contrib.admin import site
+from django.core.cache import cache
+from django.db import connection
+from django.db.backends.sqlite3.base import DatabaseWrapper
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import Count, Sum
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils.timezone import get_default_timezone
+
+from .admin import ExpenseAdmin
+from .analytics import (
+    EPOCH,
+    bucket_series,
+    compare_periods,
+    daily_totals,
+    get_expense_timeseries,
+    group_sum,
+    load_expense_columns,
+    local_days,
+    lttb,
+    rolling_sum,
+)
+from .cache import bump_data_version, get_data_version, get_or_compute, has_recent_write, user_cache_key
+from .archive import (
+    ARCHIVE_COLUMNS,
+    ARCHIVE_FIELDS,
+    archive_user_expenses,
+    drop_archived,
+    get_archived_years,
+    get_segment_keys,
+    read_archive,
+)
+from .export import EXPORT_FIELDS, export_expenses, iter_export_rows
+from .forms import GoalForm
+from .importer import import_statement_file, iter_json_items
+from .ledger import filter_ledger, get_ledger_page
+from .lib import (
+    STATEMENT_PAGE_SIZE,
+    StatementRequest,
+    claim_user_sync,
+    drain_ingest_buffer,
+    drain_webhook_events,
+    expense_from_transaction,
+    fetch_statements,
+    get_account_windows,
+    get_category_id,
+    get_current_month_time_bounds,
+    get_sync_status,
+    plan_backfill,
+    plan_scheduled_syncs,
+    run_backfill_window,
+    set_user_sync_status,
+    store_account_transactions,
+    upsert_expenses,
+)
+from . import ingest, lib, monobank, ratelimit
+from .models import (
+    Account,
+    BackfillWindow,
+    BankConnection,
+    CashType,
+    Category,
+    CustomUser,
+    DailyExpenseRollup,
+    Expense,
+    Goal,
+    MerchantCategoryCode,
+    StatementImport,
+    UserSync,
+    WebhookEvent,
+)
+from .money import Money, to_minor
+from .ratelimit import SharedRateLimiter, TokenBucket
+from .routers import PrimaryReplicaRouter, analytics_db
+from .tasks import generate_monthly_reports, refresh_user_accounts, request_user_sync, sync_account_statement
+from .reports import (
+    REPORT_TOP_MERCHANTS,
+    count_report_expenses,
+    get_day_last_year,
+    get_monthly_report_name,
+    get_report_name,
+    plan_monthly_reports,
+    render_monthly_report,
+)
+from .rollups import (
+    get_daily_totals,
+    get_day_bounds,
+    get_local_date,
+    rebuild_user_rollups,
+    refresh_daily_rollups,
+    summarize_by_category,
+    summarize_users_by_category,
+)
+
+# Tables that grow with the transaction history; every query on them must use an index.
+HOT_TABLES = {"expenses_monitoring_expense", "expenses_monitoring_dailyexpenserollup"}
+SCAN = re.compile(r"^SCAN (?:TABLE )?(\w+)")
+TIME_RANGE = re.compile(r'"(\w+)"\."timestamp" [<>]')
+
+
+@skipUnless(connection.vendor == "sqlite", "EXPLAIN QUERY PLAN is SQLite's")
+# Data written in a test's transaction is only visible on the primary's connection.
+@override_settings(ANALYTICS_DATABASE="default")
+class QueryPlanTests(TestCase):
+    """
+    Run the hot queries of the views, ingest and reports, and check with EXPLAIN QUERY PLAN that
+    SQLite answers every one of them from an index rather than by scanning a table.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(username="planner")
+        cls.uah = CashType.objects.get_or_create(name="UAH", defaults={"description": ""})[0]
+        cls.day = date.today() - timedelta(days=3)
+        start = int(datetime(cls.day.year, cls.day.month, cls.day.day, 12, tzinfo=get_default_timezone()).timestamp())
+        upsert_expenses(
+            [
+                expense_from_transaction(
+                    cls.user,
+                    {
+                        "id": f"t{i}",
+                        "time": start + i * 600,
+                        "amount": -100 * (i + 1),
+                        "description": f"shop{i % 3}",
+                        "mcc": 5411,
+                    },
+                    cls.uah,
+                )
+                for i in range(20)
+            ]
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def query_plans(self, run):
+        """Run `run` and return (sql, plan details) for every SELECT it made on a hot table."""
+        with CaptureQueriesContext(connection) as context:
+            run()
+        plans = []
+        for query in context.captured_queries:
+            sql = query["sql"]
+            if not sql.startswith("SELECT") or not any(table in sql for table in HOT_TABLES):
+                continue
+            with connection.cursor() as cursor:
+                cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+                plans.append((sql, [row[-1] for row in cursor.fetchall()]))
+        self.assertTrue(plans, "No queries on the expense tables were made")
+        return plans
+
+    def assertIndexed(self, run, sorted=True, covering=None):
+        """
+        Assert that no query made by `run` scans a hot table and that time ranges are resolved in the index.
+        With `sorted`, results must also come in index order without a temporary sort; with `covering`,
+        that index must answer the queries alone.
+        """
+        for sql, plan in self.query_plans(run):
+            details = "\n".join(plan)
+            for detail in plan:
+                match = SCAN.match(detail)
+                self.assertFalse(match and match.group(1) in HOT_TABLES, f"Table scan in\n{sql}\n{details}")
+            for table in set(TIME_RANGE.findall(sql)):
+                self.assertTrue(
+                    any(detail.startswith(f"SEARCH {table} ") and "timestamp" in detail for detail in plan),
+                    f"Time range not resolved by an index in\n{sql}\n{details}",
+                )
+            if sorted:
+                self.assertNotIn("TEMP B-TREE FOR ORDER BY", details, f"Sort without an index in\n{sql}")
+            if covering:
+                self.assertIn(f"COVERING INDEX {covering}", details, f"{covering} is not used in\n{sql}")
+
+    def time_bounds(self):
+        return get_day_bounds(self.day)[0], get_day_bounds(date.today())[1]
+
+    def test_ledger(self):
+        from_time, to_time = self.time_bounds()
+        expenses = filter_ledger(self.user, from_time=from_time, to_time=to_time)
+        _, cursor = get_ledger_page(expenses, limit=5)
+        self.assertIndexed(lambda: get_ledger_page(expenses, limit=5))
+        self.assertIndexed(lambda: get_ledger_page(expenses, cursor, limit=5))
+        category = Category.objects.get(name=Category.UNKNOWN)
+        filtered = filter_ledger(self.user, category_ids=[category.id], min_amount=100, max_amount=1000)
+        self.assertIndexed(lambda: get_ledger_page(filtered, cursor, limit=5))
+
+    def test_export(self):
+        self.assertIndexed(lambda: list(iter_export_rows(self.user, *self.time_bounds())))
+
+    def test_expense_columns(self):
+        self.assertIndexed(lambda: load_expense_columns(self.user.id, *self.time_bounds()))
+
+    def test_rollups(self):
+        covering = "expenses_mo_user_id_9dd016_idx"
+        self.assertIndexed(lambda: refresh_daily_rollups({self.user.id: {self.day}}), covering=covering)
+        self.assertIndexed(lambda: rebuild_user_rollups(self.user.id), covering=covering)
+        self.assertIndexed(lambda: summarize_by_category(self.user, self.day, date.today()), sorted=False)
+        self.assertIndexed(lambda: get_daily_totals(self.user, self.day, date.today()))
+        self.assertIndexed(lambda: summarize_users_by_category(self.day, date.today()), sorted=False)
+
+    def test_reports(self):
+        self.assertIndexed(lambda: count_report_expenses(self.user, "month", date.today()))
+        self.assertIndexed(lambda: get_report_name(self.user.id, "month", date.today()), sorted=False)
+        self.assertIndexed(lambda: plan_monthly_reports(self.day.replace(day=1)), sorted=False)
+
+    def test_ingest(self):
+        # Settling a hold looks the stored hold up by its external id.
+        held = {
+            "id": "held",
+            "time": get_day_bounds(self.day)[0] + 60,
+            "amount": -500,
+            "description": "shop",
+            "mcc": 5411,
+        }
+        upsert_expenses([expense_from_transaction(self.user, {**held, "hold": True}, self.uah)])
+        self.assertIndexed(lambda: upsert_expenses([expense_from_transaction(self.user, held, self.uah)]))
+
+    def test_views(self):
+        params = f"from={self.day}&to={date.today()}"
+        self.assertIndexed(lambda: self.client.get("/filter-expenses/?period=month"), sorted=False)
+        self.assertIndexed(lambda: self.client.get(f"/api/timeseries/?{params}&granularity=week"))
+        self.assertIndexed(lambda: self.client.get(f"/api/transactions/?{params}"))
+        self.assertIndexed(lambda: b"".join(self.client.get(f"/export/?{params}").streaming_content))
+
+    def test_archive(self):
+        cutoff = get_day_bounds(date.today())[0]
+        with TemporaryDirectory() as root, override_settings(ARCHIVE_ROOT=root):
+            self.assertIndexed(lambda: archive_user_expenses(self.user.id, cutoff))
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class RateLimitTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_token_bucket(self):
+        clock = FakeClock()
+        bucket = TokenBucket(2, 60, clock=clock)
+        self.assertTrue(bucket.try_acquire())
+        self.assertTrue(bucket.try_acquire())
+        self.assertFalse(bucket.try_acquire())
+        self.assertEqual(bucket.wait_time(), 30)
+        clock.now += 30
+        self.assertTrue(bucket.try_acquire())
+        self.assertFalse(bucket.acquire(timeout=0))
+
+    def test_token_bucket_penalize(self):
+        clock = FakeClock()
+        bucket = TokenBucket(1, 60, clock=clock)
+        bucket.penalize(100)
+        self.assertEqual(bucket.wait_time(), 100)
+        clock.now += 100
+        self.assertTrue(bucket.try_acquire())
+
+    def test_shared_slots(self):
+        # Two processes' limiters for the same token share the slot schedule.
+        clock = FakeClock()
+        first = SharedRateLimiter("token:statement", 1, 60, clock=clock)
+        second = SharedRateLimiter("token:statement", 1, 60, clock=clock)
+        self.assertEqual(first.reserve(), 0)
+        self.assertEqual(second.reserve(), 60)
+        self.assertEqual(first.reserve(), 120)
+        clock.now += 300
+        self.assertEqual(second.reserve(), 0)
+
+    def test_shared_penalty(self):
+        clock = FakeClock()
+        first = SharedRateLimiter("token:statement", 1, 60, clock=clock)
+        second = SharedRateLimiter("token:statement", 1, 60, clock=clock)
+        first.penalize(90)
+        self.assertEqual(second.reserve(), 90)
+
+
+class FetchStatementsTests(SimpleTestCase):
+    def test_pages_move_backwards(self):
+        # Every item of the first two pages shares one timestamp.
+        pages = {
+            1100: [{"id": f"a{i}", "time": 1000} for i in range(STATEMENT_PAGE_SIZE)],
+            1000: [{"id": f"b{i}", "time": 1000} for i in range(STATEMENT_PAGE_SIZE)],
+            999: [{"id": "c", "time": 500}],
+        }
+        requested = []
+
+        def request(api_key, endpoint, path):
+            to_time = int(path.rsplit("/", 1)[1])
+            requested.append(to_time)
+            return pages[to_time]
+
+        with mock.patch("expenses_monitoring.monobank.request", side_effect=request):
+            results = list(fetch_statements("key", [StatementRequest("account", 0, 1100, 0)], max_workers=1))
+        self.assertEqual(requested, [1100, 1000, 999])
+        self.assertEqual([request.page for request, _ in results], [0, 1, 2])
+
+
+def statement_item(external_id, time, amount=-100, description="shop", mcc=5411, **fields):
+    return {"id": external_id, "time": time, "amount": amount, "description": description, "mcc": mcc, **fields}
+
+
+class SyncCursorTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(username="cursor")
+        CashType.objects.get_or_create(name="UAH", defaults={"description": ""})
+
+    def test_windows_start_at_cursor(self):
+        synced = Account.objects.create(user=self.user, account_id="synced", last_synced_time=5000)
+        new = Account.objects.create(user=self.user, account_id="new")
+        windows = get_account_windows([synced, new], to_time=9000)
+        self.assertEqual(windows, [("synced", 5000, 9000), ("new", get_current_month_time_bounds()[0], 9000)])
+        self.assertEqual(get_account_windows([synced], 100, 200), [("synced", 100, 200)])
+
+    def test_cursor_moves_to_newest_item(self):
+        account = Account.objects.create(user=self.user, account_id="a", last_synced_time=1000, last_synced_id="t0")
+        items = [statement_item("t2", 3000), statement_item("t1", 2000), statement_item("t0", 1000)]
+        store_account_transactions(self.user, {"a": {"failed": False, "transactions": items}})
+        account.refresh_from_db()
+        self.assertEqual((account.last_synced_time, account.last_synced_id), (3000, "t2"))
+        self.assertEqual(account.sync_status, Account.SyncStatus.OK)
+        # The item at the cursor was stored by the previous sync and is skipped.
+        self.assertEqual(sorted(Expense.objects.values_list("external_id", flat=True)), ["t1", "t2"])
+
+    def test_failed_account_keeps_cursor(self):
+        account = Account.objects.create(user=self.user, account_id="a", last_synced_time=1000, last_synced_id="t0")
+        store_account_transactions(self.user, {"a": {"failed": True, "transactions": []}})
+        account.refresh_from_db()
+        self.assertEqual((account.last_synced_time, account.last_synced_id), (1000, "t0"))
+        self.assertEqual(account.sync_status, Account.SyncStatus.FAILED)
+
+
+class UpsertExpensesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(username="upsert")
+        cls.uah = CashType.objects.get_or_create(name="UAH", defaults={"description": ""})[0]
+
+    def upsert(self, *items):
+        return upsert_expenses([expense_from_transaction(self.user, item, self.uah) for item in items])
+
+    def rollup_total(self):
+        return sum(DailyExpenseRollup.objects.filter(user=self.user).values_list("total", flat=True))
+
+    def test_repeated_items_are_stored_once(self):
+        items = [statement_item("t1", 1_700_000_000), statement_item("t2", 1_700_000_100, amount=-250)]
+        self.upsert(*items)
+        self.upsert(*items)
+        self.assertEqual(Expense.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(self.rollup_total(), 350)
+
+    def test_settled_item_replaces_hold(self):
+        self.upsert(statement_item("t1", 1_700_000_000, amount=-100, description="pending", hold=True))
+        self.upsert(statement_item("t1", 1_700_000_050, amount=-120, description="settled"))
+        expense = Expense.objects.get(user=self.user)
+        self.assertEqual((expense.amount, expense.description, expense.hold), (120, "settled", False))
+        self.assertEqual(self.rollup_total(), 120)
+
+    def test_hold_does_not_replace_settled_item(self):
+        self.upsert(statement_item("t1", 1_700_000_000, amount=-120))
+        self.upsert(statement_item("t1", 1_700_000_000, amount=-100, hold=True))
+        expense = Expense.objects.get(user=self.user)
+        self.assertEqual((expense.amount, expense.hold), (120, False))
+
+    def test_settled_version_wins_within_a_batch(self):
+        self.upsert(
+            statement_item("t1", 1_700_000_000, amount=-100, hold=True),
+            statement_item("t1", 1_700_000_000, amount=-120),
+        )
+        expense = Expense.objects.get(user=self.user)
+        self.assertEqual((expense.amount, expense.hold), (120, False))
+
+    def test_items_without_id_are_always_inserted(self):
+        item = statement_item(None, 1_700_000_000)
+        self.upsert(item)
+        self.upsert(item)
+        self.assertEqual(Expense.objects.filter(user=self.user).count(), 2)
+
+
+class RequestUserSyncTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(username="queue")
+
+    def test_queues_one_sync(self):
+        with mock.patch("expenses_monitoring.tasks.sync_user_expenses.apply_async") as apply_async:
+            self.assertTrue(request_user_sync(self.user.id))
+            self.assertFalse(request_user_sync(self.user.id))
+        apply_async.assert_called_once()
+        self.assertEqual(UserSync.objects.get(user=self.user).status, UserSync.Status.QUEUED)
+
+    def test_broker_failure_releases_claim(self):
+        with mock.patch(
+            "expenses_monitoring.tasks.sync_user_expenses.apply_async", side_effect=ConnectionError("broker down")
+        ):
+            self.assertFalse(request_user_sync(self.user.id))
+        sync = UserSync.objects.get(user=self.user)
+        self.assertEqual(sync.status, UserSync.Status.FAILED)
+        self.assertIsNone(sync.lock_expires_at)
+        with mock.patch("expenses_monitoring.tasks.sync_user_expenses.apply_async") as apply_async:
+            self.assertTrue(request_user_sync(self.user.id))
+        apply_async.assert_called_once()
+
+
+class RefreshUserAccountsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(username="refresh")
+
+    @mock.patch("expenses_monitoring.tasks.register_webhook")
+    @mock.patch("expenses_monitoring.tasks.sync_user_accounts")
+    def test_user_without_connection_is_skipped(self, sync_user_accounts, register_webhook):
+        refresh_user_accounts(self.user)
+        sync_user_accounts.assert_not_called()
+        register_webhook.assert_not_called()
+
+        connection = BankConnection.objects.create(user=self.user, api_key="token")
+        refresh_user_accounts(self.user)
+        sync_user_accounts.assert_called_once_with(self.user)
+        register_webhook.assert_called_once_with(connection)
+
+
+class ClaimUserSyncTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(username="claim")
+
+    def test_only_one_sync_in_flight(self):
+        self.assertTrue(claim_user_sync(self.user.id))
+        self.assertFalse(claim_user_sync(self.user.id))
+        set_user_sync_status(self.user.id, UserSync.Status.RUNNING)
+        self.assertFalse(claim_user_sync(self.user.id))
+        set_user_sync_status(self.user.id, UserSync.Status.DONE)
+        status = get_sync_status(self.user)
+        self.assertEqual(status["status"], UserSync.Status.DONE)
+        self.assertIsNotNone(status["last_success_at"])
+        self.assertTrue(claim_user_sync(self.user.id))
+
+    def test_expired_lock_is_taken_over(self):
+        self.assertTrue(claim_user_sync(self.user.id))
+        UserSync.objects.filter(user=self.user).update(
+            lock_expires_at=datetime.now(timezone.utc) - timedelta(seconds=1)
+        )
+        self.assertTrue(claim_user_sync(self.user.id))
+        self.assertEqual(UserSync.objects.get(user=self.user).status, UserSync.Status.QUEUED)
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def test_opens_after_consecutive_failures(self):
+        clock = FakeClock()
+        breaker = monobank.CircuitBreaker(3, 60, clock=clock)
+        breaker.record_failure()
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+        breaker.record_failure()
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+        self.assertTrue(breaker.is_open)
+        self.assertFalse(breaker.allow())
+
+    def test_half_open_trial(self):
+        clock = FakeClock()
+        breaker = monobank.CircuitBreaker(1, 60, clock=clock)
+        breaker.record_failure()
+        clock.now += 60
+        # One trial call is let through while the circuit is half-open.
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.record_failure()
+        self.assertFalse(breaker.allow())
+        clock.now += 60
+        self.assertTrue(breaker.allow())
+        breaker.record_success()
+        self.assertFalse(breaker.is_open)
+        self.assertTrue(breaker.allow())
+        self.assertTrue(breaker.allow())
+
+
+class FakeResponse:
+    def __init__(self, status_code, data=None, headers=None):
+        self.status_code = status_code
+        self.data = data
+        self.headers = headers or {}
+        self.content = b"{}" if data is not None else b""
+
+    def json(self):
+        return self.data
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(str(self.status_code))
+
+
+@override_settings(
+    MONOBANK_MAX_RETRIES=3, MONOBANK_CIRCUIT_FAILURE_THRESHOLD=2, MONOBANK_RATE_LIMITS={"client-info": (1000, 1)}
+)
+class MonobankRequestTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        monobank._breakers.clear()
+        ratelimit._buckets.clear()
+        patcher = mock.patch("expenses_monitoring.monobank.time.sleep")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def request(self, *responses):
+        session = mock.Mock()
+        session.request.side_effect = responses
+        with mock.patch("expenses_monitoring.monobank.get_session", return_value=session):
+            result = monobank.request("key", "client-info", "/personal/client-info")
+        return result, session.request.call_count
+
+    def test_retries_server_errors(self):
+        self.assertEqual(self.request(FakeResponse(500), FakeResponse(200, {"name": "x"})), ({"name": "x"}, 2))
+
+    def test_client_errors_are_not_retried(self):
+        with self.assertRaises(requests.HTTPError):
+            self.request(FakeResponse(400))
+
+    def test_open_circuit_fails_fast(self):
+        with self.assertRaises(monobank.MonobankUnavailable):
+            self.request(FakeResponse(500), FakeResponse(500), FakeResponse(200, {}))
+        with self.assertRaises(monobank.MonobankUnavailable):
+            self.request(FakeResponse(200, {}))
+
+
+class WebhookTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(username="webhook")
+        CashType.objects.get_or_create(name="UAH", defaults={"description": ""})
+        cls.connection = BankConnection.objects.create(user=cls.user, api_key="token", webhook_secret="s3cret")
+        cls.account = Account.objects.create(user=cls.user, account_id="a")
+
+    def post(self, item, secret="s3cret"):
+        payload = {"type": "StatementItem", "data": {"account": "a", "statementItem": item}}
+        with mock.patch("expenses_monitoring.views.schedule_webhook_drain"):
+            return self.client.post(
+                reverse("monobank_webhook", args=[secret]), json.dumps(payload), content_type="application/json"
+            )
+
+    def test_receiver_queues_valid_events(self):
+        self.assertEqual(self.post(statement_item("t1", 1_700_000_000)).status_code, 200)
+        self.assertEqual(self.post({"id": "t2"}).status_code, 400)
+        self.assertEqual(self.post(statement_item("t3", 1_700_000_000), secret="wrong").status_code, 404)
+        self.assertEqual(list(WebhookEvent.objects.values_list("statement_item__id", flat=True)), ["t1"])
+
+    @override_settings(WEBHOOK_MAX_PENDING=1)
+    def test_receiver_sheds_load_when_full(self):
+        self.post(statement_item("t1", 1_700_000_000))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.post(statement_item("t2", 1_700_000_000))
+        self.assertEqual(response.status_code, 503)
+        count = next(query["sql"] for query in queries if "COUNT" in query["sql"])
+        self.assertIn("LIMIT 1", count)
+        self.assertEqual(response["Retry-After"], "60")
+
+    def test_drain_writes_events_in_batches(self):
+        for i in range(5):
+            self.post(statement_item(f"t{i}", 1_700_000_000 + i))
+        # A retried delivery of the same item.
+        self.post(statement_item("t0", 1_700_000_000))
+        self.assertEqual(drain_webhook_events(batch_size=2), 6)
+        self.assertFalse(WebhookEvent.objects.exists())
+        self.assertEqual(Expense.objects.filter(user=self.user).count(), 5)
+        self.account.refresh_from_db()
+        self.assertIsNotNone(self.account.last_webhook_at)
+        self.assertEqual(drain_webhook_events(batch_size=2), 0)
+
+
+class ScheduledSyncTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.now = datetime(2024, 5, 1, 12, tzinfo=timezone.utc)
+        cls.user = CustomUser.objects.create(username="scheduled", date_joined=cls.now - timedelta(days=30))
+        cls.connection = BankConnection.objects.create(
+            user=cls.user, api_key="token", webhook_registered_at=cls.now - timedelta(days=2)
+        )
+
+    def planned(self):
+        return [account.account_id for account, _ in plan_scheduled_syncs(now=self.now)]
+
+    def test_webhook_accounts_are_reconciled_less_often(self):
+        synced_at = self.now - timedelta(hours=2)
+        Account.objects.create(user=self.user, account_id="a", last_synced_at=synced_at)
+        covered = Account.objects.create(
+            user=self.user, account_id="b", last_synced_at=synced_at, last_webhook_at=self.now - timedelta(hours=1)
+        )
+        # Only the account without webhook events since registration is due.
+        self.assertEqual(self.planned(), ["a"])
+        covered.last_synced_at = self.now - timedelta(days=2)
+        covered.save()
+        # Past the reconcile interval it is due again, and as the stalest it gets the token's one fetch.
+        self.assertEqual(self.planned(), ["b"])
+
+    def test_events_before_registration_do_not_count(self):
+        Account.objects.create(
+            user=self.user,
+            account_id="a",
+            last_synced_at=self.now - timedelta(hours=2),
+            last_webhook_at=self.now - timedelta(days=3),
+        )
+        self.assertEqual(self.planned(), ["a"])
+
+    def test_scheduled_sync_skips_user_sync_in_flight(self):
+        account = Account.objects.create(user=self.user, account_id="a")
+        self.assertTrue(claim_user_sync(self.user.id))
+        with mock.patch("expenses_monitoring.lib.fetch_account_transactions") as fetch:
+            sync_account_statement(account.id)
+        fetch.assert_not_called()
+        self.assertEqual(UserSync.objects.get(user=self.user).status, UserSync.Status.QUEUED)
+
+    def test_scheduled_sync_holds_user_sync(self):
+        CashType.objects.get_or_create(name="UAH", defaults={"description": ""})
+        account = Account.objects.create(user=self.user, account_id="a")
+
+        def fetch(api_key, account_windows):
+            # A user-triggered sync arriving mid-fetch joins the scheduled one.
+            self.assertFalse(claim_user_sync(self.user.id))
+            return {"a": {"transactions": [statement_item("t1", 1_700_000_000)], "failed": False}}
+
+        with mock.patch("expenses_monitoring.lib.fetch_account_transactions", side_effect=fetch):
+            sync_account_statement(account.id)
+        sync = UserSync.objects.get(user=self.user)
+        self.assertEqual(sync.status, UserSync.Status.DONE)
+        self.assertIsNone(sync.lock_expires_at)
+        self.assertEqual(Expense.objects.filter(user=self.user).count(), 1)
+
+
+@mock.patch("expenses_monitoring.lib.STATEMENT_PAGE_SIZE", 2)
+class BackfillTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(username="backfill")
+        BankConnection.objects.create(user=cls.user, api_key="token")
+        CashType.objects.get_or_create(name="UAH", defaults={"description": ""})
+        cls.account = Account.objects.create(user=cls.user, account_id="a")
+
+    def test_planning_is_idempotent(self):
+        from_time, to_time = 1_700_000_000, 1_700_000_000 + 70 * 24 * 60 * 60
+        windows = plan_backfill(self.account, from_time, to_time)
+        self.assertEqual(len(windows), 3)
+        self.assertEqual(windows[0].to_time, to_time)
+        self.assertEqual(windows[-1].from_time, from_time)
+        BackfillWindow.objects.filter(id=windows[0].id).update(status=BackfillWindow.Status.DONE)
+        self.assertEqual(plan_backfill(self.account, from_time, to_time), windows[1:])
+        self.assertEqual(BackfillWindow.objects.count(), 3)
+
+    def test_window_resumes_from_checkpoint(self):
+        window = plan_backfill(self.account, 1000, 2000)[0]
+        pages = {2000: [statement_item("t4", 1900), statement_item("t3", 1800)], 1800: [statement_item("t2", 1500)]}
+        calls = []
+
+        def get_statement(api_key, account_id, from_time, to_time):
+            calls.append(to_time)
+            if len(calls) == 2:
+                raise requests.ConnectionError("connection reset")
+            return pages[to_time]
+
+        with mock.patch("expenses_monitoring.monobank.get_statement", side_effect=get_statement):
+            with self.assertRaises(requests.ConnectionError):
+                run_backfill_window(window)
+            window.refresh_from_db()
+            self.assertEqual((window.checkpoint_time, window.pages, window.items), (1800, 1, 2))
+            # A failed window is picked up again by the task's retry.
+            window.status = BackfillWindow.Status.FAILED
+            window.save()
+            self.assertTrue(run_backfill_window(window))
+        self.assertEqual(calls, [2000, 1800, 1800])
+        window.refresh_from_db()
+        self.assertEqual((window.status, window.pages, window.items), (BackfillWindow.Status.DONE, 2, 3))
+        self.assertEqual(Expense.objects.filter(user=self.user).count(), 3)
+        self.assertFalse(run_backfill_window(window))
+
+    def test_running_window_is_not_claimed_twice(self):
+        window = plan_backfill(self.account, 1000, 2000)[0]
+        BackfillWindow.objects.filter(id=window.id).update(status=BackfillWindow.Status.RUNNING)
+        with mock.patch("expenses_monitoring.monobank.get_statement") as get_statement:
+            self.assertFalse(run_backfill_window(window))
+        get_statement.assert_not_called()
+
+
+class IterJsonItemsTests(SimpleTestCase):
+    items = [
+        {"id": "t1", "description": "a, [b] {c}", "amount": -100},
+        {"id": "t2", "description": '\\"quoted\\"', "nested": {"list": [1, 2, 3]}},
+        {"id": "t3", "description": "ґанок"},
+    ]
+
+    def parse(self, text, chunk_size):
+        return list(iter_json_items(io.StringIO(text), chunk_size=chunk_size))
+
+    def test_array_across_chunk_boundaries(self):
+        text = json.dumps(self.items, indent=2, ensure_ascii=False)
+        for chunk_size in (1, 3, 7, len(text)):
+            self.assertEqual(self.parse(text, chunk_size), self.items)
+
+    def test_newline_delimited(self):
+        text = "\n".join(json.dumps(item) for item in self.items) + "\n"
+        for chunk_size in (1, 5, len(text)):
+            self.assertEqual(self.parse(text, chunk_size), self.items)
+
+    def test_empty_and_truncated_input(self):
+        self.assertEqual(self.parse("", 4), [])
+        self.assertEqual(self.parse(" [ ] ", 2), [])
+        with self.assertRaises(json.JSONDecodeError):
+            self.parse(json.dumps(self.items)[:-10], 4)
+
+
+class ImportStatementFileTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(username="importer")
+        CashType.objects.get_or_create(name="UAH", defaults={"description": ""})
+
+    def setUp(self):
+        directory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "statement.json")
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump([statement_item(f"t{i}", 1_700_000_000 + i) for i in range(5)], f)
+
+    def test_interrupted_import_resumes_after_last_batch(self):
+        calls = []
+
+        def submit_ingest_batch(expenses, updates=()):
+            calls.append(len(expenses))
+            if len(calls) == 2:
+                raise RuntimeError("worker killed")
+            lib.submit_ingest_batch(expenses, updates)
+
+        with mock.patch("expenses_monitoring.importer.submit_ingest_batch", side_effect=submit_ingest_batch):
+            with self.assertRaises(RuntimeError):
+                import_statement_file("importer", self.path, batch_size=2)
+        checkpoint = StatementImport.objects.get(path=self.path)
+        self.assertEqual((checkpoint.items_done, checkpoint.completed), (2, False))
+
+        self.assertEqual(import_statement_file("importer", self.path, batch_size=2), (self.path, 3))
+        checkpoint.refresh_from_db()
+        self.assertEqual((checkpoint.items_done, checkpoint.completed), (5, True))
+        self.assertEqual(Expense.objects.filter(user=self.user).count(), 5)
+        # A completed file is not read again until it changes.
+        self.assertEqual(import_statement_file("importer", self.path, batch_size=2), (self.path, 0))
+
+    def test_changed_file_is_imported_again(self):
+        import_statement_file("importer", self.path, batch_size=2)
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump([statement_item(f"t{i}", 1_700_000_000 + i) for i in range(7)], f)
+        os.utime(self.path, (1_800_000_000, 1_800_000_000))
+        self.assertEqual(import_statement_file("importer", self.path, batch_size=2), (self.path, 7))
+        self.assertEqual(Expense.objects.filter(user=self.user).count(), 7)
+
+
+@override_settings(ANALYTICS_DATABASE="default")
+class CategoryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(username="categories")
+        cls.uah = CashType.objects.get_or_create(name="UAH", defaults={"description": ""})[0]
+
+    def setUp(self):
+        patcher = mock.patch.object(lib, "_category_ids", None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_mcc_maps_to_its_category(self):
+        groceries = MerchantCategoryCode.objects.get(code=5411).category
+        unknown = Category.objects.get(name=Category.UNKNOWN)
+        self.assertEqual(get_category_id(5411), groceries.id)
+        self.assertEqual(get_category_id(9998), unknown.id)
+        self.assertEqual(get_category_id(None), unknown.id)
+        # The mapping is read once per process.
+        with self.assertNumQueries(0):
+            get_category_id(5411)
+
+    def test_totals_per_category(self):
+        day = datetime(2024, 3, 5, 12, tzinfo=get_default_timezone())
+        time = int(day.timestamp())
+        upsert_expenses(
+            [
+                expense_from_transaction(self.user, item, self.uah)
+                for item in (
+                    statement_item("t1", time, amount=-100, mcc=5411),
+                    statement_item("t2", time + 60, amount=-250, mcc=5411),
+                    statement_item("t3", time + 120, amount=-500, mcc=9998),
+                )
+            ]
+        )
+        groceries = MerchantCategoryCode.objects.get(code=5411).category.name
+        self.assertEqual(
+            summarize_by_category(self.user, day.date(), day.date()), {Category.UNKNOWN: 500, groceries: 350}
+        )
+
+
+class IndexViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(username="goals")
+        cls.uah = CashType.objects.get_or_create(name="UAH", defaults={"description": ""})[0]
+
+    def add_goals(self, count):
+        Goal.objects.bulk_create(
+            Goal(user=self.user, description="car", amount=100_000, cash_type=self.uah, date=date(2025, 1, 1))
+            for _ in range(count)
+        )
+
+    def test_goal_queries_do_not_grow_with_goals(self):
+        self.client.force_login(self.user)
+        self.add_goals(1)
+        with CaptureQueriesContext(connection) as one_goal:
+            self.client.get(reverse("index"))
+        self.add_goals(5)
+        with CaptureQueriesContext(connection) as many_goals:
+            response = self.client.get(reverse("index"))
+        self.assertContains(response, "UAH", count=6)
+        self.assertEqual(len(many_goals), len(one_goal))
+
+
+class FillDailyRollupsMigrationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(username="migration")
+        cls.uah = CashType.objects.get_or_create(name="UAH", defaults={"description": ""})[0]
+
+    def test_missing_days_are_filled(self):
+        tz = get_default_timezone()
+        first = int(datetime(2024, 3, 5, 12, tzinfo=tz).timestamp())
+        second = int(datetime(2024, 3, 6, 12, tzinfo=tz).timestamp())
+        upsert_expenses([expense_from_transaction(self.user, statement_item("t1", second, amount=-300), self.uah)])
+        # Expenses stored before the rollup table existed.
+        Expense.objects.bulk_create(
+            expense_from_transaction(self.user, item, self.uah)
+            for item in (statement_item("t2", first, amount=-100), statement_item("t3", first + 60, amount=-200))
+        )
+        migration = import_module("expenses_monitoring.migrations.0022_fill_daily_rollups")
+        migration.fill_daily_rollups(apps, None)
+        self.assertEqual(
+            sorted(DailyExpenseRollup.objects.filter(user=self.user).values_list("date", "total", "count")),
+            [(date(2024, 3, 5), 300, 2), (date(2024, 3, 6), 300, 1)],
+        )
+
+
+class AmountMinorUnitsMigrationTests(TransactionTestCase):
+    serialized_rollback = True
+    before = [("expenses_monitoring", "0017_remove_expense_expense_type")]
+    after = [("expenses_monitoring", "0018_amount_minor_units")]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes())
+
+    def amounts(self, old_apps):
+        return [
+            list(old_apps.get_model("expenses_monitoring", model_name).objects.values_list("amount", flat=True))
+            for model_name in ("Expense", "Goal")
+        ]
+
+    def test_amounts_round_trip(self):
+        old_apps = self.migrate(self.before)
+        user = old_apps.get_model("expenses_monitoring", "CustomUser").objects.create(username="minor")
+        uah = old_apps.get_model("expenses_monitoring", "CashType").objects.get_or_create(
+            name="UAH", defaults={"description": ""}
+        )[0]
+        category = old_apps.get_model("expenses_monitoring", "Category").objects.first()
+        old_apps.get_model("expenses_monitoring", "Expense").objects.create(
+            user=user, amount=-123.45, cash_type=uah, timestamp=1_700_000_000, description="shop", category=category
+        )
+        old_apps.get_model("expenses_monitoring", "Goal").objects.create(
+            user=user, description="car", amount=1000.5, cash_type=uah, date=date(2030, 1, 1)
+        )
+
+        self.assertEqual(self.amounts(self.migrate(self.after)), [[-12345], [100050]])
+        self.assertEqual(self.amounts(self.migrate(self.before)), [[-123.45], [1000.5]])
+
+
+class MoneyTests(SimpleTestCase):
+    def test_to_minor_is_exact(self):
+        self.assertEqual(to_minor(Decimal("1234.56")), 123456)
+        self.assertEqual(to_minor("0.1"), 10)
+        # 0.29 * 100 is 28.999999999999996 as a float.
+        self.assertEqual(to_minor(0.29), 29)
+        self.assertEqual(to_minor(-12.3), -1230)
+
+    def test_to_minor_rounds_half_up(self):
+        self.assertEqual(to_minor("0.125"), 13)
+        self.assertEqual(to_minor("0.124"), 12)
+        self.assertEqual(to_minor("-0.125"), -13)
+
+    def test_to_minor_uses_currency_exponent(self):
+        self.assertEqual(to_minor("1234.5", "JPY"), 1235)
+        self.assertEqual(to_minor("1.2345", "KWD"), 1235)
+
+    def test_format(self):
+        self.assertEqual(Money(123450).format(), "1234.50")
+        self.assertEqual(str(Money(-5)), "-0.05 UAH")
+        self.assertEqual(str(Money(1234, "JPY")), "1234 JPY")
+        self.assertEqual(Money.from_major("0.1") + Money.from_major("0.2"), Money(30))
+        self.assertEqual(Money(30).major, Decimal("0.30"))
+        with self.assertRaises(ValueError):
+            Money(1) + Money(1, "USD")
+
+
+class GoalFormTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(username="goals")
+        cls.uah = CashType.objects.get_or_create(name="UAH", defaults={"description": ""})[0]
+
+    def test_amount_is_stored_in_kopecks(self):
+        form = GoalForm(
+            {"description": "car", "amount": "1000.50", "cash_type": self.uah.id, "date": date.today().isoformat()}
+        )
+        self.assertTrue(form.is_valid(), form.errors)
+        goal = form.save(commit=False)
+        goal.user = self.user
+        goal.save()
+        self.assertEqual(Goal.objects.get().amount, 100050)
+
+    def test_amount_is_rendered_in_hryvnias(self):
+        goal = Goal.objects.create(
+            user=self.user, description="car", amount=100050, cash_type=self.uah, date=date.today()
+        )
+        form = GoalForm(instance=goal)
+        self.assertEqual(form["amount"].value(), Decimal("1000.50"))
+        self.assertIn('value="1000.50"', str(form["amount"]))
+
+
+class AnalyticsCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(username="cache")
+        cls.uah = CashType.objects.get_or_create(name="UAH", defaults={"description": ""})[0]
+
+    def setUp(self):
+        cache.clear()
+
+    def test_ingest_bumps_data_version_on_commit(self):
+        key = user_cache_key(self.user.id, "totals", "month")
+        self.assertEqual(get_data_version(self.user.id), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            upsert_expenses([expense_from_transaction(self.user, statement_item("t1", 1_700_000_000), self.uah)])
+            self.assertEqual(get_data_version(self.user.id), 1)
+        self.assertEqual(get_data_version(self.user.id), 2)
+        self.assertTrue(has_recent_write(self.user.id))
+        self.assertNotEqual(user_cache_key(self.user.id, "totals", "month"), key)
+
+    def test_miss_is_computed_once(self):
+        compute = mock.Mock(return_value={"total": 1})
+        self.assertEqual(get_or_compute("key", compute), {"total": 1})
+        self.assertEqual(get_or_compute("key", compute), {"total": 1})
+        compute.assert_called_once()
+
+    def test_waits_for_the_computing_caller(self):
+        cache.add("key:lock", 1)
+        compute = mock.Mock(return_value="mine")
+        with mock.patch("expenses_monitoring.cache.time.sleep", side_effect=lambda delay: cache.set("key", "theirs")):
+            self.assertEqual(get_or_compute("key", compute), "theirs")
+        compute.assert_not_called()
+
+    @override_settings(ANALYTICS_CACHE_LOCK_TIMEOUT=0)
+    def test_computes_itself_when_lock_holder_is_gone(self):
+        cache.add("key:lock", 1, timeout=60)
+        self.assertEqual(get_or_compute("key", lambda: "mine"), "mine")
+        self.assertEqual(cache.get("key"), "mine")
+
+
+@override_settings(ANALYTICS_DATABASE="analytics", DATABASE_REPLICA_LAG=10)
+class RoutingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(username="routing")
+        cls.uah = CashType.objects.get_or_create(name="UAH", defaults={"description": ""})[0]
+
+    def setUp(self):
+        cache.clear()
+
+    def test_recently_written_user_reads_from_primary(self):
+        self.assertEqual(analytics_db(self.user.id), "analytics")
+        bump_data_version(self.user.id)
+        self.assertEqual(analytics_db(self.user.id), "default")
+        # Other users and reads across users keep using the replica.
+        self.assertEqual(analytics_db(self.user.id + 1), "analytics")
+        self.assertEqual(analytics_db(), "analytics")
+        with mock.patch("django.core.cache.backends.locmem.time") as clock:
+            clock.time.return_value = datetime.now().timestamp() + 11
+            self.assertEqual(analytics_db(self.user.id), "analytics")
+
+    def test_writes_and_migrations_stay_on_primary(self):
+        router = PrimaryReplicaRouter()
+        self.assertIsNone(router.db_for_read(Expense))
+        self.assertEqual(router.db_for_write(Expense), "default")
+        self.assertTrue(router.allow_migrate("default", "expenses_monitoring", "expense"))
+        self.assertFalse(router.allow_migrate("analytics", "expenses_monitoring", "expense"))
+
+    def test_admin_changelist_reads_from_primary_for_actions(self):
+        admin_user = CustomUser.objects.create(username="admin", is_staff=True, is_superuser=True)
+        expense = expense_from_transaction(self.user, statement_item("t1", 1_700_000_000), self.uah)
+        upsert_expenses([expense])
+        model_admin = ExpenseAdmin(Expense, site)
+        request = RequestFactory().get(reverse("admin:expenses_monitoring_expense_changelist"))
+        request.user = admin_user
+        with override_settings(ANALYTICS_DATABASE="default"):
+            changelist = model_admin.get_changelist_instance(request)
+        self.assertEqual(changelist.get_queryset(request).db, "analytics")
+        request.method = "POST"
+        self.assertEqual(changelist.get_queryset(request).db, "default")
+
+        # The delete action runs on the changelist's queryset; no "analytics" alias exists in the tests.
+        self.client.force_login(admin_user)
+        response = self.client.post(
+            reverse("admin:expenses_monitoring_expense_changelist"),
+            {"action": "delete_selected", "_selected_action": [Expense.objects.get().id], "post": "yes"},
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(Expense.objects.exists())
+
+
+class AnalyticsArrayTests(SimpleTestCase):
+    def test_group_sum(self):
+        keys = np.array([3, 1, 3, 2, 1, 3], dtype=np.int16)
+        values = np.array([10, 20, 30, 40, 50, 2**40], dtype=np.int64)
+        distinct, sums, counts = group_sum(keys, values)
+        self.assertEqual(distinct.tolist(), [1, 2, 3])
+        self.assertEqual(sums.tolist(), [70, 40, 40 + 2**40])
+        self.assertEqual(counts.tolist(), [2, 1, 3])
+        distinct, sums, counts = group_sum(keys[:0], values[:0])
+        self.assertEqual((len(distinct), len(sums), len(counts)), (0, 0, 0))
+
+    def test_rolling_sum(self):
+        self.assertEqual(rolling_sum(np.array([1, 2, 3, 4, 5]), 3).tolist(), [1, 3, 6, 9, 12])
+        self.assertEqual(rolling_sum(np.array([2**40, 2**40]), 7).tolist(), [2**40, 2**41])
+        self.assertEqual(rolling_sum(np.array([], dtype=np.int64), 3).tolist(), [])
+
+    def test_lttb_keeps_ends_and_peaks(self):
+        y = np.zeros(100)
+        y[37], y[71] = 50, -50
+        keep = lttb(y, 10)
+        self.assertEqual(len(keep), 10)
+        self.assertEqual((keep[0], keep[-1]), (0, 99))
+        self.assertTrue(np.all(np.diff(keep) > 0))
+        self.assertIn(37, keep)
+        self.assertIn(71, keep)
+        self.assertEqual(lttb(y[:5], 10).tolist(), [0, 1, 2, 3, 4])
+
+    def test_bucket_series(self):
+        days = np.array([(date(2024, 1, 31) - EPOCH).days, (date(2024, 2, 5) - EPOCH).days, 0])
+        buckets, totals = bucket_series(days, [100, 200, 999], date(2024, 1, 29), date(2024, 2, 12), "week")
+        # Weeks start on Monday; the value outside the range is left out.
+        self.assertEqual(buckets.astype(str).tolist(), ["2024-01-29", "2024-02-05", "2024-02-12"])
+        self.assertEqual(totals.tolist(), [100, 200, 0])
+        buckets, totals = bucket_series(days, [100, 200, 999], date(2024, 1, 29), date(2024, 2, 12), "month")
+        self.assertEqual(buckets.astype(str).tolist(), ["2024-01-01", "2024-02-01"])
+        self.assertEqual(totals.tolist(), [100, 200])
+        with self.assertRaises(ValueError):
+            bucket_series(days, [1, 2, 3], date(2024, 1, 1), date(2024, 1, 2), "hour")
+
+    @override_settings(TIME_ZONE="Europe/Kyiv")
+    def test_local_days_match_local_dates(self):
+        tz = get_default_timezone()
+        # Hourly timestamps across the spring and autumn DST changes, plus the seconds around local midnight.
+        start = int(datetime(2024, 3, 30, tzinfo=tz).timestamp())
+        timestamps = list(range(start, start + 3 * 86400, 1800))
+        autumn = int(datetime(2024, 10, 27, tzinfo=tz).timestamp())
+        timestamps += list(range(autumn - 86400, autumn + 2 * 86400, 1800))
+        midnight = int(datetime(2024, 1, 1, tzinfo=tz).timestamp())
+        timestamps += [midnight - 1, midnight]
+        days = local_days(np.array(timestamps, dtype=np.int64))
+        expected = [(get_local_date(timestamp) - EPOCH).days for timestamp in timestamps]
+        self.assertEqual(days.tolist(), expected)
+        self.assertEqual(days[-1] - days[-2], 1)
+
+
+@override_settings(ANALYTICS_DATABASE="default", TIME_ZONE="Europe/Kyiv")
+class ExpenseColumnsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(username="columns")
+        cls.uah = CashType.objects.get_or_create(name="UAH", defaults={"description": ""})[0]
+
+    def setUp(self):
+        tz = get_default_timezone()
+        # Expenses on both sides of local midnights, which are 22:00 or 21:00 UTC in Kyiv.
+        self.midnight = int(datetime(2024, 3, 5, tzinfo=tz).timestamp())
+        items = []
+        for i in range(40):
+            time = self.midnight + (i - 20) * 3 * 3600 + (i % 3) - 1
+            items.append(
+                statement_item(
+                    f"t{i}", time, amount=-(i + 1) * 100, description=f"shop{i % 4}", mcc=(5411, 5812)[i % 2]
+                )
+            )
+        upsert_expenses([expense_from_transaction(self.user, item, self.uah) for item in items])
+
+    def orm_totals(self, from_time, to_time, field):
+        rows = (
+            Expense.objects.filter(user=self.user, timestamp__gte=from_time, timestamp__lt=to_time)
+            .values(field)
+            .annotate(total=Sum("amount"), count=Count("id"))
+            .order_by(field)
+        )
+        return [(row[field], row["total"], row["count"]) for row in rows]
+
+    def test_columns_match_orm_aggregation(self):
+        from_time, to_time = self.midnight - 86400, self.midnight + 86400
+        columns = load_expense_columns(self.user.id, from_time, to_time)
+        expenses = Expense.objects.filter(user=self.user, timestamp__gte=from_time, timestamp__lt=to_time)
+        self.assertEqual(columns.timestamp.tolist(), sorted(expenses.values_list("timestamp", flat=True)))
+        categories, sums, counts = group_sum(columns.category, columns.amount)
+        self.assertEqual(
+            list(zip(categories.tolist(), sums.tolist(), counts.tolist())),
+            self.orm_totals(from_time, to_time, "category_id"),
+        )
+        merchants, sums, counts = group_sum(columns.merchant, columns.amount)
+        self.assertEqual(
+            sorted(zip([columns.merchants[m] for m in merchants], sums.tolist(), counts.tolist())),
+            self.orm_totals(from_time, to_time, "description"),
+        )
+
+    def test_daily_series_match_orm_per_local_day(self):
+        from_date, to_date = date(2024, 3, 2), date(2024, 3, 9)
+        buckets, totals, size = get_expense_timeseries(self.user, from_date, to_date, "day")
+        self.assertEqual(size, 8)
+        expected = []
+        for offset in range(8):
+            start, end = get_day_bounds(from_date + timedelta(days=offset))
+            expected.append(sum(total for _, total, _ in self.orm_totals(start, end, "user_id")))
+        self.assertEqual(totals.tolist(), expected)
+        columns = load_expense_columns(self.user.id)
+        days, sums, _ = group_sum(local_days(columns.timestamp), columns.amount)
+        self.assertEqual(bucket_series(days, sums, from_date, to_date, "day")[1].tolist(), expected)
+        days, totals = daily_totals(columns, from_date, to_date)
+        self.assertEqual(days[[0, -1]].astype(str).tolist(), ["2024-03-02", "2024-03-09"])
+        self.assertEqual(totals.tolist(), expected)
+
+    def test_compare_periods_match_orm_per_category(self):
+        current = load_expense_columns(self.user.id, self.midnight, self.midnight + 86400)
+        previous = load_expense_columns(self.user.id, self.midnight - 86400, self.midnight)
+        expected = {}
+        for index, (from_time, to_time) in enumerate(
+            ((self.midnight, self.midnight + 86400), (self.midnight - 86400, self.midnight))
+        ):
+            for category_id, total, _ in self.orm_totals(from_time, to_time, "category_id"):
+                expected.setdefault(category_id, [0, 0])[index] = total
+        comparison = compare_periods(current, previous)
+        self.assertEqual(
+            {category_id: [total, previous_total] for category_id, total, previous_total in comparison}, expected
+        )
+        self.assertEqual([row[1] for row in comparison], sorted((row[1] for row in comparison), reverse=True))
+
+
+@override_settings(ANALYTICS_DATABASE="default")
+class FilterExpensesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(username="filter")
+        cls.uah = CashType.objects.get_or_create(name="UAH", defaults={"description": ""})[0]
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def test_year_over_year_and_trend(self):
+        today = date.today()
+        items = [
+            statement_item("t1", get_day_bounds(today)[0] + 60, amount=-300, mcc=5411),
+            statement_item("t2", get_day_bounds(today.replace(day=1, month=1))[0] + 60, amount=-100, mcc=5411),
+            statement_item("t3", get_day_bounds(date(today.year - 1, 6, 1))[0] + 60, amount=-250, mcc=5411),
+            statement_item("t4", get_day_bounds(date(today.year - 1, 6, 1))[0] + 120, amount=-50, mcc=5812),
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            upsert_expenses([expense_from_transaction(self.user, item, self.uah) for item in items])
+        grocery, restaurant = (
+            Expense.objects.get(external_id=external_id).category.name for external_id in ("t1", "t4")
+        )
+
+        data = self.client.get(reverse("filter_expenses"), {"period": "year"}).json()
+        self.assertEqual(
+            data["year_over_year"],
+            [
+                {"category": grocery, "total": 400, "total_last_year": 250},
+                {"category": restaurant, "total": 0, "total_last_year": 50},
+            ],
+        )
+        trend = data["trend"]
+        self.assertEqual(trend["labels"][0], f"{today.year}-01-01")
+        self.assertEqual(trend["labels"][-1], today.isoformat())
+        self.assertEqual(sum(trend["totals"]), data["year_over_year"][0]["total"])
+        self.assertEqual(trend["rolling_totals"][-1], sum(trend["totals"][-trend["window"] :]))
+
+
+@override_settings(ANALYTICS_DATABASE="default")
+class TimeseriesApiTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(username="timeseries")
+        cls.uah = CashType.objects.get_or_create(name="UAH", defaults={"description": ""})[0]
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+        self.add(statement_item("t1", self.noon(date(2024, 1, 30)), amount=-100, mcc=5411))
+        self.add(statement_item("t2", self.noon(date(2024, 2, 1)), amount=-250, mcc=5812))
+        self.add(statement_item("t3", self.noon(date(2024, 2, 8)), amount=-400, mcc=5411))
+
+    def noon(self, day):
+        return int(datetime(day.year, day.month, day.day, 12, tzinfo=get_default_timezone()).timestamp())
+
+    def add(self, *items):
+        with self.captureOnCommitCallbacks(execute=True):
+            upsert_expenses([expense_from_transaction(self.user, item, self.uah) for item in items])
+
+    def get(self, **params):
+        return self.client.get(reverse("expense_timeseries"), params)
+
+    def test_weekly_totals(self):
+        data = self.get(**{"from": "2024-01-29", "to": "2024-02-18", "granularity": "week"}).json()
+        self.assertEqual(data["labels"], ["2024-01-29", "2024-02-05", "2024-02-12"])
+        self.assertEqual(data["values"], [350, 400, 0])
+        self.assertFalse(data["downsampled"])
+
+    def test_category_filter(self):
+        category_id = MerchantCategoryCode.objects.get(code=5411).category_id
+        data = self.get(**{"from": "2024-01-29", "to": "2024-02-11", "granularity": "week", "category": category_id})
+        self.assertEqual(data.json()["values"], [100, 400])
+
+    def test_long_series_are_downsampled(self):
+        data = self.get(**{"from": "2023-02-10", "to": "2024-02-09", "max_points": 50}).json()
+        self.assertTrue(data["downsampled"])
+        self.assertEqual(len(data["labels"]), 50)
+        self.assertEqual((data["labels"][0], data["labels"][-1]), ("2023-02-10", "2024-02-09"))
+        self.assertIn(400, data["values"])
+
+    def test_new_expenses_are_not_served_from_cache(self):
+        params = {"from": "2024-02-01", "to": "2024-02-01"}
+        self.assertEqual(self.get(**params).json()["values"], [250])
+        self.add(statement_item("t4", self.noon(date(2024, 2, 1)) + 60, amount=-50))
+        self.assertEqual(self.get(**params).json()["values"], [300])
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.get(**{"from": "2024-13-01"}).status_code, 400)
+        self.assertEqual(self.get(granularity="hour").status_code, 400)
+        self.assertEqual(self.get(**{"from": "2024-02-02", "to": "2024-02-01"}).status_code, 400)
+
+
+@override_settings(ANALYTICS_DATABASE="default")
+class LedgerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(username="ledger")
+        cls.uah = CashType.objects.get_or_create(name="UAH", defaults={"description": ""})[0]
+        # Several expenses share a timestamp, so pages must break ties by id.
+        times = [
+            1_700_000_000,
+            1_700_000_100,
+            1_700_000_100,
+            1_700_000_100,
+            1_700_000_100,
+            1_700_000_200,
+            1_700_000_300,
+        ]
+        upsert_expenses(
+            [
+                expense_from_transaction(cls.user, statement_item(f"t{i}", time, amount=-(i + 1) * 100), cls.uah)
+                for i, time in enumerate(times)
+            ]
+        )
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def pages(self, limit, **params):
+        ids = []
+        cursor = None
+        while True:
+            response = self.client.get(reverse("ledger_api"), {**params, "limit": limit, "cursor": cursor or ""})
+            data = response.json()
+            ids.append([row["id"] for row in data["results"]])
+            cursor = data["next_cursor"]
+            if cursor is None:
+                return ids
+
+    def test_pages_cover_tied_timestamps_once(self):
+        expected = list(
+            Expense.objects.filter(user=self.user).order_by("-timestamp", "-id").values_list("id", flat=True)
+        )
+        for limit in (1, 2, 3, 7):
+            pages = self.pages(limit)
+            self.assertTrue(all(len(page) <= limit for page in pages))
+            self.assertEqual([expense_id for page in pages for expense_id in page], expected)
+
+    def test_new_expenses_do_not_shift_later_pages(self):
+        expenses = filter_ledger(self.user)
+        first, cursor = get_ledger_page(expenses, limit=3)
+        upsert_expenses([expense_from_transaction(self.user, statement_item("new", 1_700_000_400), self.uah)])
+        second, _ = get_ledger_page(filter_ledger(self.user), cursor, limit=3)
+        expected = list(
+            Expense.objects.filter(user=self.user, timestamp__lt=1_700_000_400).order_by("-timestamp", "-id")
+        )
+        self.assertEqual(first + second, expected[:6])
+
+    def test_filters_and_invalid_cursor(self):
+        pages = self.pages(2, min_amount="2", max_amount="5.00")
+        amounts = Expense.objects.filter(id__in=[expense_id for page in pages for expense_id in page])
+        self.assertEqual(sorted(amounts.values_list("amount", flat=True)), [200, 300, 400, 500])
+        response = self.client.get(reverse("ledger_api"), {"cursor": "not-a-cursor"})
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(ANALYTICS_DATABASE="default")
+@override_settings(ANALYTICS_DATABASE="default", TIME_ZONE="Europe/Kyiv")
+class ExportViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(username="export")
+        cls.uah = CashType.objects.get_or_create(name="UAH", defaults={"description": ""})[0]
+        other = CustomUser.objects.create(username="export-other")
+        tz = get_default_timezone()
+        times = [
+            datetime(2024, 3, 4, 23, 30, tzinfo=tz),
+            # 22:30 UTC on March 4th.
+            datetime(2024, 3, 5, 0, 30, tzinfo=tz),
+            datetime(2024, 3, 6, 12, 0, tzinfo=tz),
+            datetime(2024, 3, 7, 0, 0, tzinfo=tz),
+        ]
+        items = [
+            statement_item(f"t{i}", int(time.timestamp()), amount=-12345 * (i + 1), description=f"shop, {i}")
+            for i, time in enumerate(times)
+        ]
+        upsert_expenses(
+            [expense_from_transaction(cls.user, item, cls.uah) for item in items]
+            + [expense_from_transaction(other, statement_item("o1", int(times[1].timestamp())), cls.uah)]
+        )
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def export(self, **params):
+        return self.client.get(reverse("export_expenses"), {"from": "2024-03-05", "to": "2024-03-06", **params})
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.export(format="xml").status_code, 400)
+        self.assertEqual(self.export(**{"from": "2024-13-01"}).status_code, 400)
+        self.assertEqual(self.export(to="yesterday").status_code, 400)
+
+    def test_csv_of_the_range(self):
+        response = self.export()
+        self.assertEqual(response["Content-Type"], "text/csv; charset=utf-8")
+        self.assertEqual(response["Content-Disposition"], 'attachment; filename="expenses-2024-03-05-2024-03-06.csv"')
+        rows = list(csv.reader(io.StringIO(b"".join(response.streaming_content).decode())))
+        self.assertEqual(rows[0], EXPORT_FIELDS)
+        self.assertEqual(
+            [(row[3], row[2], row[6], row[7]) for row in rows[1:]],
+            [("shop, 1", "2024-03-05 00:30:00", "246.90", "UAH"), ("shop, 2", "2024-03-06 12:00:00", "370.35", "UAH")],
+        )
+
+    def test_ndjson(self):
+        response = self.export(format="ndjson")
+        self.assertEqual(
+            response["Content-Disposition"], 'attachment; filename="expenses-2024-03-05-2024-03-06.ndjson"'
+        )
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        rows = [json.loads(line) for line in lines]
+        self.assertEqual([row["description"] for row in rows], ["shop, 1", "shop, 2"])
+        self.assertEqual(set(rows[0]), set(EXPORT_FIELDS))
+        self.assertEqual(rows[0]["date"], "2024-03-05 00:30:00")
+        self.assertEqual(rows[0]["amount"], "246.90")
+
+    def test_gzip(self):
+        plain = b"".join(self.export().streaming_content)
+        response = self.export(gzip="1")
+        self.assertEqual(response["Content-Type"], "application/gzip")
+        self.assertEqual(
+            response["Content-Disposition"], 'attachment; filename="expenses-2024-03-05-2024-03-06.csv.gz"'
+        )
+        self.assertEqual(gzip.decompress(b"".join(response.streaming_content)), plain)
+
+    def test_whole_history_of_the_user_only(self):
+        response = self.client.get(reverse("export_expenses"), {"format": "ndjson"})
+        self.assertEqual(
+            response["Content-Disposition"], f'attachment; filename="expenses-start-{date.today()}.ndjson"'
+        )
+        rows = [json.loads(line) for line in b"".join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([row["description"] for row in rows], ["shop, 0", "shop, 1", "shop, 2", "shop, 3"])
+
+
+class ReportStoreTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(username="reports")
+        cls.uah = CashType.objects.get_or_create(name="UAH", defaults={"description": ""})[0]
+
+    def setUp(self):
+        cache.clear()
+        directory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(REPORT_ROOT=directory.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.today = date.today()
+        self.add(statement_item("t1", get_day_bounds(self.today)[0] + 60))
+
+    def add(self, *items):
+        with self.captureOnCommitCallbacks(execute=True):
+            upsert_expenses([expense_from_transaction(self.user, item, self.uah) for item in items])
+
+    def test_name_follows_the_rollups(self):
+        name = get_report_name(self.user.id, "month", self.today)
+        cache.clear()
+        self.assertEqual(get_report_name(self.user.id, "month", self.today), name)
+        self.add(statement_item("t2", get_day_bounds(self.today)[0] + 120))
+        self.assertNotEqual(get_report_name(self.user.id, "month", self.today), name)
+
+    def test_name_follows_last_years_rollups(self):
+        name = get_report_name(self.user.id, "month", self.today)
+        self.add(statement_item("t2", get_day_bounds(get_day_last_year(self.today))[0] + 60))
+        self.assertNotEqual(get_report_name(self.user.id, "month", self.today), name)
+
+    def test_download_is_revalidated_after_a_cache_flush(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse("generate_pdf_report"), {"period": "month"})
+        self.assertEqual(response.status_code, 200)
+        etag = response["ETag"]
+        cache.clear()
+        response = self.client.get(reverse("generate_pdf_report"), {"period": "month"}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.add(statement_item("t2", get_day_bounds(self.today)[0] + 120))
+        response = self.client.get(reverse("generate_pdf_report"), {"period": "month"}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+
+@override_settings(ANALYTICS_DATABASE="default", TIME_ZONE="Europe/Kyiv")
+class MonthlyReportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.uah = CashType.objects.get_or_create(name="UAH", defaults={"description": ""})[0]
+        cls.users = [CustomUser.objects.create(username=f"monthly{i}") for i in range(3)]
+
+    def setUp(self):
+        self.month = date(2024, 2, 1)
+        first, _ = get_day_bounds(self.month)
+        _, last = get_day_bounds(date(2024, 2, 29))
+        alice, bob, carol = self.users
+        items = [
+            statement_item(f"a{i}", first + i * 3600, amount=-(i + 1) * 100, description=f"shop{i}") for i in range(7)
+        ]
+        # Expenses just outside the month, on both sides of its local boundaries.
+        items += [statement_item("before", first - 1, amount=-10_000), statement_item("after", last, amount=-10_000)]
+        upsert_expenses([expense_from_transaction(alice, item, self.uah) for item in items])
+        upsert_expenses([expense_from_transaction(bob, statement_item("b1", last - 1, amount=-999), self.uah)])
+        upsert_expenses([expense_from_transaction(carol, statement_item("c1", last + 60, amount=-5), self.uah)])
+
+    def test_plan_matches_expenses_of_the_month(self):
+        jobs = {job[0]: job for job in plan_monthly_reports(self.month)}
+        alice, bob, carol = self.users
+        self.assertEqual(set(jobs), {alice.id, bob.id})
+        user_id, username, month, summary, merchants = jobs[alice.id]
+        self.assertEqual((username, month), ("monthly0", "2024-02-01"))
+        self.assertEqual(sum(summary.values()), sum((i + 1) * 100 for i in range(7)))
+        self.assertEqual(len(merchants), REPORT_TOP_MERCHANTS)
+        self.assertEqual(merchants[0], ("shop6", 700, 1))
+        self.assertEqual(
+            [total for _, total, _ in merchants], sorted((total for _, total, _ in merchants), reverse=True)
+        )
+        self.assertEqual(jobs[bob.id][4], [("shop", 999, 1)])
+        self.assertEqual([job[0] for job in plan_monthly_reports(self.month, [bob.id, carol.id])], [bob.id])
+
+    def test_render_into_monthly_store(self):
+        job = next(job for job in plan_monthly_reports(self.month) if job[0] == self.users[1].id)
+        with TemporaryDirectory() as root, override_settings(MONTHLY_REPORT_ROOT=root):
+            size = render_monthly_report(job)
+            path = os.path.join(root, get_monthly_report_name(self.users[1].id, self.month))
+            with open(path, "rb") as f:
+                pdf = f.read()
+            self.assertEqual(len(pdf), size)
+            self.assertTrue(pdf.startswith(b"%PDF"))
+            # Invariant PDFs: rendering the same data again gives the same bytes.
+            render_monthly_report(job)
+            with open(path, "rb") as f:
+                self.assertEqual(f.read(), pdf)
+
+    @override_settings(MONTHLY_REPORT_CHUNK_SIZE=1)
+    def test_generate_queues_chunks(self):
+        with mock.patch("expenses_monitoring.tasks.render_monthly_reports.apply_async") as apply_async:
+            generate_monthly_reports("2024-02-01")
+        self.assertEqual(apply_async.call_count, 2)
+        self.assertEqual(
+            sorted(call.kwargs["args"][0][0][0] for call in apply_async.call_args_list),
+            sorted(self.users[i].id for i in (0, 1)),
+        )
+
+
+@skipUnless(connection.vendor == "sqlite", "SQLite pragmas")
+class SqlitePragmaTests(SimpleTestCase):
+    def connect(self, name, uri=False):
+        wrapper = DatabaseWrapper({**connection.settings_dict, "NAME": name, "OPTIONS": {"uri": uri}}, alias="pragmas")
+        self.addCleanup(wrapper.close)
+        wrapper.ensure_connection()
+        return wrapper
+
+    def pragma(self, wrapper, name):
+        with wrapper.cursor() as cursor:
+            cursor.execute(f"PRAGMA {name}")
+            return cursor.fetchone()[0]
+
+    def test_read_only_connection_gets_read_pragmas(self):
+        directory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "db.sqlite3")
+        with sqlite3.connect(path) as db:
+            db.execute("CREATE TABLE t (id INTEGER)")
+        primary = self.connect(path)
+        self.assertEqual(self.pragma(primary, "journal_mode"), "wal")
+        self.assertEqual(self.pragma(primary, "query_only"), 0)
+
+        reader = self.connect(f"file:{path}?mode=ro", uri=True)
+        self.assertEqual(self.pragma(reader, "query_only"), 1)
+        self.assertEqual(self.pragma(reader, "cache_size"), -64000)
+        # The write-side settings are left alone: synchronous keeps SQLite's default of FULL.
+        self.assertEqual(self.pragma(primary, "synchronous"), 1)
+        self.assertEqual(self.pragma(reader, "synchronous"), 2)
+
+
+class FakeRedis:
+    """The list and hash commands the ingest buffer uses, in memory."""
+
+    def __init__(self):
+        self.lists = {}
+        self.hashes = {}
+
+    def rpush(self, key, value):
+        self.lists.setdefault(key, deque()).append(value.encode())
+
+    def llen(self, key):
+        return len(self.lists.get(key, ()))
+
+    def lrange(self, key, start, end):
+        values = list(self.lists.get(key, ()))
+        return values[start : None if end == -1 else end + 1]
+
+    def lmove(self, source, destination, source_side, destination_side):
+        if not self.lists.get(source):
+            return None
+        value = self.lists[source].popleft()
+        self.lists.setdefault(destination, deque()).append(value)
+        return value
+
+    def ltrim(self, key, start, end):
+        self.lists[key] = deque(self.lrange(key, start, end))
+
+    def hincrby(self, key, field, amount):
+        values = self.hashes.setdefault(key, {})
+        values[field] = values.get(field, 0) + amount
+        return values[field]
+
+    def hdel(self, key, *fields):
+        for field in fields:
+            self.hashes.get(key, {}).pop(field, None)
+
+
+@override_settings(INGEST_MAX_ATTEMPTS=3, INGEST_MAX_PENDING=100)
+class IngestBufferTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(username="ingest")
+        CashType.objects.get_or_create(name="UAH", defaults={"description": ""})
+        cls.account = Account.objects.create(user=cls.user, account_id="a")
+
+    def setUp(self):
+        cache.clear()
+        self.buffer = FakeRedis()
+        for patcher in (
+            mock.patch("expenses_monitoring.ingest.get_buffer", return_value=self.buffer),
+            mock.patch("expenses_monitoring.ingest.current_app"),
+            mock.patch("exp_d.settings.INGEST_WRITER", True),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.app = ingest.current_app
+
+    def store(self, *items):
+        store_account_transactions(self.user, {"a": {"failed": False, "transactions": list(items)}})
+
+    def drain(self):
+        """Run flushes until one succeeds, like the retries the failed ones schedule; return the failures."""
+        for failures in range(10):
+            try:
+                drain_ingest_buffer(max_expenses=100)
+                return failures
+            except Exception:
+                pass
+        self.fail("The buffer was not drained")
+
+    def test_flush_writes_buffered_batches(self):
+        self.store(statement_item("t1", 1000), statement_item("t2", 1100))
+        self.store(statement_item("t3", 1200))
+        self.assertFalse(Expense.objects.exists())
+        self.assertEqual(self.app.send_task.call_count, 1)
+        self.assertEqual(drain_ingest_buffer(max_expenses=2), (2, 3))
+        self.assertEqual(Expense.objects.filter(user=self.user).count(), 3)
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.last_synced_id, "t3")
+        self.assertEqual(self.buffer.llen(ingest.PENDING_KEY) + self.buffer.llen(ingest.PROCESSING_KEY), 0)
+
+    def test_batches_of_a_crashed_flush_are_claimed_again(self):
+        self.store(statement_item("t1", 1000))
+        self.store(statement_item("t2", 1100))
+        # A writer claims the batches and dies before committing them.
+        self.assertEqual(len(ingest.claim_batches(100)), 2)
+        self.assertFalse(Expense.objects.exists())
+        self.assertEqual(drain_ingest_buffer(max_expenses=100), (2, 2))
+        self.assertEqual(Expense.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(self.buffer.llen(ingest.PROCESSING_KEY), 0)
+        self.assertFalse(self.buffer.hashes[ingest.ATTEMPTS_KEY])
+
+    def test_poison_batch_is_dead_lettered(self):
+        self.store(statement_item("t1", 1000))
+        ingest.push_batch([], [("expenses_monitoring.Account", {"id": self.account.id}, {"no_such_field": 1})])
+        self.store(statement_item("t2", 1100))
+        self.assertEqual(self.drain(), 3)
+        self.assertEqual(sorted(Expense.objects.values_list("external_id", flat=True)), ["t1", "t2"])
+        self.assertEqual(self.buffer.llen(ingest.DEAD_KEY), 1)
+        self.assertIn(b"no_such_field", self.buffer.lrange(ingest.DEAD_KEY, 0, -1)[0])
+        self.assertEqual(self.buffer.llen(ingest.PROCESSING_KEY), 0)
+        self.assertFalse(self.buffer.hashes[ingest.ATTEMPTS_KEY])
+
+    @override_settings(INGEST_MAX_PENDING=2, INGEST_PUSH_TIMEOUT=10)
+    def test_producer_waits_while_buffer_is_full(self):
+        self.store(statement_item("t1", 1000))
+        self.store(statement_item("t2", 1100))
+
+        def flush(delay):
+            drain_ingest_buffer(max_expenses=1)
+
+        with mock.patch("expenses_monitoring.ingest.time.sleep", side_effect=flush) as sleep:
+            self.store(statement_item("t3", 1200))
+        sleep.assert_called_once()
+        self.assertEqual(self.buffer.llen(ingest.PENDING_KEY), 1)
+        with override_settings(INGEST_PUSH_TIMEOUT=0), mock.patch("expenses_monitoring.ingest.time.sleep"):
+            self.store(statement_item("t4", 1300))
+            with self.assertRaises(ingest.IngestBufferFull):
+                self.store(statement_item("t5", 1400))
+
+
+@override_settings(ANALYTICS_DATABASE="default", TIME_ZONE="Europe/Kyiv")
+class ArchiveTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(username="archive")
+        cls.uah = CashType.objects.get_or_create(name="UAH", defaults={"description": ""})[0]
+
+    def setUp(self):
+        directory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(ARCHIVE_ROOT=directory.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        tz = get_default_timezone()
+        # Around a local new year, which is 22:00 UTC in Kyiv.
+        new_year = int(datetime(2024, 1, 1, tzinfo=tz).timestamp())
+        self.cutoff = new_year + 2 * 86400
+        self.items = [
+            statement_item(
+                f"t{i}", new_year + (i - 4) * 5 * 3600 + i % 2, amount=-(i + 1) * 100, description=f"кафе {i % 3}"
+            )
+            for i in range(9)
+        ]
+        self.items += [
+            statement_item("hold", new_year - 1, amount=-42, hold=True),
+            statement_item("no-mcc", new_year, mcc=None),
+            statement_item(None, new_year + 60, amount=-7),
+            statement_item("recent", self.cutoff + 3600, amount=-900),
+        ]
+        self.ingest()
+
+    def ingest(self):
+        upsert_expenses([expense_from_transaction(self.user, item, self.uah) for item in self.items])
+
+    def archived_rows(self, from_time=None, to_time=None):
+        rows = [
+            row for segment in read_archive(self.user.id, from_time, to_time) for row in segment.rows(*ARCHIVE_COLUMNS)
+        ]
+        return sorted(rows, key=lambda row: (row[1], row[0]))
+
+    def snapshot(self):
+        columns = load_expense_columns(self.user.id)
+        rollups = DailyExpenseRollup.objects.filter(user=self.user).values_list(
+            "date", "category_id", "cash_type_id", "total", "count"
+        )
+        return {
+            # Expenses sharing a timestamp may come in any order.
+            "columns": sorted(
+                zip(
+                    columns.timestamp.tolist(),
+                    columns.amount.tolist(),
+                    columns.category.tolist(),
+                    [columns.merchants[merchant] for merchant in columns.merchant],
+                )
+            ),
+            "export": b"".join(export_expenses(self.user, "csv")),
+            "rollups": sorted(rollups),
+            "summary": summarize_by_category(self.user, date(2023, 12, 1), date(2024, 1, 31)),
+        }
+
+    def test_round_trip(self):
+        old = Expense.objects.filter(user=self.user, timestamp__lt=self.cutoff).order_by("timestamp", "id")
+        expected = list(old.values_list(*ARCHIVE_FIELDS))
+        self.assertEqual(archive_user_expenses(self.user.id, self.cutoff), len(expected))
+        self.assertFalse(old.exists())
+        self.assertEqual(list(Expense.objects.values_list("external_id", flat=True)), ["recent"])
+        self.assertEqual(get_archived_years(self.user.id), [2023, 2024])
+        self.assertEqual(self.archived_rows(), expected)
+        new_year = int(datetime(2024, 1, 1, tzinfo=get_default_timezone()).timestamp())
+        self.assertEqual(
+            self.archived_rows(new_year, self.cutoff), [row for row in expected if new_year <= row[1] < self.cutoff]
+        )
+
+    def test_analytics_are_unchanged_by_archiving(self):
+        before = self.snapshot()
+        with mock.patch("expenses_monitoring.archive.ARCHIVE_SEGMENT_SIZE", 3):
+            self.assertEqual(archive_user_expenses(self.user.id, self.cutoff), len(self.items) - 1)
+            self.assertEqual(archive_user_expenses(self.user.id, self.cutoff), 0)
+        # Chunks of 3 expenses are split by year into segments.
+        self.assertEqual(len(read_archive(self.user.id)), 5)
+        self.assertEqual(self.snapshot(), before)
+        rebuild_user_rollups(self.user.id)
+        self.assertEqual(self.snapshot(), before)
+
+    def ledger(self, limit, **params):
+        self.client.force_login(self.user)
+        rows = []
+        cursor = None
+        while True:
+            response = self.client.get(reverse("ledger_api"), {**params, "limit": limit, "cursor": cursor or ""})
+            data = response.json()
+            rows.append(data["results"])
+            cursor = data["next_cursor"]
+            if cursor is None:
+                return rows
+
+    def test_ledger_pages_through_the_archive(self):
+        category = Category.objects.get(id=get_category_id(5411))
+        queries = [{}, {"min_amount": "1", "max_amount": "6"}, {"category": category.id, "to": "2024-01-01"}]
+        before = [self.ledger(4, **params) for params in queries]
+        self.assertEqual(sum(len(page) for page in before[0]), len(self.items))
+        with mock.patch("expenses_monitoring.archive.ARCHIVE_SEGMENT_SIZE", 3):
+            archive_user_expenses(self.user.id, self.cutoff)
+        self.assertEqual([self.ledger(4, **params) for params in queries], before)
+        # A page straddling the horizon mixes the hot and the archived expenses.
+        first = self.ledger(2)[0]
+        self.assertTrue(Expense.objects.filter(id=first[0]["id"]).exists())
+        self.assertFalse(Expense.objects.filter(id=first[1]["id"]).exists())
+
+    def test_drop_archived_only_looks_up_old_expenses(self):
+        archive_user_expenses(self.user.id, self.cutoff)
+        recent = expense_from_transaction(self.user, statement_item("new", self.cutoff + 7200), self.uah)
+        with mock.patch("expenses_monitoring.archive.get_segment_keys") as get_segment_keys:
+            self.assertEqual(drop_archived([recent]), [recent])
+        get_segment_keys.assert_not_called()
+        old = [expense_from_transaction(self.user, item, self.uah) for item in self.items[:3]]
+        self.assertEqual(drop_archived(old), [])
+        misses = get_segment_keys.cache_info().misses
+        self.assertEqual(drop_archived(old), [])
+        # The keys of every segment are read once.
+        self.assertEqual(get_segment_keys.cache_info().misses, misses)
+
+    def test_reingested_history_stays_archived(self):
+        before = self.snapshot()
+        archive_user_expenses(self.user.id, self.cutoff)
+        expenses = [expense_from_transaction(self.user, item, self.uah) for item in self.items]
+        # Only the expense without a transaction id cannot be recognised.
+        self.assertEqual(sorted(str(expense.external_id) for expense in drop_archived(expenses)), ["None", "recent"])
+        self.items = [item for item in self.items if item["id"] is not None]
+        self.ingest()
+        self.assertEqual(list(Expense.objects.values_list("external_id", flat=True)), ["recent"])
+        self.assertEqual(self.snapshot(), before)
@@ -8,8 +8,14 @@ from .views import (
     expense_analysis,
     register,
     filter_expenses,
+    expense_timeseries,
+    ledger,
+    ledger_api,
+    export_expenses_view,
     consultation_list,
     generate_pdf_report_view,
+    sync_status,
+    monobank_webhook,
 )
 from django.contrib.auth import views as auth_views
 
@@ -23,7 +29,13 @@ urlpatterns = [
     path("create-goal/", create_goal, name="create_goal"),
     path("expense-analysis/", expense_analysis, name="expense_analysis"),
     path("filter-expenses/", filter_expenses, name="filter_expenses"),
+    path("api/timeseries/", expense_timeseries, name="expense_timeseries"),
+    path("ledger/", ledger, name="ledger"),
+    path("api/transactions/", ledger_api, name="ledger_api"),
+    path("export/", export_expenses_view, name="export_expenses"),
     path("generate-pdf-report/", generate_pdf_report_view, name="generate_pdf_report"),
+    path("sync-status/", sync_status, name="sync_status"),
+    path("webhooks/monobank/<str:secret>/", monobank_webhook, name="monobank_webhook"),
     path("password_reset/", auth_views.PasswordResetView.as_view(), name="password_reset"),
     path(
         "password_reset/done/",
@@ -1,17 +1,30 @@
 # Description: This file contains the views for the expenses_monitoring app.
+import json
 import logging
 import os
-import threading
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 
+from django.conf import settings
 from django.contrib.auth import authenticate, login as auth_login
 from django.contrib.auth.decorators import login_required, user_passes_test
+from django.core.cache import cache
+from django.http import JsonResponse, HttpResponseRedirect, StreamingHttpResponse
+from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseNotAllowed, HttpResponseNotFound
 from django.http import FileResponse
-from django.http import JsonResponse, HttpResponseRedirect
 from django.shortcuts import render, redirect
 from django.urls import reverse
-from django.utils.timezone import make_aware
-
+from django.utils.cache import get_conditional_response
+from django.views.decorators.csrf import csrf_exempt
+
+from .analytics import (
+    compare_periods,
+    daily_totals,
+    get_expense_timeseries,
+    load_expense_columns,
+    rolling_sum,
+    top_merchants,
+)
+from .cache import get_or_compute, user_cache_key
 from .forms import (
     RegisterForm,
     LoginForm,
@@ -20,16 +33,36 @@ from .forms import (
     GoalForm,
 )
 from .lib import (
-    sync_user_accounts,
-    get_previous_month_time_bounds,
-    get_latest_bounds,
-    generate_pdf_report,
-    fetch_and_update_expenses,
+    get_backfill_bounds,
+    get_sync_status,
+    parse_webhook_event,
+)
+from .money import DEFAULT_CURRENCY, get_exponent, to_minor
+from .export import EXPORT_FORMATS, export_expenses
+from .ledger import LEDGER_MAX_PAGE_SIZE, LEDGER_PAGE_SIZE, filter_ledger, get_ledger_page, serialize_expense
+from .models import BankConnection, Category, Goal, Consultation, WebhookEvent
+from .reports import REPORT_PERIODS, build_report, count_report_expenses, get_report_name, get_report_path
+from .rollups import get_day_bounds, summarize_by_category
+from .tasks import (
+    BULK_QUEUE,
+    INTERACTIVE_QUEUE,
+    backfill_user_history,
+    render_report,
+    request_user_sync,
+    schedule_webhook_drain,
 )
-from .models import Goal, Consultation, Expense
 
 log = logging.getLogger(__name__)
 
+TOP_MERCHANTS = 5
+# Days summed into every point of the spending trend.
+TREND_WINDOW = 7
+TIMESERIES_GRANULARITIES = ("day", "week", "month")
+TIMESERIES_MAX_POINTS = 1000
+# Seconds a client waits before asking for a queued report again, and how long a queued report is not re-queued.
+REPORT_RETRY_AFTER = 2
+REPORT_QUEUE_TIMEOUT = 5 * 60
+
 
 def index(request):
     if request.user.is_authenticated:
@@ -37,7 +70,7 @@ def index(request):
             return HttpResponseRedirect(reverse("consultation_list"))
         else:
             # Fetch the user's financial goals and consultations
-            goals = Goal.objects.filter(user=request.user)
+            goals = Goal.objects.filter(user=request.user).select_related("cash_type")
             consultations = Consultation.objects.filter(user=request.user)
             # Pass these to the template
             return render(request, "index.html", {"goals": goals, "consultations": consultations})
@@ -105,36 +138,21 @@ def add_api_key(request):
             api_key_instance.user = request.user
             api_key_instance.save()
             log.info(f"API key {api_key_instance.api_key} added for user {request.user}")
-        api_key = request.user.api_key
-        if api_key:
-            sync_user_accounts(request.user)
-        (
-            start_of_previous_month,
-            end_of_previous_month,
-        ) = get_previous_month_time_bounds()
-        threadm = threading.Thread(
-            target=sync_user_accounts,
-            args=(request.user, start_of_previous_month, end_of_previous_month),
-        )
-        threadm.start()
+            start_history_backfill(request.user)
         return redirect("index")
     else:
         form = ApiKeyForm()
-        api_key = request.user.api_key
-        if api_key:
-            sync_user_accounts(request.user)
-        (
-            start_of_previous_month,
-            end_of_previous_month,
-        ) = get_previous_month_time_bounds()
-        threadm = threading.Thread(
-            target=sync_user_accounts,
-            args=(request.user, start_of_previous_month, end_of_previous_month),
-        )
-        threadm.start()
     return render(request, "add_api_key.html", {"form": form})
 
 
+def start_history_backfill(user):
+    """Queue a refresh of the user's accounts and a backfill of their statement history on the bulk queue."""
+    from_time, to_time = get_backfill_bounds()
+    backfill_user_history.apply_async(
+        args=(user.id, from_time, to_time), kwargs={"refresh_accounts": True}, queue=BULK_QUEUE
+    )
+
+
 @login_required
 def request_consultation(request):
     """
@@ -191,54 +209,202 @@ def filter_expenses(request):
         start_date_last_year = start_date - timedelta(weeks=52)
         end_date_last_year = start_date_last_year + timedelta(days=7)
 
-    start_timestamp = int(make_aware(start_date).timestamp())
-    end_timestamp = int(make_aware(now).timestamp())
-    start_timestamp_last_year = int(make_aware(start_date_last_year).timestamp())
-    end_timestamp_last_year = int(make_aware(end_date_last_year).timestamp())
+    # Summaries are read from the daily rollups, so periods are whole local days.
+    def build_payload():
+        from_time, _ = get_day_bounds(start_date.date())
+        _, to_time = get_day_bounds(now.date())
+        columns = load_expense_columns(user.id, from_time, to_time)
+        from_time, _ = get_day_bounds(start_date_last_year.date())
+        _, to_time = get_day_bounds(end_date_last_year.date())
+        columns_last_year = load_expense_columns(user.id, from_time, to_time)
+        days, totals = daily_totals(columns, start_date.date(), now.date())
+        category_names = dict(Category.objects.values_list("id", "name"))
+        # Totals are exact integers in minor units; `minor_units` tells the client how to scale them.
+        return {
+            "expense_summary": summarize_by_category(user, start_date.date(), now.date()),
+            "expense_summary_last_year": summarize_by_category(
+                user, start_date_last_year.date(), end_date_last_year.date()
+            ),
+            "currency": DEFAULT_CURRENCY,
+            "minor_units": get_exponent(DEFAULT_CURRENCY),
+            "top_merchants": [
+                {"merchant": merchant, "total": total, "count": count}
+                for merchant, total, count in top_merchants(columns, TOP_MERCHANTS)
+            ],
+            "year_over_year": [
+                {"category": category_names[category_id], "total": total, "total_last_year": total_last_year}
+                for category_id, total, total_last_year in compare_periods(columns, columns_last_year)
+            ],
+            # Daily totals and their sums over the last TREND_WINDOW days.
+            "trend": {
+                "labels": [str(day) for day in days],
+                "totals": totals.tolist(),
+                "rolling_totals": rolling_sum(totals, TREND_WINDOW).tolist(),
+                "window": TREND_WINDOW,
+            },
+            "pdf_url": f"/generate-pdf-report/?period={period}",
+        }
+
+    return JsonResponse(get_or_compute(user_cache_key(user.id, "filter-expenses", period, now.date()), build_payload))
+
+
+@login_required
+def expense_timeseries(request):
+    """
+    Spending over time for charts.
+
+    Query parameters: `from` and `to` (YYYY-MM-DD, inclusive; the last year by default),
+    `granularity` (day, week or month), `category` (a category id, may be repeated) and
+    `max_points`; longer series are downsampled so the response size stays bounded.
+    """
+    try:
+        to_date = date.fromisoformat(request.GET["to"]) if request.GET.get("to") else date.today()
+        from_date = (
+            date.fromisoformat(request.GET["from"]) if request.GET.get("from") else to_date - timedelta(days=365)
+        )
+        category_ids = sorted({int(category_id) for category_id in request.GET.getlist("category")})
+        max_points = int(request.GET.get("max_points", TIMESERIES_MAX_POINTS))
+    except ValueError:
+        return JsonResponse({"error": "Invalid parameters"}, status=400)
+    granularity = request.GET.get("granularity", "day")
+    if granularity not in TIMESERIES_GRANULARITIES:
+        return JsonResponse({"error": f"granularity must be one of {', '.join(TIMESERIES_GRANULARITIES)}"}, status=400)
+    if from_date > to_date:
+        return JsonResponse({"error": "from must not be after to"}, status=400)
+    max_points = max(3, min(max_points, TIMESERIES_MAX_POINTS))
+
+    def build_payload():
+        buckets, totals, bucket_count = get_expense_timeseries(
+            request.user, from_date, to_date, granularity, category_ids, max_points
+        )
+        return {
+            "from": from_date.isoformat(),
+            "to": to_date.isoformat(),
+            "granularity": granularity,
+            "currency": DEFAULT_CURRENCY,
+            "minor_units": get_exponent(DEFAULT_CURRENCY),
+            "labels": [str(bucket) for bucket in buckets],
+            "values": totals.tolist(),
+            "downsampled": len(buckets) < bucket_count,
+        }
 
-    expenses = Expense.objects.filter(user=user, timestamp__gte=start_timestamp, timestamp__lte=end_timestamp)
-    expenses_last_year = Expense.objects.filter(
-        user=user,
-        timestamp__gte=start_timestamp_last_year,
-        timestamp__lte=end_timestamp_last_year,
+    key = user_cache_key(
+        request.user.id, "timeseries", from_date, to_date, granularity, ",".join(map(str, category_ids)), max_points
     )
+    return JsonResponse(get_or_compute(key, build_payload))
 
-    expense_summary = {}
-    expense_summary_last_year = {}
 
-    for expense in expenses:
-        if expense.expense_type not in expense_summary:
-            expense_summary[expense.expense_type] = 0
-        expense_summary[expense.expense_type] += expense.amount
+@login_required
+def ledger(request):
+    """Page listing the user's individual transactions; rows are loaded from `ledger_api`."""
+    return render(request, "ledger.html", {"categories": Category.objects.order_by("name")})
 
-    for expense in expenses_last_year:
-        if expense.expense_type not in expense_summary_last_year:
-            expense_summary_last_year[expense.expense_type] = 0
-        expense_summary_last_year[expense.expense_type] += expense.amount
 
-    pdf_url = f"/generate-pdf-report/?period={period}"
+@login_required
+def ledger_api(request):
+    """
+    One page of the user's transactions, newest first.
 
-    return JsonResponse(
-        {
-            "expense_summary": expense_summary,
-            "expense_summary_last_year": expense_summary_last_year,
-            "pdf_url": pdf_url,
-        }
-    )
+    Query parameters: `cursor` (the `next_cursor` of the previous page), `limit`, `category`
+    (a category id, may be repeated), `min_amount` and `max_amount` (in major units, inclusive)
+    and `from` and `to` (YYYY-MM-DD, inclusive).
+    """
+    params = request.GET
+    try:
+        limit = max(1, min(int(params.get("limit", LEDGER_PAGE_SIZE)), LEDGER_MAX_PAGE_SIZE))
+        category_ids = [int(category_id) for category_id in params.getlist("category")]
+        min_amount = to_minor(params["min_amount"]) if params.get("min_amount") else None
+        max_amount = to_minor(params["max_amount"]) if params.get("max_amount") else None
+        from_time = get_day_bounds(date.fromisoformat(params["from"]))[0] if params.get("from") else None
+        to_time = get_day_bounds(date.fromisoformat(params["to"]))[1] if params.get("to") else None
+        expenses = filter_ledger(request.user, category_ids, min_amount, max_amount, from_time, to_time)
+        page, next_cursor = get_ledger_page(expenses, params.get("cursor"), limit)
+    except (ValueError, ArithmeticError):
+        return JsonResponse({"error": "Invalid parameters"}, status=400)
+    return JsonResponse({"results": [serialize_expense(expense) for expense in page], "next_cursor": next_cursor})
+
+
+@login_required
+def export_expenses_view(request):
+    """
+    Download the user's expenses.
+
+    Query parameters: `format` (csv or ndjson), `from` and `to` (YYYY-MM-DD, inclusive; all history by default)
+    and `gzip` (1 to compress the file).
+    """
+    export_format = request.GET.get("format", "csv")
+    if export_format not in EXPORT_FORMATS:
+        return JsonResponse({"error": f"format must be one of {', '.join(EXPORT_FORMATS)}"}, status=400)
+    try:
+        from_date = date.fromisoformat(request.GET["from"]) if request.GET.get("from") else None
+        to_date = date.fromisoformat(request.GET["to"]) if request.GET.get("to") else None
+    except ValueError:
+        return JsonResponse({"error": "Invalid parameters"}, status=400)
+    compress = request.GET.get("gzip") == "1"
+
+    from_time = get_day_bounds(from_date)[0] if from_date else None
+    to_time = get_day_bounds(to_date)[1] if to_date else None
+    chunks = export_expenses(request.user, export_format, from_time, to_time, compress)
+    filename = f"expenses-{from_date or 'start'}-{to_date or date.today()}.{export_format}"
+    if compress:
+        response = StreamingHttpResponse(chunks, content_type="application/gzip")
+        filename += ".gz"
+    elif export_format == "csv":
+        response = StreamingHttpResponse(chunks, content_type="text/csv; charset=utf-8")
+    else:
+        response = StreamingHttpResponse(chunks, content_type="application/x-ndjson; charset=utf-8")
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
 
 
 @login_required
 def expense_analysis(request):
-    start_of_current_month, current_time = get_latest_bounds()
-    user = request.user
-    thread = threading.Thread(
-        target=fetch_and_update_expenses,
-        args=(user, start_of_current_month, current_time),
-    )
-    thread.start()
+    request_user_sync(request.user.id)
     return render(request, "expense_analysis.html")
 
 
+@login_required
+def sync_status(request):
+    """Report the state of the user's bank sync so the dashboard can poll it instead of re-triggering it."""
+    return JsonResponse(get_sync_status(request.user))
+
+
+@csrf_exempt
+def monobank_webhook(request, secret):
+    """
+    Receive statement items pushed by MonoBank.
+    Events are only queued here and written in batches by `drain_webhook_queue`.
+    """
+    connection = BankConnection.objects.filter(webhook_secret=secret).first()
+    if connection is None:
+        return HttpResponseNotFound()
+    if request.method == "GET":
+        # MonoBank checks that the URL answers before registering it.
+        return HttpResponse()
+    if request.method != "POST":
+        return HttpResponseNotAllowed(["GET", "POST"])
+
+    try:
+        event = parse_webhook_event(json.loads(request.body))
+    except ValueError:
+        event = None
+    if event is None:
+        return HttpResponseBadRequest()
+
+    # Counts at most WEBHOOK_MAX_PENDING rows, so the check stays cheap however long the queue gets.
+    pending = WebhookEvent.objects.order_by().values("id")[: settings.WEBHOOK_MAX_PENDING].count()
+    if pending >= settings.WEBHOOK_MAX_PENDING:
+        log.warning("Webhook queue is full, asking MonoBank to retry later")
+        response = HttpResponse(status=503)
+        response["Retry-After"] = "60"
+        return response
+
+    account_id, statement_item = event
+    WebhookEvent.objects.create(connection=connection, account_id=account_id, statement_item=statement_item)
+    schedule_webhook_drain()
+    return HttpResponse()
+
+
 def is_staff(user):
     return user.is_staff
 
@@ -262,32 +428,62 @@ def consultation_list(request):
 
 @login_required
 def generate_pdf_report_view(request):
+    """
+    Download the user's PDF report of the current week, month or year.
+
+    Reports are served from the report store with an ETag naming the data they were rendered from.
+    A report that is not stored yet is rendered in the request if it is small; larger ones are
+    queued to a worker and the response is 202 until the report is ready.
+    """
     user = request.user
     period = request.GET.get("period")
+    if period not in REPORT_PERIODS:
+        return JsonResponse({"error": f"period must be one of {', '.join(REPORT_PERIODS)}"}, status=400)
+    today = date.today()
+
+    name = get_report_name(user.id, period, today)
+    not_modified = get_conditional_response(request, etag=_report_etag(name))
+    if not_modified is not None:
+        return not_modified
+
+    if not os.path.exists(get_report_path(name)):
+        if count_report_expenses(user, period, today) <= settings.REPORT_ASYNC_THRESHOLD:
+            name = build_report(user, period, today)
+        elif _queue_report(user, period, today, name):
+            response = JsonResponse({"status": "pending"}, status=202)
+            response["Retry-After"] = REPORT_RETRY_AFTER
+            return response
+        else:
+            name = build_report(user, period, today)
 
-    now = datetime.now()
-    if period == "week":
-        start_date = now - timedelta(days=now.weekday())
-    elif period == "month":
-        start_date = datetime(now.year, now.month, 1)
-    elif period == "year":
-        start_date = datetime(now.year, 1, 1)
-    else:
-        start_date = now - timedelta(days=7)
-
-    start_timestamp = int(start_date.timestamp())
-    end_timestamp = int(now.timestamp())
+    response = FileResponse(
+        open(get_report_path(name), "rb"),
+        as_attachment=True,
+        filename=f"{user.username}_expense_report_{period}.pdf",
+        content_type="application/pdf",
+    )
+    response["ETag"] = _report_etag(name)
+    # Browsers revalidate on every download and get a 304 while the user's data is unchanged.
+    response["Cache-Control"] = "private, no-cache"
+    return response
 
-    expenses = Expense.objects.filter(user=user, timestamp__gte=start_timestamp, timestamp__lte=end_timestamp)
 
-    expense_summary = {}
-    for expense in expenses:
-        if expense.expense_type not in expense_summary:
-            expense_summary[expense.expense_type] = 0
-        expense_summary[expense.expense_type] += expense.amount
+def _report_etag(name):
+    return f'"{name.removesuffix(".pdf").replace("/", "-")}"'
 
-    filename = generate_pdf_report(user, expenses, expense_summary, period)
-    response = FileResponse(open(filename, "rb"), content_type="application/pdf")
-    response["Content-Disposition"] = f'attachment; filename="{os.path.basename(filename)}"'
 
-    return response
+def _queue_report(user, period, today, name):
+    """
+    Queue the rendering of a report unless it is already queued.
+    Returns:
+        False if the task could not be queued.
+    """
+    if not cache.add(f"report-queued:{name}", True, timeout=REPORT_QUEUE_TIMEOUT):
+        return True
+    try:
+        render_report.apply_async(args=(user.id, period, today.isoformat()), queue=INTERACTIVE_QUEUE)
+    except Exception as e:
+        log.error(f"Failed to queue report {name}, rendering it in the request: {e}")
+        cache.delete(f"report-queued:{name}")
+        return False
+    return True